@@ -1,24 +1,33 @@
-import sys
-
-if sys.version_info[:2] >= (3, 8):
-    # TODO: Import directly (no need for conditional) when `python_requires = >= 3.8`
-    from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
-else:
-    from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
-
 try:
-    # Change here if project is renamed and does not equal the package name
-    dist_name = __name__
-    __version__ = version(dist_name)
-except PackageNotFoundError:  # pragma: no cover
+    # Written by setuptools_scm at build and install time (and not tracked in
+    # git); reading it is much cheaper than importlib.metadata, which every CLI
+    # call and worker process would pay for
+    from ._version import __version__
+except ImportError:
+    # A source checkout that was never built or installed has no _version.py
+    from importlib.metadata import PackageNotFoundError, version
+
     try:
-        from ._version import __version__
-    except ImportError:
+        # Change here if project is renamed and does not equal the package name
+        __version__ = version(__name__)
+    except PackageNotFoundError:
         __version__ = "unknown"
-finally:
-    del version, PackageNotFoundError
+    finally:
+        del version, PackageNotFoundError
+
+
+def __getattr__(name: str):
+    # The main classes are imported on first access, so that importing the package
+    # or one of its modules (as batch and segment workers do) stays cheap
+    if name == "PrepAudioVideo":
+        from .vid2captionsai import PrepAudioVideo
+
+        return PrepAudioVideo
+    if name == "AsyncPrepAudioVideo":
+        from .aio import AsyncPrepAudioVideo
+
+        return AsyncPrepAudioVideo
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Import main class for easy access
-from .vid2captionsai import PrepAudioVideo
 
-__all__ = ["PrepAudioVideo", "__version__"]
+__all__ = ["AsyncPrepAudioVideo", "PrepAudioVideo", "__version__"]
@@ -1,13 +1,54 @@
 #!/usr/bin/env python3
 
+import inspect
+import sys
+
 import fire
 
 from .vid2captionsai import PrepAudioVideo
 
+# The name of the console script, shown in the help
+PROG = "vid2captionsai"
+
+# fire's separator of chained commands, moved off "-", which means stdin or stdout
+SEPARATOR = "+"
+
+
+def commands_help() -> str:
+    """
+    Lists the commands with the first line of their docstrings.
+
+    fire's help for a class only shows the constructor flags, since the
+    methods need an instance, so the help without a command adds this list.
+
+    Returns:
+        str: The COMMANDS section of the help.
+    """
+    lines = ["", "COMMANDS", f"    {PROG} <flags> COMMAND <args>", ""]
+    for name, method in inspect.getmembers(PrepAudioVideo, inspect.isfunction):
+        if not name.startswith("_"):
+            summary = (inspect.getdoc(method) or "").partition("\n")[0]
+            lines.append(f"    {name}\n        {summary}")
+    return "\n".join(lines)
+
 
 def cli():
-    fire.core.Display = lambda lines, out: print(*lines, file=out)
-    fire.Fire(PrepAudioVideo)
+    args = sys.argv[1:]
+    command = any(arg.replace("-", "_") in vars(PrepAudioVideo) for arg in args)
+
+    def display(lines, out):
+        print(*lines, file=out)
+        if not command:
+            print(commands_help(), file=out)
+
+    fire.core.Display = display
+    # fire's own flags follow the last "--"
+    flags = ["--separator", SEPARATOR]
+    fire.Fire(
+        PrepAudioVideo,
+        command=args + (flags if "--" in args else ["--"] + flags),
+        name=PROG,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+import json
+import math
+from fractions import Fraction
+from pathlib import Path
+
+# Width of the downscaled copy the analysis keys. Area scaling averages caption
+# pixels into their neighbours, so even thin strokes keep a non-zero alpha.
+ANALYSIS_WIDTH = 320
+
+
+def analysis_size(width: int, height: int) -> tuple[int, int]:
+    """Returns the even-sized dimensions of the analysed copy of a video."""
+    return ANALYSIS_WIDTH, max(2, round(ANALYSIS_WIDTH * height / width / 2) * 2)
+
+
+def analysis_filter(
+    color: str, tolerance: float, width: int = ANALYSIS_WIDTH, height: int = -2
+) -> str:
+    """
+    Builds the filtergraph that reports the bounding box of every keyed frame.
+
+    ``bbox`` only attaches its metadata to frames with at least one pixel of
+    non-zero alpha, so frames without it are empty.
+
+    Args:
+        color (str): The key color in hexadecimal format.
+        tolerance (float): The colorkey similarity and blend.
+        width (int, optional): Width of the analysed copy. Defaults to ANALYSIS_WIDTH.
+        height (int, optional): Height of the analysed copy. Defaults to -2 (keep the
+            aspect ratio).
+
+    Returns:
+        str: The filtergraph, printing per-frame metadata to stdout.
+    """
+    from .vid2captionsai import colorkey_filter
+
+    return ",".join(
+        [
+            f"scale={width}:{height}:flags=area",
+            colorkey_filter(color, tolerance),
+            "format=yuva420p",
+            "alphaextract",
+            "bbox=min_val=1",
+            "metadata=mode=print:file=pipe\\\\:1",
+        ]
+    )
+
+
+def parse_active_frames(output: str) -> list[int]:
+    """
+    Parses the metadata printed by `analysis_filter`.
+
+    Only frames with metadata are printed, so the output does not tell how
+    many frames there are in total; take that from the probe.
+
+    Args:
+        output (str): The printed metadata.
+
+    Returns:
+        list[int]: The indices of the frames with at least one pixel that is not
+        the key color.
+    """
+    active, frame = [], None
+    for line in output.splitlines():
+        if line.startswith("frame:"):
+            frame = int(line.split()[0][len("frame:") :])
+        elif line.startswith("lavfi.bbox.x1=") and frame is not None:
+            active.append(frame)
+    return active
+
+
+def parse_bounding_box(output: str) -> list[int] | None:
+    """
+    Parses the union of the per-frame bounding boxes printed by `analysis_filter`.
+
+    Args:
+        output (str): The printed metadata.
+
+    Returns:
+        list[int] | None: ``[x1, y1, x2, y2]`` in analysed pixels, inclusive, or
+        None if no frame has any pixel that is not the key color.
+    """
+    box = None
+    for line in output.splitlines():
+        if not line.startswith("lavfi.bbox."):
+            continue
+        key, value = line[len("lavfi.bbox.") :].split("=", 1)
+        if key not in ("x1", "y1", "x2", "y2"):
+            continue
+        position = ["x1", "y1", "x2", "y2"].index(key)
+        box = box or [math.inf, math.inf, -math.inf, -math.inf]
+        pick = min if position < 2 else max
+        box[position] = pick(box[position], int(value))
+    return box
+
+
+def crop_box(
+    box: list[int],
+    analysed: tuple[int, int],
+    width: int,
+    height: int,
+    padding: int = 16,
+) -> list[int]:
+    """
+    Scales an analysed bounding box to full resolution and pads it.
+
+    The box is rounded outwards and aligned to even pixels so that chroma
+    subsampled encoders can use it.
+
+    Args:
+        box (list[int]): ``[x1, y1, x2, y2]`` in analysed pixels, inclusive.
+        analysed (tuple[int, int]): The width and height of the analysed copy.
+        width (int): The full width.
+        height (int): The full height.
+        padding (int, optional): Pixels added on every side. Defaults to 16.
+
+    Returns:
+        list[int]: ``[x, y, width, height]`` of the crop in full-resolution pixels.
+    """
+    crop = []
+    for start, end, full, part in (
+        (box[0], box[2], width, analysed[0]),
+        (box[1], box[3], height, analysed[1]),
+    ):
+        first = max(0, math.floor(start * full / part) - padding) // 2 * 2
+        last = min(full, math.ceil((end + 1) * full / part) + padding)
+        last = min(full // 2 * 2, last + last % 2)
+        crop += [first, last - first]
+    return [crop[0], crop[2], crop[1], crop[3]]
+
+
+def write_crop(path: Path, crop: list[int], width: int, height: int):
+    """
+    Writes the crop of a mask output as a JSON sidecar.
+
+    Besides the top-left offset it records the offset of the layer center from
+    the frame center, which is how most editors position a layer.
+    """
+    x, y, crop_width, crop_height = crop
+    path.write_text(
+        json.dumps(
+            {
+                "x": x,
+                "y": y,
+                "width": crop_width,
+                "height": crop_height,
+                "source_width": width,
+                "source_height": height,
+                "center_offset_x": x + crop_width / 2 - width / 2,
+                "center_offset_y": y + crop_height / 2 - height / 2,
+            },
+            indent=2,
+        )
+        + "\n"
+    )
+
+
+def frame_segments(
+    active: list[int],
+    frames: int,
+    fps: str,
+    min_gap: float = 1.0,
+    padding: float = 0.0,
+) -> list[list[int]]:
+    """
+    Groups active frames into segments of frames to encode.
+
+    Args:
+        active (list[int]): Sorted indices of active frames.
+        frames (int): Total number of frames.
+        fps (str): The exact frame rate.
+        min_gap (float, optional): Inactive stretches shorter than this many
+            seconds are kept inside a segment. Defaults to 1.0.
+        padding (float, optional): Seconds added before and after each segment. Defaults
+            to 0.0.
+
+    Returns:
+        list[list[int]]: ``[first_frame, end_frame]`` pairs, end exclusive.
+    """
+    rate = Fraction(fps)
+    gap, pad = int(min_gap * rate), int(padding * rate + Fraction(1, 2))
+    segments = []
+    for frame in active:
+        if segments and frame - segments[-1][1] <= gap + 2 * pad:
+            segments[-1][1] = frame + 1
+        else:
+            segments.append([frame, frame + 1])
+    return [[max(0, start - pad), min(end + pad, frames)] for start, end in segments]
+
+
+def timeline(segments: list[list[int]], frames: int) -> list[tuple[int, int, bool]]:
+    """
+    Splits the whole timeline into active and inactive stretches.
+
+    Args:
+        segments (list[list[int]]): Active ``[first_frame, end_frame]`` pairs.
+        frames (int): Total number of frames.
+
+    Returns:
+        list[tuple[int, int, bool]]: ``(first_frame, end_frame, active)`` triples
+        covering every frame.
+    """
+    parts, position = [], 0
+    for start, end in segments:
+        if start > position:
+            parts.append((position, start, False))
+        parts.append((start, end, True))
+        position = end
+    if position < frames:
+        parts.append((position, frames, False))
+    return parts
+
+
+def timecode(frame: int, fps: str) -> str:
+    """Formats a frame index as a non-drop-frame HH:MM:SS:FF timecode."""
+    base = round(Fraction(fps))
+    seconds, frames = divmod(frame, base)
+    hours, minutes = seconds // 3600, seconds // 60 % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds % 60:02d}:{frames:02d}"
+
+
+def write_edl(path: Path, segments: list[list[int]], fps: str, reel: str, title: str):
+    """
+    Writes the active segments as a CMX 3600 edit decision list.
+
+    Each event places the active stretch of the source at its original
+    timeline position.
+    """
+    lines = [f"TITLE: {title}", "FCM: NON-DROP FRAME", ""]
+    for number, (start, end) in enumerate(segments, 1):
+        source = f"{timecode(start, fps)} {timecode(end, fps)}"
+        lines.append(f"{number:03d}  {reel[:8]:<8} V     C        {source} {source}")
+        lines.append(f"* FROM CLIP NAME: {reel}")
+    path.write_text("\n".join(lines) + "\n")
+
+
+def write_fcpxml(
+    path: Path,
+    segments: list[list[int]],
+    frames: int,
+    fps: str,
+    media_path: Path,
+    width: int,
+    height: int,
+):
+    """
+    Writes the active segments as an FCPXML 1.9 project.
+
+    Active stretches are clips of the source at their original timeline
+    position, inactive stretches are gaps.
+    """
+    # Pulls in urllib, so it is only imported for the rare FCPXML export
+    from xml.sax.saxutils import quoteattr
+
+    rate = Fraction(fps)
+    frame_duration = f"{rate.denominator}/{rate.numerator}s"
+
+    def time(frame: int) -> str:
+        value = Fraction(frame) / rate
+        if value.denominator == 1:
+            return f"{value.numerator}s"
+        return f"{value.numerator}/{value.denominator}s"
+
+    spine = []
+    for start, end, active in timeline(segments, frames):
+        if active:
+            spine.append(
+                f'<asset-clip ref="r2" name={quoteattr(media_path.stem)}'
+                f' offset="{time(start)}" start="{time(start)}"'
+                f' duration="{time(end - start)}"/>'
+            )
+        else:
+            spine.append(
+                f'<gap name="Gap" offset="{time(start)}"'
+                f' duration="{time(end - start)}"/>'
+            )
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        "<!DOCTYPE fcpxml>\n"
+        '<fcpxml version="1.9">\n'
+        "  <resources>\n"
+        f'    <format id="r1" frameDuration="{frame_duration}"'
+        f' width="{width}" height="{height}"/>\n'
+        f'    <asset id="r2" name={quoteattr(media_path.stem)} start="0s"'
+        f' duration="{time(frames)}" hasVideo="1" format="r1">\n'
+        '      <media-rep kind="original-media"'
+        f" src={quoteattr(media_path.as_uri())}/>\n"
+        "    </asset>\n"
+        "  </resources>\n"
+        "  <library>\n"
+        f"    <event name={quoteattr(media_path.stem)}>\n"
+        f"      <project name={quoteattr(media_path.stem + ' captions')}>\n"
+        f'        <sequence format="r1" duration="{time(frames)}">\n'
+        "          <spine>\n"
+        + "".join(f"            {item}\n" for item in spine)
+        + "          </spine>\n"
+        "        </sequence>\n"
+        "      </project>\n"
+        "    </event>\n"
+        "  </library>\n"
+        "</fcpxml>\n"
+    )
+
+
+def write_index(path: Path, index: dict):
+    """Writes the caption activity index as JSON."""
+    path.write_text(json.dumps(index, indent=2) + "\n")
+
+
+def read_index(path: Path, match: dict) -> dict | None:
+    """
+    Reads a caption activity index made with the given settings.
+
+    Args:
+        path (Path): The index file.
+        match (dict): Fields the index must have, e.g. the input fingerprint
+            and the color and tolerance of the analysis.
+
+    Returns:
+        dict | None: The index, or None if it does not exist, cannot be read
+        or was made from another input or with other settings.
+    """
+    try:
+        index = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if any(index.get(name) != value for name, value in match.items()):
+        return None
+    return index
+
+
+def clip_name(output_path: Path, number: int) -> Path:
+    """Names the file of one active clip of a sparse mask output."""
+    return output_path.with_name(f"{output_path.stem}-{number:03d}{output_path.suffix}")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import asyncio
+import contextlib
+import json
+import logging
+import subprocess
+from functools import cached_property
+from pathlib import Path
+
+from . import runner, streams
+from .batch import available_cpus, plan_workers
+from .probe import MediaInfo, probe_command
+from .vid2captionsai import PrepAudioVideo
+
+
+class AsyncPrepAudioVideo:
+    """
+    An asyncio interface to `PrepAudioVideo` for embedding in async services.
+
+    Every call is awaitable, can be cancelled or given a timeout, and waits for
+    a slot of a semaphore that limits how many calls run at once. The semaphore
+    can be shared between instances.
+
+    `probe` runs ffprobe with ``asyncio.create_subprocess_exec``. `blank` and
+    `mask` run the same code as `PrepAudioVideo` on a worker thread, with
+    every child process they start tracked in a `runner.ProcessScope`.
+    Cancelling such a call, or reaching its timeout, kills its ffmpeg
+    processes. The call then removes its partial output before the
+    cancellation is raised.
+
+    Args:
+        limit (int | None, optional): Calls that may run at once. Defaults to None (one
+            per 4 CPUs).
+        semaphore (asyncio.Semaphore | None, optional): A semaphore to share with other
+            instances instead of limit. Defaults to None.
+        **init_kwargs: Keyword arguments for the PrepAudioVideo constructor, e.g.
+            cache_dir or force.
+    """
+
+    def __init__(
+        self,
+        limit: int | None = None,
+        semaphore: asyncio.Semaphore | None = None,
+        **init_kwargs,
+    ):
+        limit, threads = plan_workers(limit or available_cpus(), limit)
+        self._init_kwargs = {
+            **init_kwargs,
+            "threads": init_kwargs.get("threads") or threads,
+        }
+        self._semaphore = semaphore or asyncio.Semaphore(limit)
+
+    @cached_property
+    def _prep(self) -> PrepAudioVideo:
+        """
+        PrepAudioVideo: An instance for the binaries and the index; every call
+        gets its own.
+        """
+        return PrepAudioVideo(**self._init_kwargs)
+
+    async def probe(
+        self, input_path: str | Path, timeout: float | None = None
+    ) -> MediaInfo:
+        """
+        Gets the metadata of a media file from the index, or from a single ffprobe call.
+
+        Like `PrepAudioVideo.probe`, an http(s) URL is probed from its header
+        only and is not indexed. The index is read and written on a worker
+        thread, so the event loop never waits for SQLite.
+
+        Args:
+            input_path (str | Path): The path to the media file, or an http(s) URL.
+            timeout (float | None, optional): Seconds for the whole call, including the
+                wait for a semaphore slot, after which ffprobe is killed. Defaults to
+                None.
+
+        Returns:
+            MediaInfo: The media metadata.
+
+        Raises:
+            ValueError: If the input is stdin, which cannot be probed without consuming
+                it.
+            subprocess.CalledProcessError: If ffprobe fails.
+            TimeoutError: If the timeout is reached.
+        """
+        input_path, _ = self._prep._prep_paths(input_path, allow_streams=True)
+        if input_path == streams.STDIN:
+            raise ValueError("Cannot probe stdin")
+        return await asyncio.wait_for(self._probe(input_path), timeout)
+
+    async def _probe(self, input_path: str | Path) -> MediaInfo:
+        """Probes a file or URL from `_prep_paths`, see `probe`."""
+        index = None if streams.is_stream(input_path) else self._prep._index
+        if index:
+            cached = await asyncio.to_thread(index.get_probe, input_path)
+            if cached and cached.get("frames"):
+                return MediaInfo.from_dict(cached)
+        cmd = [
+            str(arg)
+            for arg in probe_command(
+                self._prep._ffprobe_run, input_path, packets=bool(index)
+            )
+        ]
+        async with self._semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await process.communicate()
+            except BaseException:
+                # Cancelled or timed out
+                with contextlib.suppress(ProcessLookupError):
+                    process.kill()
+                await process.wait()
+                raise
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+        info = MediaInfo.from_ffprobe(json.loads(stdout))
+        if index:
+            await asyncio.to_thread(index.put_probe, input_path, info.to_dict())
+        return info
+
+    async def blank(
+        self, input_path: str | Path, timeout: float | None = None, **kwargs
+    ) -> Path:
+        """
+        Creates a blank video with the original audio, like `PrepAudioVideo.blank`.
+
+        Args:
+            input_path (str | Path): The path to the input video file.
+            timeout (float | None, optional): Seconds after which the call is cancelled,
+                counted from when it gets a semaphore slot. Defaults to None.
+            **kwargs: Options of `PrepAudioVideo.blank`.
+
+        Returns:
+            Path: The path to the created blank video file.
+        """
+        return await self._call("blank", input_path, timeout, kwargs)
+
+    async def mask(
+        self, input_path: str | Path, timeout: float | None = None, **kwargs
+    ) -> Path:
+        """
+        Applies a color key mask to a video file, like `PrepAudioVideo.mask`.
+
+        Args:
+            input_path (str | Path): The path to the input video file.
+            timeout (float | None, optional): Seconds after which the call is cancelled,
+                counted from when it gets a semaphore slot. Defaults to None.
+            **kwargs: Options of `PrepAudioVideo.mask`.
+
+        Returns:
+            Path: The path to the created mask video file.
+        """
+        return await self._call("mask", input_path, timeout, kwargs)
+
+    async def _call(
+        self, method: str, input_path: str | Path, timeout: float | None, kwargs: dict
+    ):
+        """
+        Runs a PrepAudioVideo method on a worker thread in a process scope of its own.
+
+        Raises:
+            asyncio.CancelledError: If the call is cancelled.
+            TimeoutError: If the timeout is reached.
+        """
+        scope = runner.ProcessScope()
+
+        def work():
+            runner.process_scope.set(scope)
+            prep = PrepAudioVideo(**self._init_kwargs)
+            return getattr(prep, method)(input_path, **kwargs)
+
+        async with self._semaphore:
+            task = asyncio.ensure_future(asyncio.to_thread(work))
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                logging.info(f"Cancelling {method} of {input_path}")
+                scope.cancel()
+                # The thread ends once its processes are gone, removing partial outputs
+                with contextlib.suppress(Exception):
+                    await task
+                raise
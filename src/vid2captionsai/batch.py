@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+import glob
+import logging
+import os
+import time
+from pathlib import Path
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".mkv", ".webm", ".avi", ".mxf")
+
+# Threads given to each ffmpeg process when the worker count is chosen
+# automatically. Encoders like libx264 and prores_ks scale well up to here, so
+# a big machine is better used by several jobs than by one wide one.
+THREADS_PER_JOB = 4
+
+
+# Overrides the detected CPU budget, e.g. in containers without a CPU quota
+CPUS_ENV = "VID2CAPTIONSAI_CPUS"
+
+# Where cgroup file systems are mounted
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def _read_quota(directory: Path, version: int) -> float | None:
+    """Reads the CPU quota of one cgroup directory in CPUs, or None if it has none."""
+    try:
+        if version == 2:
+            quota, _, period = (directory / "cpu.max").read_text().partition(" ")
+        else:
+            quota = (directory / "cpu.cfs_quota_us").read_text()
+            period = (directory / "cpu.cfs_period_us").read_text()
+        quota, period = quota.strip(), period.strip()
+        if quota in ("max", "-1") or not period or int(period) <= 0:
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_cpu_limit(
+    root: Path = CGROUP_ROOT, proc_cgroup: Path = Path("/proc/self/cgroup")
+) -> float | None:
+    """
+    Returns the CPU quota of the cgroup of this process, in CPUs.
+
+    Both cgroup v2 (``cpu.max``) and v1 (``cpu.cfs_quota_us`` over
+    ``cpu.cfs_period_us``) are read, in unified, hybrid and legacy layouts. The
+    strictest quota of the cgroup and its ancestors counts, since each of them
+    throttles the process.
+
+    Args:
+        root (Path, optional): The cgroup mount point. Defaults to CGROUP_ROOT.
+        proc_cgroup (Path, optional): The cgroup membership file. Defaults to
+            /proc/self/cgroup.
+
+    Returns:
+        float | None: The quota in CPUs, e.g. 1.5, or None if there is none.
+    """
+    try:
+        lines = proc_cgroup.read_text().splitlines()
+    except OSError:
+        return None
+    quotas = []
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if controllers == "":
+            version, mounts = 2, [root, root / "unified"]
+        elif "cpu" in controllers.split(","):
+            version, mounts = 1, [root / controllers, root / "cpu"]
+        else:
+            continue
+        for mount in mounts:
+            # In the hybrid layout, the cgroup v2 hierarchy is under unified
+            if not (mount / ("cgroup.controllers" if version == 2 else "")).exists():
+                continue
+            # Inside a cgroup namespace the own cgroup is the mount root
+            directory = mount / path.lstrip("/")
+            if not directory.is_dir():
+                directory = mount
+            for parent in [directory, *directory.parents]:
+                quotas.append(_read_quota(parent, version))
+                if parent == mount:
+                    break
+            break
+    quotas = [quota for quota in quotas if quota]
+    return min(quotas) if quotas else None
+
+
+def cpu_budget() -> tuple[int, str]:
+    """
+    Returns the number of CPUs this process may use, and where that number comes from.
+
+    The budget is the CPU affinity of the process, lowered to a cgroup CPU
+    quota (rounded down), unless ``$VID2CAPTIONSAI_CPUS`` sets it.
+
+    Returns:
+        tuple[int, str]: The CPU count, at least 1, and its source.
+    """
+    if os.environ.get(CPUS_ENV):
+        return max(1, int(float(os.environ[CPUS_ENV]))), CPUS_ENV
+    if hasattr(os, "sched_getaffinity"):
+        cpus, source = len(os.sched_getaffinity(0)), "affinity"
+    else:
+        cpus, source = os.cpu_count() or 1, "cpu count"
+    quota = cgroup_cpu_limit()
+    if quota and int(quota) < cpus:
+        cpus, source = int(quota), f"cgroup quota {quota:g}"
+    return max(1, cpus), source
+
+
+def available_cpus() -> int:
+    """
+    Returns the number of CPUs this process may use (see `cpu_budget`).
+
+    Returns:
+        int: The CPU count, at least 1.
+    """
+    return cpu_budget()[0]
+
+
+def expand_inputs(inputs: list | tuple) -> list[Path]:
+    """
+    Expands files, directories and glob patterns into a list of video files.
+
+    Directories contribute the video files directly inside them. Duplicates are
+    dropped and the original order is kept.
+
+    Args:
+        inputs (list | tuple): Paths, directories or glob patterns.
+
+    Returns:
+        list[Path]: The resolved video file paths.
+    """
+    paths = []
+    for item in inputs:
+        item = str(item)
+        if Path(item).is_dir():
+            paths += sorted(
+                p for p in Path(item).iterdir() if p.suffix.lower() in VIDEO_EXTENSIONS
+            )
+        elif glob.has_magic(item):
+            paths += sorted(Path(p) for p in glob.glob(item, recursive=True))
+        else:
+            paths.append(Path(item))
+    return list(dict.fromkeys(p.resolve() for p in paths))
+
+
+def plan_workers(jobs: int, workers: int | None = None) -> tuple[int, int]:
+    """
+    Splits the available CPUs between concurrent ffmpeg processes.
+
+    Args:
+        jobs (int): The number of jobs in the batch.
+        workers (int | None, optional): The number of concurrent jobs. Defaults
+            to None (one job per THREADS_PER_JOB CPUs).
+
+    Returns:
+        tuple[int, int]: The number of workers and the ffmpeg threads per worker.
+    """
+    cpus = available_cpus()
+    if not workers:
+        workers = cpus // THREADS_PER_JOB
+    workers = max(1, min(workers, jobs or 1))
+    return workers, max(1, cpus // workers)
+
+
+def run_job(init_kwargs: dict, method: str, input_path: Path, kwargs: dict) -> dict:
+    """
+    Runs one PrepAudioVideo method on one file, catching any failure.
+
+    Args:
+        init_kwargs (dict): Keyword arguments for the PrepAudioVideo constructor.
+        method (str): The method to call, e.g. "blank" or "mask".
+        input_path (Path): The input file.
+        kwargs (dict): Keyword arguments for the method.
+
+    Returns:
+        dict: The job result with the input, output, ok, error and seconds keys.
+    """
+    from .vid2captionsai import PrepAudioVideo
+
+    start = time.monotonic()
+    result = {"input": str(input_path), "output": None, "ok": False, "error": None}
+    try:
+        output_path = getattr(PrepAudioVideo(**init_kwargs), method)(
+            input_path, **kwargs
+        )
+        # Clips and blank variants are lists of files
+        result.update(
+            output=(
+                [str(path) for path in output_path]
+                if isinstance(output_path, list)
+                else str(output_path)
+            ),
+            ok=True,
+        )
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def run_pool(
+    init_kwargs: dict, method: str, paths: list[Path], kwargs: dict, workers: int
+) -> tuple[dict, list[Path]]:
+    """
+    Runs jobs on one process pool until they finish or a worker process dies.
+
+    A worker that dies, e.g. killed for running out of memory, breaks the
+    pool, and every job that has not finished fails with BrokenProcessPool.
+
+    Args:
+        init_kwargs (dict): Keyword arguments for the PrepAudioVideo constructor.
+        method (str): The method to call, e.g. "blank" or "mask".
+        paths (list[Path]): The input files.
+        kwargs (dict): Keyword arguments for the method.
+        workers (int): The number of concurrent jobs.
+
+    Returns:
+        tuple[dict, list[Path]]: The results of the finished jobs by input
+        file, and the input files whose jobs were lost with the pool.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+
+    results, lost = {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_job, init_kwargs, method, path, kwargs): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                lost.append(futures[future])
+                continue
+            results[futures[future]] = result
+            if result["ok"]:
+                logging.info(f"OK {result['input']} -> {result['output']}")
+            else:
+                logging.warning(f"FAILED {result['input']}: {result['error']}")
+    return results, [path for path in paths if path in lost]
+
+
+def run_batch(
+    init_kwargs: dict,
+    method: str,
+    inputs: list | tuple,
+    kwargs: dict,
+    workers: int | None = None,
+) -> list[dict]:
+    """
+    Runs one PrepAudioVideo method over many files on a bounded process pool.
+
+    Every job gets an explicit ffmpeg thread count so that the concurrent ffmpeg
+    processes share the machine instead of each sizing itself to all cores. A
+    failing job is reported in its result and does not stop the batch. When a
+    worker process dies, the jobs it took down with the pool run again on a
+    new one. If none of them finishes there either, each runs alone, and only
+    the one whose worker dies again fails.
+
+    Args:
+        init_kwargs (dict): Keyword arguments for the PrepAudioVideo constructor.
+        method (str): The method to call, e.g. "blank" or "mask".
+        inputs (list | tuple): Paths, directories or glob patterns.
+        kwargs (dict): Keyword arguments for the method.
+        workers (int | None, optional): The number of concurrent jobs. Defaults to None
+            (automatic).
+
+    Returns:
+        list[dict]: One result per input file, in input order.
+
+    Raises:
+        ValueError: If kwargs has an output_path, which every job would write.
+    """
+    if kwargs.get("output_path"):
+        raise ValueError(
+            f"{method}_batch derives one output per input;"
+            " output_path is not supported"
+        )
+    paths = expand_inputs(inputs)
+    workers, threads = plan_workers(len(paths), workers)
+    init_kwargs = {**init_kwargs, "threads": init_kwargs.get("threads") or threads}
+    logging.info(
+        f"Running {method} on {len(paths)} files with {workers} workers"
+        f" x {init_kwargs['threads']} threads"
+    )
+    results, pending = run_pool(init_kwargs, method, paths, kwargs, workers)
+    while pending:
+        logging.warning(f"A worker process died, rerunning {len(pending)} jobs")
+        finished, pending = run_pool(init_kwargs, method, pending, kwargs, workers)
+        results.update(finished)
+        if not finished:
+            break
+    # Jobs that never finish next to others run alone, so that only the job
+    # whose worker dies fails
+    for path in pending:
+        finished, lost = run_pool(init_kwargs, method, [path], kwargs, 1)
+        results.update(finished)
+        if lost:
+            logging.warning(f"FAILED {path}: its worker process died")
+            results[path] = {
+                "input": str(path),
+                "output": None,
+                "ok": False,
+                "error": "BrokenProcessPool: the worker process died",
+                "seconds": None,
+            }
+    failed = sum(not r["ok"] for r in results.values())
+    logging.info(f"Batch done: {len(paths) - failed} succeeded, {failed} failed")
+    return [results[path] for path in paths]
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Fixtures of the benchmark suite: the captions.ai canvas at its usual frame
+# rates, plus common 16:9 sizes. Captions show half of the time, as in speech.
+SUITE_CASES = [
+    {"width": 2160, "height": 720, "fps": "30", "duration": 10},
+    {"width": 2160, "height": 720, "fps": "30000/1001", "duration": 10},
+    {"width": 2160, "height": 720, "fps": "60", "duration": 10},
+    {"width": 1280, "height": 720, "fps": "25", "duration": 10},
+    {"width": 1920, "height": 1080, "fps": "24", "duration": 10},
+    {"width": 2160, "height": 720, "fps": "30", "duration": 60},
+]
+
+# A single small fixture for a smoke run
+QUICK_CASES = [{"width": 640, "height": 360, "fps": "30", "duration": 3}]
+
+# Commands of the benchmark suite, by name: the method and its options
+SUITE_COMMANDS = {
+    "blank": ("blank", {}),
+    "blank-static": ("blank", {"profile": "static"}),
+    "mask": ("mask", {}),
+    "mask-crop": ("mask", {"crop": True}),
+    "mask-sparse": ("mask", {"sparse": "filler"}),
+}
+
+# Relative slowdown of a command above which it counts as a regression
+REGRESSION_THRESHOLD = 0.1
+
+
+def make_fixture(
+    ffmpeg_run: list,
+    output_path: str | Path,
+    width: int = 1280,
+    height: int = 720,
+    fps: str | float = 30,
+    duration: float = 10,
+    color: str = "000000",
+    caption_duty: float = 1.0,
+) -> Path:
+    """
+    Generates a captions.ai-like render offline with ffmpeg's lavfi sources.
+
+    The video is a solid background with a changing white ``drawtext`` caption,
+    the audio is a ``sine`` tone.
+
+    Args:
+        ffmpeg_run (list): The ffmpeg executable followed by its global options.
+        output_path (str | Path): The fixture file to write.
+        width (int, optional): Width in pixels. Defaults to 1280.
+        height (int, optional): Height in pixels. Defaults to 720.
+        fps (str | float, optional): Frame rate. Defaults to 30.
+        duration (float, optional): Duration in seconds. Defaults to 10.
+        color (str, optional): Background color in hexadecimal format. Defaults to
+            "000000".
+        caption_duty (float, optional): Share of every 4 seconds that shows a caption.
+            Defaults to 1.0.
+
+    Returns:
+        Path: The fixture file.
+    """
+    output_path = Path(output_path)
+    caption = (
+        f"drawtext=text='Caption %{{eif\\:floor(t*2)\\:d}}':fontcolor=white"
+        f":fontsize={max(height // 8, 8)}:x=(w-tw)/2:y=h*3/4-th/2"
+        f":box=1:boxcolor=0x{color}:borderw=2:bordercolor=0x202020"
+    )
+    if caption_duty < 1:
+        caption += f":enable='lt(mod(t,4),{4 * caption_duty:g})'"
+    subprocess.run(
+        ffmpeg_run
+        + [
+            "-f",
+            "lavfi",
+            "-i",
+            f"color=c=0x{color}:s={width}x{height}:r={fps}:d={duration},{caption}",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-shortest",
+            output_path,
+        ],
+        check=True,
+    )
+    return output_path
+
+
+def bench_keyers(
+    prep,
+    width: int = 1280,
+    height: int = 720,
+    fps: str | float = 30,
+    duration: float = 10,
+) -> list[dict]:
+    """
+    Times the mask keying engines against each other on a generated fixture.
+
+    Args:
+        prep (PrepAudioVideo): The instance whose mask method is timed.
+        width (int, optional): Fixture width in pixels. Defaults to 1280.
+        height (int, optional): Fixture height in pixels. Defaults to 720.
+        fps (str | float, optional): Fixture frame rate. Defaults to 30.
+        duration (float, optional): Fixture duration in seconds. Defaults to 10.
+
+    Returns:
+        list[dict]: One record per engine with the seconds and frames per second.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture = make_fixture(
+            prep._ffmpeg_run,
+            Path(work_dir) / "fixture.mp4",
+            width,
+            height,
+            fps,
+            duration,
+        )
+        frames = prep._probe(fixture).frames
+        for engine in ["colorkey", "numpy"]:
+            start = time.monotonic()
+            prep.mask(
+                fixture, engine=engine, output_path=Path(work_dir) / f"{engine}.mov"
+            )
+            elapsed = time.monotonic() - start
+            results.append(
+                {
+                    "engine": engine,
+                    "size": f"{width}x{height}",
+                    "frames": frames,
+                    "seconds": round(elapsed, 3),
+                    "fps": round(frames / elapsed, 2),
+                }
+            )
+            logging.info(f"{engine}: {frames} frames in {elapsed:.2f} s")
+    return results
+
+
+def _measure_mask(init_kwargs: dict, input_path: str, kwargs: dict) -> dict:
+    """
+    Runs `mask` in a fresh worker process and measures it.
+
+    Every ffmpeg that `mask` starts is a waited-for child of this process, so
+    the children's resource usage covers exactly this one encode.
+    """
+    from .vid2captionsai import PrepAudioVideo
+
+    start = time.monotonic()
+    output_path = PrepAudioVideo(**init_kwargs).mask(input_path, **kwargs)
+    elapsed = time.monotonic() - start
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "output": str(output_path),
+        "seconds": elapsed,
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss": usage.ru_maxrss * 1024,
+    }
+
+
+def bench_codecs(
+    prep,
+    width: int = 1280,
+    height: int = 720,
+    fps: str | float = 30,
+    duration: float = 10,
+    codecs: list[str] | None = None,
+) -> list[dict]:
+    """
+    Encodes a generated fixture with each mask codec and measures the cost.
+
+    Args:
+        prep (PrepAudioVideo): The instance whose settings the encodes use.
+        width (int, optional): Fixture width in pixels. Defaults to 1280.
+        height (int, optional): Fixture height in pixels. Defaults to 720.
+        fps (str | float, optional): Fixture frame rate. Defaults to 30.
+        duration (float, optional): Fixture duration in seconds. Defaults to 10.
+        codecs (list[str] | None, optional): Codec names to compare. Defaults to None
+            (those of MASK_CODECS that ffmpeg can encode).
+
+    Returns:
+        list[dict]: One record per codec with the encode fps, the output bytes
+        per second of video, the file size and the peak RSS of ffmpeg.
+    """
+    from .vid2captionsai import MASK_CODECS
+
+    encoders = prep._ffmpeg_info["encoders"]
+    codecs = codecs or [
+        codec
+        for codec, options in MASK_CODECS.items()
+        if options["video"][1] in encoders
+    ]
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture = make_fixture(
+            prep._ffmpeg_run,
+            Path(work_dir) / "fixture.mp4",
+            width,
+            height,
+            fps,
+            duration,
+        )
+        info = prep._probe(fixture)
+        for codec in codecs:
+            output_path = Path(work_dir) / f"{codec}{MASK_CODECS[codec]['ext']}"
+            # A fresh process per codec keeps the peak RSS of one encode apart
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                measured = pool.submit(
+                    _measure_mask,
+                    prep._init_kwargs,
+                    str(fixture),
+                    dict(codec=codec, output_path=str(output_path)),
+                ).result()
+            size = output_path.stat().st_size
+            results.append(
+                {
+                    "codec": codec,
+                    "size": f"{width}x{height}",
+                    "frames": info.frames,
+                    "seconds": round(measured["seconds"], 3),
+                    "fps": round(info.frames / measured["seconds"], 2),
+                    "cpu_seconds": round(measured["cpu_seconds"], 3),
+                    "bytes": size,
+                    "bytes_per_second": round(size / info.duration),
+                    "peak_rss": measured["peak_rss"],
+                }
+            )
+            logging.info(
+                f"{codec}: {info.frames / measured['seconds']:.1f} fps,"
+                f" {size / info.duration / 1e6:.2f} MB/s,"
+                f" peak RSS {measured['peak_rss'] / 1e6:.0f} MB"
+            )
+    return results
+
+
+def case_name(case: dict) -> str:
+    """Names a benchmark fixture, e.g. "2160x720@30000/1001 10s"."""
+    return f"{case['width']}x{case['height']}@{case['fps']} {case['duration']:g}s"
+
+
+def run_suite(
+    prep,
+    cases: list[dict] | None = None,
+    commands: list[str] | None = None,
+    repeat: int = 3,
+) -> dict:
+    """
+    Times `blank` and `mask` end to end and per stage on generated fixtures.
+
+    Every command runs ``repeat`` times on a fresh copy of the instance with
+    the output cache off, and the run with the median wall time is kept. The
+    stages are the job record stages (see `metrics.job_record`); the time
+    outside of them (probing, caption analysis, Python) is the "other" stage.
+
+    Args:
+        prep (PrepAudioVideo): The instance whose settings the runs use.
+        cases (list[dict] | None, optional): Fixtures with width, height, fps and
+            duration. Defaults to None (SUITE_CASES).
+        commands (list[str] | None, optional): Names in SUITE_COMMANDS. Defaults to None
+            (all).
+        repeat (int, optional): Runs per command. Defaults to 3.
+
+    Returns:
+        dict: The environment and one result per fixture and command.
+    """
+    from . import __version__
+    from .batch import available_cpus
+    from .vid2captionsai import PrepAudioVideo
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        metrics_path = work_dir / "jobs.jsonl"
+        for number, case in enumerate(cases or SUITE_CASES):
+            fixture = make_fixture(
+                prep._ffmpeg_run,
+                work_dir / f"fixture-{number}.mp4",
+                case["width"],
+                case["height"],
+                case["fps"],
+                case["duration"],
+                caption_duty=0.5,
+            )
+            for name in commands or list(SUITE_COMMANDS):
+                method, kwargs = SUITE_COMMANDS[name]
+                runs = []
+                for run in range(repeat):
+                    # A fresh cache, so probing is measured and nothing is skipped
+                    runner = PrepAudioVideo(
+                        **dict(
+                            prep._init_kwargs,
+                            cache_dir=work_dir / f"cache-{number}-{name}-{run}",
+                            force=True,
+                            metrics_path=metrics_path,
+                            textfile_path=None,
+                        )
+                    )
+                    start = time.monotonic()
+                    getattr(runner, method)(fixture, **kwargs)
+                    seconds = time.monotonic() - start
+                    record = json.loads(metrics_path.read_text().splitlines()[-1])
+                    stages = {
+                        stage: values["wall_seconds"]
+                        for stage, values in record["stages"].items()
+                    }
+                    stages["other"] = round(seconds - sum(stages.values()), 3)
+                    runs.append(
+                        {
+                            "seconds": round(seconds, 3),
+                            "cpu_seconds": record["cpu_seconds"],
+                            "frames": record["frames"],
+                            "output_bytes": record["output_bytes"],
+                            "peak_rss_bytes": record["peak_rss_bytes"],
+                            "stages": stages,
+                        }
+                    )
+                median = sorted(runs, key=lambda r: r["seconds"])[len(runs) // 2]
+                result = {
+                    "case": case_name(case),
+                    "command": name,
+                    **case,
+                    **median,
+                    "encode_fps": round(median["frames"] / median["seconds"], 2),
+                    "realtime_factor": round(case["duration"] / median["seconds"], 3),
+                    "runs": [r["seconds"] for r in runs],
+                    "stdev": (
+                        round(statistics.stdev(r["seconds"] for r in runs), 3)
+                        if len(runs) > 1
+                        else 0.0
+                    ),
+                }
+                results.append(result)
+                logging.info(
+                    f"{result['case']} {name}: {result['seconds']} s"
+                    f" ({result['realtime_factor']}x realtime)"
+                )
+    return {
+        "version": __version__,
+        "ffmpeg": prep._ffmpeg_info["version"],
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": available_cpus(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_results(
+    baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD
+) -> list[dict]:
+    """
+    Compares two benchmark suite runs.
+
+    Args:
+        baseline (dict): The earlier `run_suite` result.
+        current (dict): The new `run_suite` result.
+        threshold (float, optional): Relative slowdown that counts as a regression.
+            Defaults to REGRESSION_THRESHOLD.
+
+    Returns:
+        list[dict]: One entry per fixture and command in both runs, with the
+        baseline and current seconds, the relative change and a regression flag.
+    """
+    before = {(r["case"], r["command"]): r for r in baseline["results"]}
+    comparison = []
+    for result in current["results"]:
+        old = before.get((result["case"], result["command"]))
+        if not old:
+            continue
+        change = result["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+        comparison.append(
+            {
+                "case": result["case"],
+                "command": result["command"],
+                "baseline": old["seconds"],
+                "current": result["seconds"],
+                "change": round(change, 3),
+                "regression": change > threshold,
+            }
+        )
+    return comparison
+
+
+def bench_startup(prep, repeat: int = 10) -> list[dict]:
+    """
+    Measures the fixed cost of starting vid2captionsai in a new process.
+
+    Each step runs ``repeat`` times in a fresh interpreter against a warm
+    metadata index, as batch drivers that start many processes see it: bare
+    Python, importing the package, the CLI help, resolving ffmpeg, and a
+    ``probe`` whose result is already indexed, so no ffprobe runs.
+
+    Args:
+        prep (PrepAudioVideo): The instance whose settings the runs use.
+        repeat (int, optional): Runs per step. Defaults to 10.
+
+    Returns:
+        list[dict]: One record per step with the median and minimum milliseconds.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture = make_fixture(
+            prep._ffmpeg_run, Path(work_dir) / "fixture.mp4", 320, 180, 30, 1
+        )
+        flags = [f"--cache_dir={work_dir}"] + [
+            f"--{name}={prep._init_kwargs[name]}"
+            for name in ["ffmpeg_path", "ffprobe_path"]
+            if prep._init_kwargs[name]
+        ]
+        resolve = (
+            "from vid2captionsai import PrepAudioVideo;"
+            f" PrepAudioVideo(cache_dir={work_dir!r},"
+            f" ffmpeg_path={prep._init_kwargs['ffmpeg_path']!r},"
+            f" ffprobe_path={prep._init_kwargs['ffprobe_path']!r})._ffmpeg_run"
+        )
+        cli = [sys.executable, "-m", "vid2captionsai"] + flags
+        steps = {
+            "python": [sys.executable, "-c", "pass"],
+            "import": [sys.executable, "-c", "import vid2captionsai"],
+            "help": cli + ["--help"],
+            "resolve": [sys.executable, "-c", resolve],
+            "probe": cli + ["probe", str(fixture)],
+        }
+        # Fills the index, so every measured run starts warm
+        subprocess.run(steps["probe"], capture_output=True, check=True)
+        results = []
+        for step, cmd in steps.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(cmd, capture_output=True, check=True)
+                times.append((time.perf_counter() - start) * 1000)
+            results.append(
+                {
+                    "step": step,
+                    "median_ms": round(statistics.median(times), 1),
+                    "min_ms": round(min(times), 1),
+                }
+            )
+            logging.info(
+                f"{step}: {statistics.median(times):.1f} ms (min {min(times):.1f} ms)"
+            )
+    return results
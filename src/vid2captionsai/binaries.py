@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import logging
+import re
+import subprocess
+from pathlib import Path
+
+from .index import MetadataIndex
+
+# Index entry of the binaries of the static_ffmpeg package
+STATIC = "static"
+
+
+def fetch_static() -> tuple[str, str]:
+    """
+    Returns the ffmpeg and ffprobe binaries of the static_ffmpeg package.
+
+    The package (and the HTTP client it uses for downloading) is imported only
+    here, and it downloads the binaries on first use.
+
+    Returns:
+        tuple[str, str]: The ffmpeg and ffprobe paths.
+    """
+    from static_ffmpeg.run import get_or_fetch_platform_executables_else_raise
+
+    return get_or_fetch_platform_executables_else_raise()
+
+
+def resolve(
+    index: MetadataIndex,
+    ffmpeg_path: str | Path | None = None,
+    ffprobe_path: str | Path | None = None,
+) -> tuple[Path, Path]:
+    """
+    Resolves the ffmpeg and ffprobe binaries, remembering static_ffmpeg's in the index.
+
+    Explicit paths are used as they are. Otherwise the binaries of the
+    static_ffmpeg package are looked up in the index, and static_ffmpeg is
+    only asked (and imported) if they are not indexed yet or have changed.
+    The binaries are run directly, not through static_ffmpeg's Python wrapper
+    scripts, which would start an interpreter for every ffmpeg process.
+
+    Args:
+        index (MetadataIndex): The metadata index.
+        ffmpeg_path (str | Path | None, optional): Path to the ffmpeg executable.
+            Defaults to None.
+        ffprobe_path (str | Path | None, optional): Path to the ffprobe executable.
+            Defaults to None.
+
+    Returns:
+        tuple[Path, Path]: The ffmpeg and ffprobe paths.
+    """
+    static = None
+    if not (ffmpeg_path and ffprobe_path):
+        static = index.get_binary(STATIC)
+        if not static or not Path(static["ffprobe"]).exists():
+            ffmpeg, ffprobe = fetch_static()
+            static = {"ffmpeg": ffmpeg, "ffprobe": ffprobe}
+            index.put_binary(STATIC, ffmpeg, static)
+            logging.info(f"Using static ffmpeg: {ffmpeg}")
+    return (
+        Path(ffmpeg_path or static["ffmpeg"]).resolve(),
+        Path(ffprobe_path or static["ffprobe"]).resolve(),
+    )
+
+
+def parse_capabilities(output: str) -> list[str]:
+    """
+    Parses the names listed by ``ffmpeg -encoders`` or ``ffmpeg -filters``.
+
+    Both list one entry per line after a ``------`` separator, as flags
+    followed by the name.
+
+    Args:
+        output (str): The output of ffmpeg.
+
+    Returns:
+        list[str]: The names, in order.
+    """
+    _, _, listing = output.partition("------")
+    names = []
+    for line in listing.splitlines():
+        match = re.match(r"\s*[A-Z.|]+\s+(\S+)", line)
+        if match:
+            names.append(match.group(1))
+    return names
+
+
+def query_info(ffmpeg_path: Path) -> dict:
+    """
+    Asks ffmpeg for its version and its available encoders and filters.
+
+    Args:
+        ffmpeg_path (Path): The ffmpeg executable.
+
+    Returns:
+        dict: The "version" line, and the "encoders" and "filters" names.
+    """
+    info = {}
+    for option in ["-version", "-encoders", "-filters"]:
+        result = subprocess.run(
+            [str(ffmpeg_path), "-hide_banner", option],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        )
+        if option == "-version":
+            info["version"] = result.stdout.splitlines()[0]
+        else:
+            info[option[1:]] = parse_capabilities(result.stdout)
+    return info
+
+
+def ffmpeg_info(index: MetadataIndex, ffmpeg_path: Path) -> dict:
+    """
+    Returns the version, encoders and filters of an ffmpeg binary, from the index if it
+    is unchanged.
+
+    Args:
+        index (MetadataIndex): The metadata index.
+        ffmpeg_path (Path): The ffmpeg executable.
+
+    Returns:
+        dict: See `query_info`.
+    """
+    name = f"info:{ffmpeg_path}"
+    info = index.get_binary(name)
+    if not info:
+        info = query_info(ffmpeg_path)
+        index.put_binary(name, ffmpeg_path, info)
+    return info
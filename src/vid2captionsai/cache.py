@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from .streams import STDOUT
+
+# Bytes hashed at the start, middle and end of a file for its fingerprint.
+# Enough to tell apart re-renders of the same length, cheap even for huge files.
+SAMPLE_SIZE = 1 << 20
+
+
+def fingerprint(path: str | Path, sample_size: int = SAMPLE_SIZE) -> str:
+    """
+    Computes a cheap content fingerprint of a file.
+
+    The fingerprint covers the size, the modification time and a SHA-256 of
+    samples from the start, middle and end of the file, so it never reads more
+    than three samples however large the file is.
+
+    Args:
+        path (str | Path): The file.
+        sample_size (int, optional): Bytes per sample. Defaults to SAMPLE_SIZE.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    stat = Path(path).stat()
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        middle = max(0, stat.st_size // 2 - sample_size // 2)
+        end = max(0, stat.st_size - sample_size)
+        for offset in sorted({0, middle, end}):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def cache_key(method: str, inputs: list, params: dict) -> str:
+    """
+    Computes the content address of an output.
+
+    Args:
+        method (str): The command that makes the output, e.g. "blank".
+        inputs (list): The input files the output is made from.
+        params (dict): Every parameter that changes the output, JSON-serializable.
+
+    Returns:
+        str: The hexadecimal cache key.
+    """
+    document = {
+        "method": method,
+        "inputs": [fingerprint(path) for path in inputs],
+        "params": params,
+    }
+    return hashlib.sha256(
+        json.dumps(document, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def partial_path(output_path: Path) -> Path:
+    """Names the hidden file an output is written to before it is complete."""
+    return output_path.with_name(f".{output_path.stem}.partial{output_path.suffix}")
+
+
+@contextmanager
+def atomic_output(output_path: Path):
+    """
+    Yields a temporary path to write an output to, renamed into place on success.
+
+    The temporary file sits next to the output, so the rename is atomic and an
+    interrupted run never leaves a half-written file under the output name.
+    Stdout (``streams.STDOUT``) has nothing to rename and is yielded as it is.
+
+    Args:
+        output_path (Path): The final output file.
+    """
+    if output_path == STDOUT:
+        yield output_path
+        return
+    partial = partial_path(output_path)
+    try:
+        yield partial
+        os.replace(partial, output_path)
+    finally:
+        partial.unlink(missing_ok=True)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def default_cache_dir() -> Path:
+    """
+    Returns the directory where vid2captionsai keeps its on-disk caches.
+
+    The location can be overridden with the ``VID2CAPTIONSAI_CACHE_DIR``
+    environment variable, otherwise ``$XDG_CACHE_HOME/vid2captionsai`` or
+    ``~/.cache/vid2captionsai`` is used.
+
+    Returns:
+        Path: The cache directory (not necessarily existing yet).
+    """
+    if os.environ.get("VID2CAPTIONSAI_CACHE_DIR"):
+        return Path(os.environ["VID2CAPTIONSAI_CACHE_DIR"]).expanduser()
+    xdg_cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache).expanduser() / "vid2captionsai"
+
+
+class MetadataIndex:
+    """
+    A persistent SQLite index of media metadata, finished outputs, job totals and
+    binaries.
+
+    Probe entries are keyed by the resolved file path, its size and its
+    modification time, so a changed or replaced file never returns stale
+    metadata. Output entries map a cache key (see `cache.cache_key`) to the
+    file made with it. Binary entries hold the resolved ffmpeg executables and
+    their capabilities, valid while the executable is unchanged. The index
+    is safe to share between concurrent processes (batch workers, repeat runs).
+
+    Args:
+        path (str | Path | None): The SQLite database file. Defaults to
+            ``index.sqlite`` in the default cache directory.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else default_cache_dir() / "index.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS probes ("
+                " path TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " data TEXT NOT NULL,"
+                " PRIMARY KEY (path, size, mtime_ns))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                " key TEXT PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_totals ("
+                " method TEXT PRIMARY KEY,"
+                " jobs INTEGER NOT NULL,"
+                " wall_seconds REAL NOT NULL,"
+                " cpu_seconds REAL NOT NULL,"
+                " media_seconds REAL NOT NULL,"
+                " frames INTEGER NOT NULL,"
+                " output_bytes INTEGER NOT NULL,"
+                " last_realtime_factor REAL NOT NULL,"
+                " last_peak_rss_bytes INTEGER NOT NULL,"
+                " last_timestamp REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS binaries ("
+                " name TEXT PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _key(path: str | Path) -> tuple[str, int, int]:
+        path = Path(path).resolve()
+        stat = path.stat()
+        return str(path), stat.st_size, stat.st_mtime_ns
+
+    def get_probe(self, path: str | Path) -> dict | None:
+        """
+        Looks up the stored probe data for a file.
+
+        Args:
+            path (str | Path): The media file.
+
+        Returns:
+            dict | None: The stored probe data, or None if the file is not
+            indexed or has changed since it was indexed.
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT data FROM probes WHERE path=? AND size=? AND mtime_ns=?",
+                self._key(path),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_probe(self, path: str | Path, data: dict):
+        """
+        Stores probe data for a file, replacing entries for older versions of it.
+
+        Args:
+            path (str | Path): The media file.
+            data (dict): JSON-serializable probe data.
+        """
+        key = self._key(path)
+        with self._connect() as db:
+            db.execute("DELETE FROM probes WHERE path=?", key[:1])
+            db.execute(
+                "INSERT INTO probes (path, size, mtime_ns, data) VALUES (?, ?, ?, ?)",
+                key + (json.dumps(data),),
+            )
+
+    def get_output(self, key: str) -> Path | None:
+        """
+        Looks up the output made for a cache key.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Path | None: The output file, or None if there is none or it has
+            been changed or removed since it was made.
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT path, size, mtime_ns FROM outputs WHERE key=?", (key,)
+            ).fetchone()
+        if not row or not Path(row[0]).exists() or self._key(row[0]) != row:
+            return None
+        return Path(row[0])
+
+    def put_output(self, key: str, path: str | Path):
+        """
+        Records the output made for a cache key.
+
+        Args:
+            key (str): The cache key.
+            path (str | Path): The finished output file.
+        """
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO outputs (key, path, size, mtime_ns)"
+                " VALUES (?, ?, ?, ?)",
+                (key,) + self._key(path),
+            )
+
+    def get_binary(self, name: str) -> dict | None:
+        """
+        Looks up what is stored about an executable.
+
+        Args:
+            name (str): The entry name, e.g. "static".
+
+        Returns:
+            dict | None: The stored data, or None if there is none or the
+            executable has been changed or removed since it was stored.
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT path, size, mtime_ns, data FROM binaries WHERE name=?",
+                (name,),
+            ).fetchone()
+        if not row or not Path(row[0]).exists() or self._key(row[0]) != row[:3]:
+            return None
+        return json.loads(row[3])
+
+    def put_binary(self, name: str, path: str | Path, data: dict):
+        """
+        Stores data about an executable, valid as long as it is unchanged.
+
+        Args:
+            name (str): The entry name.
+            path (str | Path): The executable.
+            data (dict): JSON-serializable data.
+        """
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO binaries (name, path, size, mtime_ns, data)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (name,) + self._key(path) + (json.dumps(data),),
+            )
+
+    def add_job(self, record: dict) -> list[dict]:
+        """
+        Adds a job record (see `metrics.job_record`) to the totals of its method.
+
+        Args:
+            record (dict): The job record.
+
+        Returns:
+            list[dict]: The updated totals of every method.
+        """
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO job_totals VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(method) DO UPDATE SET"
+                " jobs=jobs+1,"
+                " wall_seconds=wall_seconds+excluded.wall_seconds,"
+                " cpu_seconds=cpu_seconds+excluded.cpu_seconds,"
+                " media_seconds=media_seconds+excluded.media_seconds,"
+                " frames=frames+excluded.frames,"
+                " output_bytes=output_bytes+excluded.output_bytes,"
+                " last_realtime_factor=excluded.last_realtime_factor,"
+                " last_peak_rss_bytes=excluded.last_peak_rss_bytes,"
+                " last_timestamp=excluded.last_timestamp",
+                (
+                    record["method"],
+                    record["wall_seconds"],
+                    record["cpu_seconds"],
+                    record["media_seconds"],
+                    record["frames"],
+                    record["output_bytes"],
+                    record["realtime_factor"],
+                    record["peak_rss_bytes"],
+                    record["timestamp"],
+                ),
+            )
+            cursor = db.execute("SELECT * FROM job_totals ORDER BY method")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
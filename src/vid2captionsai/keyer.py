@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import logging
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from . import runner
+
+# Frames per batch handed to a worker process. Small enough that the in-flight
+# buffers stay a few hundred MB at 4K, large enough to amortize the IPC.
+BATCH_FRAMES = 8
+
+# Shared memory blocks attached in a worker process, by name
+_worker_blocks = {}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "The numpy keying engine needs NumPy: pip install vid2captionsai[numpy]"
+        ) from e
+    return numpy
+
+
+def key_frames(
+    rgb,
+    color: str = "000000",
+    similarity: float = 0.01,
+    blend: float = 0.01,
+    falloff: str = "smooth",
+    despill: bool = False,
+    premultiply: bool = False,
+    out=None,
+):
+    """
+    Computes RGBA frames from RGB frames by keying out a color.
+
+    The color distance follows ffmpeg's ``colorkey`` filter: the Euclidean RGB
+    distance scaled to 0..1. Pixels closer than ``similarity`` are transparent,
+    pixels farther than ``similarity + blend`` are opaque, and the ramp between
+    them is linear or smoothstep-shaped.
+
+    Args:
+        rgb (numpy.ndarray): uint8 frames of shape (n, height, width, 3).
+        color (str, optional): The key color in hexadecimal format. Defaults to
+            "000000".
+        similarity (float, optional): Distance below which pixels are fully transparent.
+            Defaults to 0.01.
+        blend (float, optional): Width of the soft edge above ``similarity``. Defaults
+            to 0.01.
+        falloff (str, optional): Shape of the soft edge, "linear" or "smooth". Defaults
+            to "smooth".
+        despill (bool, optional): Remove the key color mixed into semi-transparent
+            pixels. Defaults to False.
+        premultiply (bool, optional): Output color premultiplied by alpha. Defaults to
+            False.
+        out (numpy.ndarray | None, optional): uint8 array of shape (n, height, width, 4)
+            to write into. Defaults to None.
+
+    Returns:
+        numpy.ndarray: uint8 RGBA frames of shape (n, height, width, 4).
+    """
+    np = _numpy()
+    key = np.array([int(color[i : i + 2], 16) for i in (0, 2, 4)], dtype=np.float32)
+    pixels = rgb.astype(np.float32)
+    distance = np.sqrt(((pixels - key) ** 2).sum(axis=-1) / (3 * 255.0**2))
+    if blend > 0.0001:
+        alpha = np.clip((distance - similarity) / blend, 0.0, 1.0)
+        if falloff == "smooth":
+            alpha = alpha * alpha * (3.0 - 2.0 * alpha)
+    else:
+        alpha = (distance > similarity).astype(np.float32)
+    alpha = alpha[..., None]
+    if despill or premultiply:
+        # An observed pixel is alpha * foreground + (1 - alpha) * key, so
+        # removing the key share gives the premultiplied foreground
+        pixels -= (1.0 - alpha) * key
+        if not premultiply:
+            pixels /= np.maximum(alpha, 1.0 / 255)
+    if out is None:
+        out = np.empty(rgb.shape[:-1] + (4,), dtype=np.uint8)
+    out[..., :3] = np.clip(pixels + 0.5, 0, 255)
+    out[..., 3:] = alpha * 255.0 + 0.5
+    return out
+
+
+def _attach(name: str):
+    if name not in _worker_blocks:
+        _worker_blocks[name] = shared_memory.SharedMemory(name=name)
+    return _worker_blocks[name]
+
+
+def _key_slot(
+    in_name: str, out_name: str, shape: tuple, count: int, options: dict
+) -> int:
+    """Keys ``count`` frames of one shared-memory slot in a worker process."""
+    np = _numpy()
+    rgb = np.ndarray((count,) + shape + (3,), np.uint8, _attach(in_name).buf)
+    rgba = np.ndarray((count,) + shape + (4,), np.uint8, _attach(out_name).buf)
+    key_frames(rgb, out=rgba, **options)
+    return count
+
+
+def _read_into(stream, view) -> int:
+    """Fills a memoryview from a stream, returning the number of bytes read."""
+    filled = 0
+    while filled < len(view):
+        read = stream.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
+    return filled
+
+
+def run_numpy_keyer(
+    decode_cmd: list,
+    encode_cmd: list,
+    width: int,
+    height: int,
+    workers: int = 1,
+    batch_frames: int = BATCH_FRAMES,
+    **options,
+) -> int:
+    """
+    Keys a video with NumPy between an ffmpeg decode pipe and an encode pipe.
+
+    Raw RGB frames are read from ``decode_cmd`` in batches into a fixed ring of
+    shared-memory slots, keyed by worker processes, and written in order as raw
+    RGBA to ``encode_cmd``. At most two batches per worker are in flight, so
+    memory use does not grow with the length of the video.
+
+    Args:
+        decode_cmd (list): ffmpeg command writing rgb24 rawvideo to stdout.
+        encode_cmd (list): ffmpeg command reading rgba rawvideo from stdin.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        workers (int, optional): Number of keying processes. Defaults to 1.
+        batch_frames (int, optional): Frames per batch. Defaults to BATCH_FRAMES.
+        **options: Keying options passed to `key_frames`.
+
+    Returns:
+        int: The number of frames keyed.
+    """
+    _numpy()
+    frame_rgb, frame_rgba = width * height * 3, width * height * 4
+    slots = [
+        (
+            shared_memory.SharedMemory(create=True, size=frame_rgb * batch_frames),
+            shared_memory.SharedMemory(create=True, size=frame_rgba * batch_frames),
+        )
+        for _ in range(2 * workers)
+    ]
+    decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE)
+    encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE)
+    frames = 0
+    with runner.tracked(decoder), runner.tracked(encoder):
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                slot = 0
+                while True:
+                    if len(pending) == len(slots):
+                        done_slot, future = pending.popleft()
+                        count = future.result()
+                        encoder.stdin.write(
+                            slots[done_slot][1].buf[: count * frame_rgba]
+                        )
+                    read = _read_into(decoder.stdout, slots[slot][0].buf)
+                    count = read // frame_rgb
+                    if not count:
+                        break
+                    future = pool.submit(
+                        _key_slot,
+                        slots[slot][0].name,
+                        slots[slot][1].name,
+                        (height, width),
+                        count,
+                        options,
+                    )
+                    pending.append((slot, future))
+                    frames += count
+                    slot = (slot + 1) % len(slots)
+                for done_slot, future in pending:
+                    count = future.result()
+                    encoder.stdin.write(slots[done_slot][1].buf[: count * frame_rgba])
+            encoder.stdin.close()
+            if decoder.wait():
+                raise subprocess.CalledProcessError(decoder.returncode, decode_cmd)
+            if encoder.wait():
+                raise subprocess.CalledProcessError(encoder.returncode, encode_cmd)
+        finally:
+            for process in (decoder, encoder):
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            for blocks in slots:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+    logging.info(f"Keyed {frames} frames with numpy on {workers} workers")
+    return frames
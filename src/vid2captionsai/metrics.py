@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+
+# Prometheus metrics of the textfile, by the job total they are rendered from
+TEXTFILE_METRICS = [
+    ("jobs", "vid2captionsai_jobs_total", "counter", "Finished jobs."),
+    (
+        "wall_seconds",
+        "vid2captionsai_wall_seconds_total",
+        "counter",
+        "Wall time of finished jobs.",
+    ),
+    (
+        "cpu_seconds",
+        "vid2captionsai_cpu_seconds_total",
+        "counter",
+        "CPU time of the ffmpeg processes of finished jobs.",
+    ),
+    (
+        "media_seconds",
+        "vid2captionsai_media_seconds_total",
+        "counter",
+        "Media seconds encoded.",
+    ),
+    ("frames", "vid2captionsai_frames_total", "counter", "Frames encoded."),
+    (
+        "output_bytes",
+        "vid2captionsai_output_bytes_total",
+        "counter",
+        "Bytes of finished outputs.",
+    ),
+    (
+        "last_realtime_factor",
+        "vid2captionsai_last_realtime_factor",
+        "gauge",
+        "Media seconds per wall second of the last job.",
+    ),
+    (
+        "last_peak_rss_bytes",
+        "vid2captionsai_last_peak_rss_bytes",
+        "gauge",
+        "Peak RSS of the largest ffmpeg process of the last job.",
+    ),
+    (
+        "last_timestamp",
+        "vid2captionsai_last_success_timestamp_seconds",
+        "gauge",
+        "Unix time the last job finished.",
+    ),
+]
+
+
+def job_record(
+    method: str,
+    input_path: Path | str,
+    output_path: Path | str | list[Path],
+    media_seconds: float,
+    wall_seconds: float,
+    processes: list[dict],
+) -> dict:
+    """
+    Sums the records of the ffmpeg processes of one job into the job record.
+
+    Args:
+        method (str): The command, e.g. "blank" or "mask".
+        input_path (Path | str): The input file, or a stream.
+        output_path (Path | str | list[Path]): The output file, stdout, or the output
+            files of one ffmpeg run.
+        media_seconds (float): The media duration of the output.
+        wall_seconds (float): The wall time of the whole job.
+        processes (list[dict]): The records of `runner.run_ffmpeg`.
+
+    Returns:
+        dict: The job record.
+    """
+    outputs = output_path if isinstance(output_path, list) else [output_path]
+    if all(isinstance(path, Path) for path in outputs):
+        output_bytes = sum(path.stat().st_size for path in outputs if path.exists())
+    else:
+        # Streamed, as counted by ffmpeg
+        output_bytes = sum(p["output_bytes"] for p in processes)
+    # Remuxing copies frames that were already counted when they were encoded
+    frames = sum(p["frames"] for p in processes if not p.get("stream_copy"))
+    # Processes grouped by the first word of their label, e.g. "mask" or "concat"
+    stages = {}
+    for process in processes:
+        stage = stages.setdefault(
+            process["label"].split()[0],
+            {"processes": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0},
+        )
+        stage["processes"] += 1
+        stage["wall_seconds"] = round(
+            stage["wall_seconds"] + process["wall_seconds"], 3
+        )
+        stage["cpu_seconds"] = round(stage["cpu_seconds"] + process["cpu_seconds"], 3)
+    return {
+        "timestamp": round(time.time(), 3),
+        "method": method,
+        "input": str(input_path),
+        "output": (
+            [str(path) for path in outputs]
+            if isinstance(output_path, list)
+            else str(output_path)
+        ),
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(sum(p["cpu_seconds"] for p in processes), 3),
+        "media_seconds": round(media_seconds, 3),
+        "realtime_factor": (
+            round(media_seconds / wall_seconds, 3) if wall_seconds else 0
+        ),
+        "frames": frames,
+        "fps": round(frames / wall_seconds, 2) if wall_seconds else 0,
+        "output_bytes": output_bytes,
+        "peak_rss_bytes": max((p["peak_rss_bytes"] for p in processes), default=0),
+        "processes": len(processes),
+        "stages": stages,
+    }
+
+
+def summary(record: dict) -> str:
+    """
+    Describes the size and speed of a finished job in one line.
+
+    Args:
+        record (dict): The job record of `job_record`.
+
+    Returns:
+        str: The output size and bitrate, the wall and CPU time, and the peak RSS.
+    """
+    kbits = record["output_bytes"] * 8 / max(record["media_seconds"], 1e-9) / 1e3
+    return (
+        f"Encoded {record['output_bytes'] / 1e6:.2f} MB ({kbits:.0f} kbit/s)"
+        f" in {record['wall_seconds']:.2f} s"
+        f" ({record['realtime_factor']:.1f}x realtime,"
+        f" {record['cpu_seconds']:.1f} s CPU,"
+        f" peak RSS {record['peak_rss_bytes'] >> 20} MiB): {record['output']}"
+    )
+
+
+def append_jsonl(path: str | Path, record: dict):
+    """Appends a record as one JSON line, locked against concurrent writers."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps(record) + "\n")
+
+
+def render_textfile(totals: list[dict]) -> str:
+    """
+    Renders job totals in the Prometheus text exposition format.
+
+    Args:
+        totals (list[dict]): One dict per method with the keys of TEXTFILE_METRICS.
+
+    Returns:
+        str: The textfile contents.
+    """
+    lines = []
+    for key, name, kind, help_text in TEXTFILE_METRICS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{method="{t["method"]}"}} {t[key]}' for t in totals]
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str | Path, totals: list[dict]):
+    """
+    Writes job totals as a Prometheus textfile-collector file.
+
+    The file is renamed into place so the collector never reads half of it.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temp_path.write_text(render_textfile(totals))
+    os.replace(temp_path, path)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import json
+import shlex
+from pathlib import Path
+
+# Formats a plan can be written in
+FORMATS = ("json", "make", "ninja")
+
+
+def command_files(cmd: list) -> tuple[list[Path], list[Path]]:
+    """
+    Finds the files an ffmpeg command reads and writes.
+
+    Args:
+        cmd (list): The ffmpeg command, with the executable first and files as
+            Path objects.
+
+    Returns:
+        tuple[list[Path], list[Path]]: The files after ``-i`` options, and every
+        other file.
+    """
+    inputs = [arg for option, arg in zip(cmd, cmd[1:]) if option == "-i"]
+    inputs = [arg for arg in inputs if isinstance(arg, Path)]
+    outputs = [arg for arg in cmd[1:] if isinstance(arg, Path) and arg not in inputs]
+    return inputs, outputs
+
+
+def make_path(path: Path) -> str:
+    """Escapes a path for a Makefile target or prerequisite."""
+    return str(path).replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def ninja_path(path: Path) -> str:
+    """Escapes a path for a Ninja build statement."""
+    return str(path).replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+
+class Plan:
+    """
+    The ffmpeg commands of one or more jobs as a dependency graph.
+
+    The commands are recorded instead of run. Each step is one ffmpeg process
+    with the files it reads and writes. A step depends on the steps that write
+    the files it reads, e.g. the concat of segments on the segments. The
+    targets are the files no step reads.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def add(
+        self,
+        cmd: list,
+        label: str,
+        inputs: list[Path] | None = None,
+        outputs: list[Path] | None = None,
+    ):
+        """
+        Records one ffmpeg process.
+
+        The executable is recorded as ``ffmpeg``, to be found on the PATH of the
+        host that runs the step, and the Makefile and Ninja file let
+        ``FFMPEG`` override it.
+
+        Args:
+            cmd (list): The ffmpeg command.
+            label (str): What is being encoded.
+            inputs (list[Path] | None, optional): The files it reads. Defaults to
+                None (found by `command_files`).
+            outputs (list[Path] | None, optional): The files it writes. Defaults to
+                None (found by `command_files`).
+        """
+        found_inputs, found_outputs = command_files(cmd)
+        self.steps.append(
+            {
+                "label": label,
+                "command": ["ffmpeg"] + [str(arg) for arg in cmd[1:]],
+                "inputs": [str(path) for path in inputs or found_inputs],
+                "outputs": [str(path) for path in outputs or found_outputs],
+            }
+        )
+
+    def dependencies(self) -> list[list[int]]:
+        """
+        Returns the indices of the steps each step depends on.
+
+        Returns:
+            list[list[int]]: One sorted list per step.
+        """
+        writers = {
+            path: number
+            for number, step in enumerate(self.steps)
+            for path in step["outputs"]
+        }
+        return [
+            sorted({writers[path] for path in step["inputs"] if path in writers})
+            for step in self.steps
+        ]
+
+    def targets(self) -> list[str]:
+        """Returns the files that steps write and no step reads, in order."""
+        read = {path for step in self.steps for path in step["inputs"]}
+        return [
+            path for step in self.steps for path in step["outputs"] if path not in read
+        ]
+
+    def to_json(self) -> str:
+        """Renders the steps, their dependencies by index, and the targets as JSON."""
+        steps = [
+            dict(step, after=after)
+            for step, after in zip(self.steps, self.dependencies())
+        ]
+        return json.dumps({"steps": steps, "targets": self.targets()}, indent=2)
+
+    def to_make(self) -> str:
+        """
+        Renders the steps as a GNU Makefile.
+
+        Steps with several outputs use grouped targets (``&:``), which need GNU
+        make 4.3 or later. Make runs the steps whose outputs are older than
+        their inputs, with ``make FFMPEG=/path/to/ffmpeg`` to pick the binary.
+        """
+        lines = [
+            "# Generated by vid2captionsai plan",
+            "FFMPEG ?= ffmpeg",
+            ".DELETE_ON_ERROR:",
+            ".PHONY: all",
+            "all: " + " ".join(make_path(Path(p)) for p in self.targets()),
+        ]
+        for step in self.steps:
+            separator = " &:" if len(step["outputs"]) > 1 else ":"
+            lines += [
+                "",
+                f"# {step['label']}",
+                " ".join(make_path(Path(p)) for p in step["outputs"])
+                + separator
+                + "".join(" " + make_path(Path(p)) for p in step["inputs"]),
+                "\t$(FFMPEG) " + shlex.join(step["command"][1:]).replace("$", "$$"),
+            ]
+        return "\n".join(lines) + "\n"
+
+    def to_ninja(self) -> str:
+        """
+        Renders the steps as a Ninja build file.
+
+        Ninja runs the steps whose outputs are older than their inputs, or
+        whose command has changed since they last ran. The ``ffmpeg``
+        variable at the top picks the binary.
+        """
+        lines = [
+            "# Generated by vid2captionsai plan",
+            "ffmpeg = ffmpeg",
+            "",
+            "rule ffmpeg",
+            "  command = $ffmpeg $args",
+            "  description = $label",
+        ]
+        for step in self.steps:
+            lines += [
+                "",
+                "build "
+                + " ".join(ninja_path(Path(p)) for p in step["outputs"])
+                + ": ffmpeg"
+                + "".join(" " + ninja_path(Path(p)) for p in step["inputs"]),
+                "  args = " + shlex.join(step["command"][1:]).replace("$", "$$"),
+                "  label = " + step["label"].replace("$", "$$"),
+            ]
+        lines += [
+            "",
+            "default " + " ".join(ninja_path(Path(p)) for p in self.targets()),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def render(self, format: str) -> str:
+        """
+        Renders the plan in one of FORMATS.
+
+        Args:
+            format (str): "json", "make" or "ninja".
+
+        Returns:
+            str: The plan.
+
+        Raises:
+            ValueError: If the format is unknown.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown plan format: {format}")
+        return getattr(self, f"to_{format}")()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from fractions import Fraction
+from pathlib import Path
+
+from . import runner
+from .index import MetadataIndex
+
+
+@dataclass
+class MediaInfo:
+    """
+    Metadata of a media file, as reported by a single ``ffprobe`` call.
+
+    Attributes:
+        duration (float): Container duration in seconds.
+        fps (str): Exact rational frame rate of the first video stream, e.g.
+            "30000/1001".
+        width (int | None): Width of the first video stream in pixels.
+        height (int | None): Height of the first video stream in pixels.
+        video_codec (str | None): Codec name of the first video stream.
+        pix_fmt (str | None): Pixel format of the first video stream.
+        audio_codec (str | None): Codec name of the first audio stream.
+        sample_rate (int | None): Sample rate of the first audio stream in Hz.
+        channels (int | None): Channel count of the first audio stream.
+        audio_duration (float | None): Duration of the first audio stream in
+            seconds, if the container records it.
+        frames (int): Number of packets (frames) in the first video stream.
+        keyframes (list): Keyframes of the first video stream as
+            ``[frame_index, pts_time]`` pairs in presentation order.
+    """
+
+    duration: float
+    fps: str = "0/1"
+    width: int | None = None
+    height: int | None = None
+    video_codec: str | None = None
+    pix_fmt: str | None = None
+    audio_codec: str | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    audio_duration: float | None = None
+    frames: int = 0
+    keyframes: list = field(default_factory=list)
+
+    @property
+    def frame_rate(self) -> Fraction:
+        """Fraction: The exact frame rate."""
+        return Fraction(self.fps)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MediaInfo":
+        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+
+    @classmethod
+    def from_ffprobe(cls, data: dict) -> "MediaInfo":
+        """
+        Builds a MediaInfo from the JSON output of ``ffprobe -show_format
+        -show_streams -show_entries packet=stream_index,pts_time,flags``.
+
+        Args:
+            data (dict): The decoded ffprobe JSON.
+
+        Returns:
+            MediaInfo: The parsed metadata.
+        """
+        streams = data.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"), {})
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+        duration = data.get("format", {}).get("duration") or video.get("duration")
+
+        # Rank the video packets by timestamp so keyframe indices count frames
+        # in presentation rather than decode order
+        video_packets = sorted(
+            (float(p.get("pts_time", 0)), "K" in p.get("flags", ""))
+            for p in data.get("packets", [])
+            if p.get("stream_index") == video.get("index")
+            and p.get("pts_time") not in (None, "N/A")
+        )
+        keyframes = [
+            [index, round(pts_time, 6)]
+            for index, (pts_time, key) in enumerate(video_packets)
+            if key
+        ]
+        return cls(
+            duration=float(duration or 0),
+            fps=video.get("r_frame_rate", "0/1"),
+            width=video.get("width"),
+            height=video.get("height"),
+            video_codec=video.get("codec_name"),
+            pix_fmt=video.get("pix_fmt"),
+            audio_codec=audio.get("codec_name"),
+            sample_rate=int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+            channels=audio.get("channels"),
+            audio_duration=(
+                float(audio["duration"])
+                if audio.get("duration") not in (None, "N/A")
+                else None
+            ),
+            frames=len(video_packets),
+            keyframes=keyframes,
+        )
+
+
+def probe_command(
+    ffprobe_run: list, input_path: str | Path, packets: bool = True
+) -> list:
+    """
+    Builds the single ffprobe command that gathers everything MediaInfo needs.
+
+    Args:
+        ffprobe_run (list): The ffprobe executable followed by its global options.
+        input_path (str | Path): The media file to probe.
+        packets (bool, optional): Whether to list the packets for the frame count
+            and keyframes, which reads the whole file. Defaults to True.
+
+    Returns:
+        list: The complete ffprobe command.
+    """
+    return (
+        ffprobe_run
+        + ["-print_format", "json=compact=1", "-show_format", "-show_streams"]
+        + (["-show_entries", "packet=stream_index,pts_time,flags"] if packets else [])
+        + ["-i", input_path]
+    )
+
+
+def probe(
+    ffprobe_run: list,
+    input_path: str | Path,
+    index: MetadataIndex | None = None,
+    packets: bool = True,
+) -> MediaInfo:
+    """
+    Probes a media file, consulting the metadata index first.
+
+    Args:
+        ffprobe_run (list): The ffprobe executable followed by its global options.
+        input_path (str | Path): The media file to probe.
+        index (MetadataIndex | None, optional): The index to look up and store
+            results in. Defaults to None (always run ffprobe).
+        packets (bool, optional): Whether to list the packets, see `probe_command`.
+            Defaults to True.
+
+    Returns:
+        MediaInfo: The media metadata.
+    """
+    if index:
+        cached = index.get_probe(input_path)
+        # Metadata probed without the packets has no frame count or keyframes
+        if cached and (cached.get("frames") or not packets):
+            logging.info(f"Using indexed metadata for: {input_path}")
+            return MediaInfo.from_dict(cached)
+    result = runner.run(
+        probe_command(ffprobe_run, input_path, packets),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    info = MediaInfo.from_ffprobe(json.loads(result.stdout))
+    if index:
+        index.put_probe(input_path, info.to_dict())
+    return info
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds between two progress reports of ffmpeg
+PROGRESS_PERIOD = 0.5
+
+# ffmpeg output URLs that write to stdout
+STDOUT_URLS = {"pipe:1", "pipe:", "-"}
+
+
+class ProcessScope:
+    """
+    The child processes started on behalf of one call, so they can be killed together.
+
+    A scope is made current with `process_scope`. `cancel` kills every
+    process of the scope, and every process that is started after it, so the
+    call fails fast and cleans up its partial outputs on the way out.
+    """
+
+    def __init__(self):
+        self.processes = set()
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def add(self, process: subprocess.Popen):
+        with self._lock:
+            self.processes.add(process)
+            if self.cancelled:
+                process.kill()
+
+    def discard(self, process: subprocess.Popen):
+        with self._lock:
+            self.processes.discard(process)
+
+    def cancel(self):
+        """Kills every process of the scope, now and later."""
+        with self._lock:
+            self.cancelled = True
+            for process in self.processes:
+                if process.poll() is None:
+                    process.kill()
+
+
+# The process scope of the current call, if it can be cancelled
+process_scope: ContextVar[ProcessScope | None] = ContextVar(
+    "process_scope", default=None
+)
+
+
+@contextmanager
+def tracked(process: subprocess.Popen):
+    """Adds a child process to the current process scope while it runs."""
+    scope = process_scope.get()
+    if scope:
+        scope.add(process)
+    try:
+        yield process
+    finally:
+        if scope:
+            scope.discard(process)
+
+
+def run(cmd: list, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Runs a command like `subprocess.run`, tracked by the current process scope.
+
+    Args:
+        cmd (list): The command.
+        **kwargs: Options of `subprocess.run`.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process.
+    """
+    if not process_scope.get():
+        return subprocess.run(cmd, **kwargs)
+    check = kwargs.pop("check", False)
+    if kwargs.pop("capture_output", False):
+        kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with subprocess.Popen(cmd, **kwargs) as process, tracked(process):
+        stdout, stderr = process.communicate()
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def format_eta(seconds: float | None) -> str:
+    """Formats a number of seconds as H:MM:SS, or "?" if it is unknown."""
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+
+
+class Progress:
+    """
+    Parses ffmpeg's ``-progress`` key=value stream and reports it.
+
+    Args:
+        label (str): What is being encoded, shown in the progress line.
+        duration (float | None): Media seconds the process will write, for the ETA.
+    """
+
+    def __init__(self, label: str, duration: float | None = None):
+        self.label = label
+        self.duration = duration
+        self.values = {}
+        self.start = time.monotonic()
+        self.show = sys.stderr.isatty()
+
+    @property
+    def frames(self) -> int:
+        """int: Frames written so far."""
+        return int(self.values.get("frame", 0) or 0)
+
+    @property
+    def out_time(self) -> float:
+        """float: Media seconds written so far."""
+        # out_time_ms holds microseconds as well, in older ffmpeg versions only
+        value = self.values.get("out_time_us") or self.values.get("out_time_ms")
+        try:
+            return max(0.0, int(value) / 1e6)
+        except (TypeError, ValueError):
+            return 0.0
+
+    @property
+    def total_size(self) -> int:
+        """int: Bytes written so far, or 0 if the muxer does not tell, like tee."""
+        try:
+            return int(self.values.get("total_size", 0))
+        except ValueError:
+            return 0
+
+    @property
+    def speed(self) -> float | None:
+        """float | None: Media seconds written per second, or None if not known yet."""
+        elapsed = time.monotonic() - self.start
+        return self.out_time / elapsed if elapsed > 0 and self.out_time else None
+
+    @property
+    def eta(self) -> float | None:
+        """float | None: Seconds until the process is done, or None if not known."""
+        if not self.duration or not self.speed:
+            return None
+        return max(0.0, self.duration - self.out_time) / self.speed
+
+    def line(self) -> str:
+        """str: The progress line with frame, fps, speed and ETA."""
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        speed = f"{self.speed:.2f}x" if self.speed else "?"
+        return (
+            f"{self.label}: frame={self.frames} fps={self.frames / elapsed:.1f}"
+            f" speed={speed} ETA {format_eta(self.eta)}"
+        )
+
+    def feed(self, line: str):
+        """Takes one line of the progress stream."""
+        key, _, value = line.strip().partition("=")
+        if not key:
+            return
+        self.values[key] = value.strip()
+        if key == "progress" and self.show:
+            end = "\n" if value.strip() == "end" else ""
+            print(f"\r{self.line()}\033[K", end=end, file=sys.stderr, flush=True)
+
+    def read(self, stream):
+        """Reads the progress stream until ffmpeg closes it."""
+        for line in stream:
+            self.feed(line)
+
+
+def run_ffmpeg(
+    cmd: list,
+    label: str = "ffmpeg",
+    duration: float | None = None,
+    output_path: str | os.PathLike | None = None,
+) -> dict:
+    """
+    Runs ffmpeg with live progress and measures the process.
+
+    ffmpeg writes its ``-progress`` stream to stdout, which also passes through
+    wrapper scripts such as ``static_ffmpeg``. A command that writes its
+    output to stdout (``pipe:1``) keeps the stdout of this process, and the
+    progress stream goes to a pipe of its own. The process is reaped with
+    ``os.wait4`` to get the resource usage of exactly this process.
+
+    Args:
+        cmd (list): The ffmpeg executable followed by its options.
+        label (str, optional): What is being encoded, for the progress line. Defaults to
+            "ffmpeg".
+        duration (float | None, optional): Media seconds the process will write, for the
+            ETA. Defaults to None.
+        output_path (str | os.PathLike | None, optional): The output file, for its size.
+            Defaults to None.
+
+    Returns:
+        dict: The process record with its wall_seconds, cpu_seconds,
+        peak_rss_bytes, frames, media_seconds and output_bytes.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    progress = Progress(label, duration)
+    if str(cmd[-1]) in STDOUT_URLS:
+        read_fd, write_fd = os.pipe()
+        try:
+            process = subprocess.Popen(
+                [cmd[0], "-progress", f"pipe:{write_fd}"]
+                + ["-stats_period", str(PROGRESS_PERIOD)]
+                + list(cmd[1:]),
+                pass_fds=(write_fd,),
+                text=True,
+            )
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        stream = open(read_fd)
+    else:
+        process = subprocess.Popen(
+            [cmd[0], "-progress", "pipe:1", "-stats_period", str(PROGRESS_PERIOD)]
+            + list(cmd[1:]),
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        stream = process.stdout
+    with stream, tracked(process):
+        reader = threading.Thread(target=progress.read, args=(stream,), daemon=True)
+        reader.start()
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        process.returncode = os.waitstatus_to_exitcode(status)
+        reader.join()
+    wall = time.monotonic() - progress.start
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    record = {
+        "label": label,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_bytes": usage.ru_maxrss * 1024,
+        "frames": progress.frames,
+        "media_seconds": round(progress.out_time, 3),
+        "output_bytes": (
+            os.path.getsize(output_path)
+            if output_path and os.path.exists(output_path)
+            else progress.total_size
+        ),
+    }
+    logging.info(
+        f"{label}: {record['frames']} frames in {record['wall_seconds']} s,"
+        f" {record['cpu_seconds']} s CPU, peak RSS {record['peak_rss_bytes'] >> 20} MiB"
+    )
+    return record
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import json
+import math
+import os
+from pathlib import Path
+
+
+def split_at_keyframes(keyframes: list, frames: int, count: int) -> list[list[int]]:
+    """
+    Splits a video into about equally long segments that start at keyframes.
+
+    A segment that starts at a keyframe decodes from its first frame without
+    running through frames of the previous segment first.
+
+    Args:
+        keyframes (list): ``[frame_index, pts_time]`` pairs of the keyframes.
+        frames (int): Total number of frames.
+        count (int): The wanted number of segments.
+
+    Returns:
+        list[list[int]]: ``[first_frame, end_frame]`` pairs, end exclusive,
+        covering every frame. Fewer than ``count`` if there are not enough keyframes.
+    """
+    starts = sorted({int(frame) for frame, _ in keyframes if 0 < frame < frames})
+    cuts = []
+    for number in range(1, count):
+        candidates = [start for start in starts if not cuts or start > cuts[-1]]
+        if not candidates:
+            break
+        target = frames * number / count
+        cuts.append(min(candidates, key=lambda start: abs(start - target)))
+    boundaries = [0] + cuts + [frames]
+    return [
+        [start, end] for start, end in zip(boundaries, boundaries[1:]) if end > start
+    ]
+
+
+def split_by_duration(
+    keyframes: list, frames: int, frame_rate, seconds: float
+) -> list[list[int]]:
+    """
+    Splits a video into segments of about a given duration that start at keyframes.
+
+    Args:
+        keyframes (list): ``[frame_index, pts_time]`` pairs of the keyframes.
+        frames (int): Total number of frames.
+        frame_rate (Fraction): Frames per second.
+        seconds (float): The wanted duration of a segment.
+
+    Returns:
+        list[list[int]]: ``[first_frame, end_frame]`` pairs, as `split_at_keyframes`.
+    """
+    count = max(1, math.ceil(frames / frame_rate / seconds))
+    return split_at_keyframes(keyframes, frames, count)
+
+
+def journal_path(output_path: Path) -> Path:
+    """Names the journal of the finished segments of an output."""
+    return output_path.with_name(f".{output_path.name}.journal.json")
+
+
+def read_journal(path: Path, key: str) -> dict:
+    """
+    Reads the finished segments of a journal that are still on disk as they were
+    written.
+
+    Args:
+        path (Path): The journal file.
+        key (str): The cache key of the output. A journal of another key (other inputs
+            or options) is ignored.
+
+    Returns:
+        dict: The journal entries by ``"first_frame:end_frame"``, each with the
+        segment "path", its "frames", and its "size" and "mtime_ns" when it was
+        finished.
+    """
+    try:
+        journal = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    if journal.get("key") != key:
+        return {}
+    finished = {}
+    for name, entry in journal["segments"].items():
+        try:
+            stat = Path(entry["path"]).stat()
+        except OSError:
+            continue
+        if (stat.st_size, stat.st_mtime_ns) == (entry["size"], entry["mtime_ns"]):
+            finished[name] = entry
+    return finished
+
+
+def read_analysis(path: Path, key: str) -> dict | None:
+    """
+    Reads the analysis results a journal recorded before its segments, e.g. the crop.
+
+    Args:
+        path (Path): The journal file.
+        key (str): The cache key of the output. A journal of another key is ignored.
+
+    Returns:
+        dict | None: The options the analysis gave to every segment, or None if
+        there is no journal of this key or it has no analysis.
+    """
+    try:
+        journal = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if journal.get("key") != key:
+        return None
+    return journal.get("analysis")
+
+
+def write_journal(path: Path, key: str, finished: dict, analysis: dict | None = None):
+    """
+    Replaces a journal with the given finished segments, atomically.
+
+    Args:
+        path (Path): The journal file.
+        key (str): The cache key of the output.
+        finished (dict): The entries as returned by `read_journal`.
+        analysis (dict | None, optional): The options the analysis gave to every
+            segment, as returned by `read_analysis`. Defaults to None.
+    """
+    partial = path.with_name(f"{path.name}.partial")
+    partial.write_text(
+        json.dumps({"key": key, "analysis": analysis, "segments": finished}, indent=2)
+    )
+    os.replace(partial, path)
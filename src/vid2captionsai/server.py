@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+
+import contextlib
+import heapq
+import http.client
+import http.server
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from .batch import available_cpus, plan_workers, run_job
+
+# Methods the server runs jobs of
+JOB_METHODS = ("blank", "mask")
+
+# Job states that do not change any more
+FINISHED = ("done", "failed", "cancelled")
+
+# Seconds a cancelled job gets to clean up before it is killed
+CANCEL_GRACE = 5.0
+
+# Finished jobs kept for status queries; older ones are forgotten
+KEEP_FINISHED = 1000
+
+# Seconds between two status polls of a waiting client
+POLL_PERIOD = 0.5
+
+
+@dataclass
+class Job:
+    """
+    A job of the server queue.
+
+    Attributes:
+        method (str): "blank" or "mask".
+        input (str): The input file.
+        kwargs (dict): Keyword arguments for the method.
+        priority (int): Jobs with a higher priority run first, equal ones in order.
+        id (str): The job id.
+        status (str): "queued", "running", "cancelling", "done", "failed" or
+            "cancelled".
+        submitted (float): Unix time the job was queued.
+        started (float | None): Unix time the job started.
+        finished (float | None): Unix time the job finished.
+        output (str | None): The output file of a done job.
+        error (str | None): Why the job failed.
+        seconds (float | None): Run time of the job.
+    """
+
+    method: str
+    input: str
+    kwargs: dict = field(default_factory=dict)
+    priority: int = 0
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    output: str | None = None
+    error: str | None = None
+    seconds: float | None = None
+
+    def to_dict(self) -> dict:
+        """dict: The job as a JSON-serializable dict."""
+        return asdict(self)
+
+
+def validate_job(method: str, input_path: str, kwargs: dict):
+    """
+    Checks that a job names a server method and fits its signature.
+
+    Raises:
+        ValueError: If the method is unknown or the arguments do not fit it.
+    """
+    from .vid2captionsai import PrepAudioVideo
+
+    if method not in JOB_METHODS:
+        raise ValueError(f"Unknown method: {method}. Use one of {JOB_METHODS}.")
+    try:
+        inspect.signature(getattr(PrepAudioVideo, method)).bind(
+            None, input_path, **kwargs
+        )
+    except TypeError as e:
+        raise ValueError(f"Invalid arguments for {method}: {e}") from e
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _job_process(init_kwargs: dict, method: str, input_path: str, kwargs: dict, conn):
+    """
+    Runs one job in a process of its own and sends its result through conn.
+
+    The process leads its own process group, so cancelling the job also stops
+    its ffmpeg processes, and it turns SIGTERM into SystemExit, so partial
+    outputs are removed on the way out.
+    """
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    conn.send(run_job(init_kwargs, method, Path(input_path), kwargs))
+    conn.close()
+
+
+class JobQueue:
+    """
+    A priority queue of jobs run on a fixed number of worker threads.
+
+    Every job runs in a process forked from a forkserver that has the package
+    already imported, so a job pays neither interpreter startup nor imports,
+    and a cancelled job can be stopped with its ffmpeg processes.
+
+    Args:
+        init_kwargs (dict): Keyword arguments for the PrepAudioVideo constructor of
+            every job.
+        workers (int | None, optional): The number of concurrent jobs. Defaults to None
+            (one per 4 CPUs).
+    """
+
+    def __init__(self, init_kwargs: dict, workers: int | None = None):
+        self.workers, threads = plan_workers(workers or available_cpus(), workers)
+        self.init_kwargs = {
+            **init_kwargs,
+            "threads": init_kwargs.get("threads") or threads,
+        }
+        self.jobs = {}
+        self._heap = []
+        self._processes = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(["vid2captionsai.vid2captionsai"])
+
+    def start(self):
+        """Starts the worker threads."""
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"worker-{number}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logging.info(
+            f"Running jobs on {self.workers} workers"
+            f" x {self.init_kwargs['threads']} threads"
+        )
+
+    def submit(
+        self, method: str, input_path: str, kwargs: dict, priority: int = 0
+    ) -> Job:
+        """
+        Queues a job.
+
+        Args:
+            method (str): "blank" or "mask".
+            input_path (str): The input file.
+            kwargs (dict): Keyword arguments for the method.
+            priority (int, optional): Jobs with a higher priority run first. Defaults to
+                0.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            ValueError: If the method or its arguments are invalid.
+        """
+        validate_job(method, input_path, kwargs)
+        job = Job(method, str(input_path), kwargs, int(priority))
+        with self._condition:
+            self.jobs[job.id] = job
+            heapq.heappush(self._heap, (-job.priority, job.submitted, job.id))
+            self._forget_finished()
+            self._condition.notify()
+        logging.info(f"Queued {job.method} job {job.id}: {job.input}")
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """
+        Returns a job by its id.
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        with self._condition:
+            return self.jobs[job_id]
+
+    def list(self) -> list[Job]:
+        """list[Job]: All known jobs, oldest first."""
+        with self._condition:
+            return sorted(self.jobs.values(), key=lambda job: job.submitted)
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        Cancels a queued or running job. Finished jobs stay as they are.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            Job: The job.
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        with self._condition:
+            job = self.jobs[job_id]
+            if job.status == "queued":
+                job.status, job.finished = "cancelled", time.time()
+            elif job.status == "running":
+                # The worker sees this when the process ends
+                job.status = "cancelling"
+                process = self._processes.get(job_id)
+                if process:
+                    threading.Thread(
+                        target=self._stop, args=(process,), daemon=True
+                    ).start()
+        logging.info(f"Cancelled job {job_id}")
+        return job
+
+    def stop(self):
+        """Cancels every queued and running job and stops the workers."""
+        with self._condition:
+            self._stopping = True
+            pending = [
+                job.id
+                for job in self.jobs.values()
+                if job.status in ("queued", "running")
+            ]
+            self._condition.notify_all()
+        for job_id in pending:
+            self.cancel(job_id)
+        for thread in self._threads:
+            thread.join()
+
+    def _forget_finished(self):
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        for job in sorted(finished, key=lambda job: job.finished)[:-KEEP_FINISHED]:
+            del self.jobs[job.id]
+
+    def _next(self) -> Job | None:
+        with self._condition:
+            while True:
+                if self._stopping:
+                    return None
+                while self._heap:
+                    job = self.jobs.get(heapq.heappop(self._heap)[2])
+                    if job and job.status == "queued":
+                        job.status, job.started = "running", time.time()
+                        return job
+                self._condition.wait()
+
+    def _work(self):
+        while job := self._next():
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=_job_process,
+                args=(self.init_kwargs, job.method, job.input, job.kwargs, sender),
+                name=f"job-{job.id}",
+            )
+            process.start()
+            sender.close()
+            with self._condition:
+                self._processes[job.id] = process
+                if job.status == "cancelling":
+                    threading.Thread(
+                        target=self._stop, args=(process,), daemon=True
+                    ).start()
+            try:
+                result = receiver.recv()
+            except EOFError:
+                # The process ended without a result: cancelled or crashed
+                result = None
+            receiver.close()
+            process.join()
+            with self._condition:
+                del self._processes[job.id]
+                job.finished = time.time()
+                job.seconds = round(job.finished - job.started, 3)
+                if job.status == "cancelling":
+                    job.status = "cancelled"
+                elif result and result["ok"]:
+                    job.status, job.output = "done", result["output"]
+                else:
+                    job.status = "failed"
+                    job.error = (
+                        result["error"]
+                        if result
+                        else f"Job process exited with {process.exitcode}"
+                    )
+            logging.info(f"Job {job.id} {job.status} in {job.seconds} s")
+
+    @staticmethod
+    def _stop(process):
+        """Stops a job and its ffmpeg processes, killing them after a grace period."""
+        for sig, wait in [(signal.SIGTERM, CANCEL_GRACE), (signal.SIGKILL, None)]:
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                # The process may not lead its group yet, or be gone already
+                with contextlib.suppress(ProcessLookupError):
+                    os.kill(process.pid, sig)
+            process.join(wait)
+            if process.exitcode is not None:
+                return
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    The JSON API of the server.
+
+    ``POST /jobs`` queues a job from a ``{"method", "input", "kwargs",
+    "priority"}`` body, ``GET /jobs`` lists the jobs, ``GET /jobs/<id>``
+    returns one and ``DELETE /jobs/<id>`` cancels it.
+    """
+
+    queue: JobQueue = None
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+    def _reply(self, status: int, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self) -> str | None:
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/jobs":
+            return self._reply(200, [job.to_dict() for job in self.queue.list()])
+        try:
+            self._reply(200, self.queue.get(self._job_id()).to_dict())
+        except KeyError:
+            self._reply(404, {"error": f"No such job: {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._reply(404, {"error": f"Not found: {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            job = self.queue.submit(
+                body["method"],
+                body["input"],
+                body.get("kwargs") or {},
+                body.get("priority", 0),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return self._reply(400, {"error": f"Invalid job: {e}"})
+        self._reply(201, job.to_dict())
+
+    def do_DELETE(self):
+        try:
+            self._reply(200, self.queue.cancel(self._job_id()).to_dict())
+        except KeyError:
+            self._reply(404, {"error": f"No such job: {self.path}"})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """An HTTP server on a Unix socket, one thread per request."""
+
+    daemon_threads = True
+
+
+def parse_address(address: str | Path) -> str | tuple[str, int]:
+    """
+    Parses a server address.
+
+    Args:
+        address (str | Path): A Unix socket path, or "host:port" or "port" for HTTP.
+
+    Returns:
+        str | tuple[str, int]: The socket path, or the host and port.
+    """
+    host, _, port = str(address).rpartition(":")
+    if port.isdigit() and "/" not in host:
+        return host or "127.0.0.1", int(port)
+    return str(Path(address).expanduser())
+
+
+def make_server(address: str | Path, queue: JobQueue) -> socketserver.BaseServer:
+    """
+    Creates the HTTP server of a job queue.
+
+    Raises:
+        RuntimeError: If another server is listening on the Unix socket already.
+    """
+    handler = type("QueueHandler", (Handler,), {"queue": queue})
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        return http.server.ThreadingHTTPServer(address, handler)
+    if os.path.exists(address):
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(address)
+                raise RuntimeError(f"A server is already listening on {address}")
+            except ConnectionRefusedError:
+                # Left over by a server that did not shut down
+                os.unlink(address)
+    Path(address).parent.mkdir(parents=True, exist_ok=True)
+    return UnixHTTPServer(address, handler)
+
+
+def serve(address: str | Path, init_kwargs: dict, workers: int | None = None):
+    """
+    Runs the job server until it is interrupted or terminated.
+
+    Args:
+        address (str | Path): A Unix socket path, or "host:port" or "port" for HTTP.
+        init_kwargs (dict): Keyword arguments for the PrepAudioVideo constructor of
+            every job.
+        workers (int | None, optional): The number of concurrent jobs. Defaults to None
+            (one per 4 CPUs).
+    """
+    queue = JobQueue(init_kwargs, workers)
+    server = make_server(address, queue)
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    queue.start()
+    logging.warning(f"Serving jobs on {address}")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        logging.warning("Stopping: cancelling queued and running jobs")
+    finally:
+        queue.stop()
+        server.server_close()
+        if isinstance(server, UnixHTTPServer):
+            Path(server.server_address).unlink(missing_ok=True)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP client connection over a Unix socket."""
+
+    def __init__(self, path: str, timeout: float = 30):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def request(address: str | Path, verb: str, path: str, body: dict | None = None):
+    """
+    Sends one request to the job server.
+
+    Args:
+        address (str | Path): A Unix socket path, or "host:port" or "port" for HTTP.
+        verb (str): The HTTP method.
+        path (str): The request path, e.g. "/jobs".
+        body (dict | None, optional): The JSON body. Defaults to None.
+
+    Returns:
+        The decoded JSON reply.
+
+    Raises:
+        RuntimeError: If the server rejects the request.
+    """
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        connection = http.client.HTTPConnection(*address, timeout=30)
+    else:
+        connection = UnixHTTPConnection(address)
+    try:
+        data = json.dumps(body).encode() if body is not None else None
+        connection.request(
+            verb, path, data, {"Content-Type": "application/json"} if data else {}
+        )
+        response = connection.getresponse()
+        reply = json.loads(response.read())
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise RuntimeError(reply.get("error", f"HTTP {response.status}"))
+    return reply
+
+
+def wait(address: str | Path, job_id: str) -> dict:
+    """
+    Polls a job until it is finished. Interrupting the wait cancels the job.
+
+    Args:
+        address (str | Path): The server address.
+        job_id (str): The job id.
+
+    Returns:
+        dict: The finished job.
+    """
+    try:
+        while True:
+            job = request(address, "GET", f"/jobs/{job_id}")
+            if job["status"] in FINISHED:
+                return job
+            time.sleep(POLL_PERIOD)
+    except KeyboardInterrupt:
+        request(address, "DELETE", f"/jobs/{job_id}")
+        raise
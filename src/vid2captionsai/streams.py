@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+
+# The command line name of stdin and stdout
+STDIO = "-"
+
+# ffmpeg's names for stdin and stdout
+STDIN = "pipe:0"
+STDOUT = "pipe:1"
+
+# URL schemes ffmpeg reads itself, as a stream it cannot seek in reliably
+REMOTE_SCHEMES = {"http", "https"}
+
+# Write every keyframe as a fragment after an empty header, so the MP4 or
+# MOV muxer never has to seek back to write the index
+FRAGMENTED_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+# Muxer options for output to a pipe, by container name
+STREAM_CONTAINERS = {
+    "mp4": ["-f", "mp4", "-movflags", FRAGMENTED_MOVFLAGS],
+    "mov": ["-f", "mov", "-movflags", FRAGMENTED_MOVFLAGS],
+    "mkv": ["-f", "matroska"],
+    "webm": ["-f", "webm"],
+    "nut": ["-f", "nut"],
+}
+
+
+def parse_source(source: str | Path) -> Path | str:
+    """
+    Parses an input given on the command line.
+
+    Args:
+        source (str | Path): A file path, a ``file://`` URL, an ``http(s)://`` URL or
+            "-" for stdin.
+
+    Returns:
+        Path | str: The resolved file path, or the ffmpeg URL of a stream
+        (STDIN or the URL itself).
+    """
+    if isinstance(source, Path):
+        return source.resolve()
+    if source == STDIO:
+        return STDIN
+    url = urlparse(source)
+    if url.scheme == "file":
+        return Path(url2pathname(url.path)).resolve()
+    if url.scheme in REMOTE_SCHEMES:
+        return source
+    return Path(source).resolve()
+
+
+def is_stream(source: Path | str) -> bool:
+    """Tells a stream (stdin, stdout or a URL) from a file parsed by `parse_source`."""
+    return not isinstance(source, Path)
+
+
+def source_name(source: Path | str) -> str:
+    """
+    Names an input for progress lines and default output names.
+
+    Args:
+        source (Path | str): The result of `parse_source`.
+
+    Returns:
+        str: The file name, the last part of a URL path, or "stdin".
+    """
+    if source == STDIN:
+        return "stdin"
+    if is_stream(source):
+        return Path(unquote(urlparse(source).path)).name or urlparse(source).hostname
+    return source.name
+
+
+def muxer_options(target: Path | str, container: str) -> list:
+    """
+    Returns the ffmpeg options that make an output streamable if it goes to stdout.
+
+    Args:
+        target (Path | str): The output file, or STDOUT.
+        container (str): The name of the container in STREAM_CONTAINERS.
+
+    Returns:
+        list: The muxer options for stdout, or none for a file, whose extension picks
+        the muxer.
+    """
+    return STREAM_CONTAINERS[container] if target == STDOUT else []
+
+
+def tee_target(slaves: list[tuple[str, str, Path]]) -> str:
+    """
+    Builds the output of ffmpeg's tee muxer, which writes the same encoded streams to
+    several files.
+
+    Args:
+        slaves (list[tuple[str, str, Path]]): The stream specifiers to select, the
+            format and the file of each output.
+
+    Returns:
+        str: The tee output, with the special characters of the file names escaped.
+    """
+    targets = []
+    for select, format_name, path in slaves:
+        escaped = "".join(f"\\{c}" if c in "\\'|[]" else c for c in str(path))
+        targets.append(f"[select=\\'{select}\\':f={format_name}]{escaped}")
+    return "|".join(targets)
@@ -1,10 +1,131 @@
 #!/usr/bin/env python3
 
+import contextlib
+import contextvars
+import json
 import logging
+import os
+import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from functools import cached_property
 from pathlib import Path
 
-import static_ffmpeg
+from . import __version__, activity, binaries, cache, metrics, runner, streams
+from .batch import cpu_budget, expand_inputs, plan_workers, run_batch
+from .index import MetadataIndex, default_cache_dir
+from .plans import FORMATS, Plan
+from .probe import MediaInfo, probe
+from .segments import (
+    journal_path,
+    read_analysis,
+    read_journal,
+    split_at_keyframes,
+    split_by_duration,
+    write_journal,
+)
+
+# Audio codecs the MP4 muxer can carry, so blank can copy them as they are
+MP4_AUDIO_CODECS = {"aac", "mp3", "alac", "ac3", "eac3", "opus", "flac"}
+
+# Audio encodings for blank, by the name of the audio mode
+AUDIO_ENCODINGS = {
+    "aac": ["-c:a", "aac"],
+    # Mono 16 kHz is all speech recognition needs and keeps uploads smallest
+    "speech": ["-c:a", "aac", "-ac", "1", "-ar", "16000", "-b:a", "32k"],
+}
+
+# x264 settings for a frame that never changes: every P-frame is all skip
+# blocks, so the fastest preset loses nothing and constant quality keeps the
+# single keyframe per GOP tiny
+STATIC_X264 = [
+    "-c:v",
+    "libx264",
+    "-preset",
+    "ultrafast",
+    "-tune",
+    "stillimage",
+    "-crf",
+    "30",
+    "-sc_threshold",
+    "0",
+]
+
+# Delivery encoders for composite, by codec name: the output extension and the
+# encoder settings. Both are 8-bit 4:2:0 in MP4, moved to the front for streaming
+COMPOSITE_CODECS = {
+    "h264": {
+        "ext": ".mp4",
+        "video": ["-c:v", "libx264", "-preset", "medium", "-crf", "18"],
+    },
+    "hevc": {
+        "ext": ".mp4",
+        # The hvc1 tag lets Apple players recognize the stream
+        "video": [
+            "-c:v",
+            "libx265",
+            "-preset",
+            "medium",
+            "-crf",
+            "22",
+            "-tag:v",
+            "hvc1",
+        ],
+    },
+}
+
+# Fastest x264 settings for previews, which are watched once and thrown away
+PREVIEW_X264 = ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"]
+
+# Methods whose ffmpeg commands `plan` can write out
+PLAN_METHODS = ("blank", "mask", "composite", "preview")
+
+# Pixels per square of the checkerboard behind previews
+CHECKER_SIZE = 16
+
+# Frame rate of a blank video when the input frame rate is unknown, as with stdin
+DEFAULT_FPS = "30"
+
+# Video encoding profiles for blank
+BLANK_PROFILES = {
+    "default": {"video": ["-c:v", "libx264"]},
+    "static": {"video": STATIC_X264, "gop_seconds": 300},
+    "static-half": {"video": STATIC_X264, "gop_seconds": 300, "scale": 0.5},
+}
+
+# Alpha-capable encoders for mask, by codec name: the output extension, the
+# pixel format keyed frames are encoded in, and the encoder settings
+MASK_CODECS = {
+    "prores": {
+        "ext": ".mov",
+        "pix_fmt": "yuva444p10le",
+        "video": ["-c:v", "prores_ks", "-profile:v", "4444"],
+    },
+    "prores-xq": {
+        "ext": ".mov",
+        "pix_fmt": "yuva444p10le",
+        "video": ["-c:v", "prores_ks", "-profile:v", "4444xq"],
+    },
+    "qtrle": {"ext": ".mov", "pix_fmt": "argb", "video": ["-c:v", "qtrle"]},
+    # Constant quality VP9; row multithreading is off by default
+    "vp9": {
+        "ext": ".webm",
+        "pix_fmt": "yuva420p",
+        "video": ["-c:v", "libvpx-vp9", "-crf", "30", "-b:v", "0", "-row-mt", "1"],
+    },
+    # Lossless, with slices so the encoder can use its threads
+    "ffv1": {
+        "ext": ".mkv",
+        "pix_fmt": "yuva444p",
+        "video": ["-c:v", "ffv1", "-level", "3", "-slices", "16"],
+    },
+    "png": {"ext": ".mov", "pix_fmt": "rgba", "video": ["-c:v", "png"]},
+}
 
 
 def setup_logging(verbose: bool = False):
@@ -28,6 +149,92 @@ def setup_logging(verbose: bool = False):
     return ffmpeg_level
 
 
+def colorkey_filter(color: str, tolerance: float) -> str:
+    """
+    Returns the ffmpeg filter that keys out a color, used by mask and composite.
+
+    Args:
+        color (str): Color to be masked in hexadecimal format.
+        tolerance (float): Tolerance level for color matching, also used for the soft edge.
+
+    Returns:
+        str: The colorkey filter.
+    """
+    return f"colorkey=color=0x{color}:similarity={tolerance}:blend={tolerance}"
+
+
+def dedup_filter(frames: int, frame_rate: Fraction) -> str:
+    """
+    Returns the ffmpeg filters that drop input frames that repeat the frame before them.
+
+    mpdecimate compares each frame with the last one it kept, in 8x8 blocks,
+    and drops near-identical ones, so the kept frames keep their timestamps
+    and each is held until the next one. The last frame is always kept, and
+    a copy of it one frame later marks the end of the source, so the held
+    last frame lasts until then. The timestamps use the frame duration as
+    their time base, before and after interleave (which outputs
+    microseconds), so that MOV files get a timescale that QuickTime can
+    play.
+
+    Args:
+        frames (int): The number of input frames.
+        frame_rate (Fraction): The input frame rate.
+
+    Returns:
+        str: The filters, with one unlabeled input and output.
+    """
+    time_base = f"settb={frame_rate.denominator}/{frame_rate.numerator}"
+    return (
+        f"{time_base},split[all][last];[all]mpdecimate=max=0[unique];"
+        f"[last]trim=start_frame={frames - 1},tpad=stop=1:stop_mode=clone[end];"
+        f"[unique][end]interleave,{time_base}"
+    )
+
+
+def variant_path(output_path: Path, variant: dict) -> Path:
+    """
+    Names the file of a blank or mask video variant after the settings it overrides.
+
+    Args:
+        output_path (Path): The output file without variants.
+        variant (dict): The color, tolerance, width, height, fps or profile of the variant.
+
+    Returns:
+        Path: E.g. ``talk-blank-00FF00-1080x1920.mp4`` or ``talk-mask-t0.05.mov``, or output_path if the variant overrides nothing.
+    """
+    parts = []
+    if "color" in variant:
+        parts.append(str(variant["color"]))
+    if "tolerance" in variant:
+        parts.append(f"t{variant['tolerance']}")
+    if "width" in variant or "height" in variant:
+        parts.append(f"{variant.get('width', '')}x{variant.get('height', '')}")
+    if "fps" in variant:
+        parts.append(f"{str(variant['fps']).replace('/', '_')}fps")
+    if "profile" in variant:
+        parts.append(variant["profile"])
+    if not parts:
+        return output_path
+    return output_path.with_stem(f"{output_path.stem}-{'-'.join(parts)}")
+
+
+def stream_options(options: list, stream: str) -> list:
+    """
+    Limits encoding options to one output stream.
+
+    Args:
+        options (list): Pairs of option names and values, e.g. ``["-c:v", "libx264", "-crf", "30"]``.
+        stream (str): The output stream specifier, e.g. "v:1".
+
+    Returns:
+        list: The options with the stream specifier, e.g. ``["-c:v:1", "libx264", "-crf:v:1", "30"]``.
+    """
+    limited = []
+    for name, value in zip(options[::2], options[1::2]):
+        limited += [f"{name.split(':')[0]}:{stream}", value]
+    return limited
+
+
 class PrepAudioVideo:
     """
     A class for preparing audio and video files.
@@ -36,12 +243,20 @@ class PrepAudioVideo:
         ffmpeg_path (str | Path | None): The path to the ffmpeg executable. If None, the default system path will be used.
         ffprobe_path (str | Path | None): The path to the ffprobe executable. If None, the default system path will be used.
         verbose (bool): Whether to enable verbose logging. Defaults to False.
+        cache_dir (str | Path | None): Directory for the persistent metadata index. If None, the default user cache directory will be used.
+        threads (int | None): Number of threads each ffmpeg process may use. If None, the CPU budget of the process (affinity, cgroup quota or ``$VID2CAPTIONSAI_CPUS``).
+        decode_threads (int | None): Decoder threads per ffmpeg process. If None, threads.
+        filter_threads (int | None): Filter graph threads per ffmpeg process. If None, threads.
+        encode_threads (int | None): Encoder threads per ffmpeg process. If None, threads.
+        force (bool): Whether to encode even when an up-to-date output exists. Defaults to False.
+        metrics_path (str | Path | None): JSON lines file to append a record of every job to. Defaults to None.
+        textfile_path (str | Path | None): Prometheus textfile-collector file with the job totals. Defaults to None.
 
     Attributes:
         _ffmpeg_options (list): Options to be passed to the ffmpeg command.
         _ffprobe_options (list): Options to be passed to the ffprobe command.
-        _ffmpeg_path (Path): The resolved path to the ffmpeg executable.
-        _ffprobe_path (Path): The resolved path to the ffprobe executable.
+        _ffmpeg_path (Path): The resolved path to the ffmpeg executable, resolved on first use.
+        _ffprobe_path (Path): The resolved path to the ffprobe executable, resolved on first use.
         _ffmpeg_run (list): The complete ffmpeg command to be executed.
         _ffprobe_run (list): The complete ffprobe command to be executed.
     """
@@ -51,6 +266,14 @@ class PrepAudioVideo:
         ffmpeg_path: str | Path | None = None,
         ffprobe_path: str | Path | None = None,
         verbose: bool = False,
+        cache_dir: str | Path | None = None,
+        threads: int | None = None,
+        decode_threads: int | None = None,
+        filter_threads: int | None = None,
+        encode_threads: int | None = None,
+        force: bool = False,
+        metrics_path: str | Path | None = None,
+        textfile_path: str | Path | None = None,
     ):
         """
         Initializes the Vid2CaptionsAI object.
@@ -59,7 +282,28 @@ class PrepAudioVideo:
             ffmpeg_path (str | Path | None, optional): Path to the ffmpeg executable. Defaults to None.
             ffprobe_path (str | Path | None, optional): Path to the ffprobe executable. Defaults to None.
             verbose (bool, optional): Whether to enable verbose logging. Defaults to False.
+            cache_dir (str | Path | None, optional): Directory for the metadata index. Defaults to None.
+            threads (int | None, optional): Threads per ffmpeg process. Defaults to None.
+            decode_threads (int | None, optional): Decoder threads per ffmpeg process. Defaults to None.
+            filter_threads (int | None, optional): Filter graph threads per ffmpeg process. Defaults to None.
+            encode_threads (int | None, optional): Encoder threads per ffmpeg process. Defaults to None.
+            force (bool, optional): Encode even when an up-to-date output exists. Defaults to False.
+            metrics_path (str | Path | None, optional): JSON lines file to append a record of every job to. Defaults to None.
+            textfile_path (str | Path | None, optional): Prometheus textfile-collector file with the job totals. Defaults to None.
         """
+        self._init_kwargs = dict(
+            ffmpeg_path=ffmpeg_path,
+            ffprobe_path=ffprobe_path,
+            verbose=verbose,
+            cache_dir=cache_dir,
+            threads=threads,
+            decode_threads=decode_threads,
+            filter_threads=filter_threads,
+            encode_threads=encode_threads,
+            force=force,
+            metrics_path=metrics_path,
+            textfile_path=textfile_path,
+        )
         ffmpeg_level = setup_logging(verbose)
         self._ffmpeg_options = [
             "-nostdin",
@@ -68,45 +312,375 @@ class PrepAudioVideo:
             ffmpeg_level,
             "-y",
         ]
+        # Without explicit settings ffmpeg sizes every stage to the host cores,
+        # which oversubscribes a CPU quota or a share of a batch
+        if threads:
+            cpus, source = threads, "threads"
+        else:
+            cpus, source = cpu_budget()
+        self._threads = cpus
+        self._decode_threads = decode_threads or cpus
+        self._filter_threads = filter_threads or cpus
+        self._encode_threads = encode_threads or cpus
+        # A plan runs on other hosts, so it only sets the counts given here
+        self._given_threads = {
+            "decode": decode_threads or threads,
+            "filter": filter_threads or threads,
+            "encode": encode_threads or threads,
+        }
+        logging.info(
+            f"ffmpeg threads: decode {self._decode_threads},"
+            f" filter {self._filter_threads}, encode {self._encode_threads}"
+            f" ({cpus} CPUs from {source})"
+        )
         self._ffprobe_options = [
             "-v",
             ffmpeg_level,
         ]
-        if ffmpeg_path:
-            self._ffmpeg_path = Path(ffmpeg_path).resolve()
-        else:
-            static_ffmpeg.add_paths()
-            self._ffmpeg_path = "static_ffmpeg"
-        if ffprobe_path:
-            self._ffprobe_path = Path(ffprobe_path).resolve()
-        else:
-            self._ffprobe_path = "static_ffprobe"
-        self._ffmpeg_run = [self._ffmpeg_path] + self._ffmpeg_options
-        self._ffprobe_run = [self._ffprobe_path] + self._ffprobe_options
+        self._ffmpeg_path_option = ffmpeg_path
+        self._ffprobe_path_option = ffprobe_path
+        self._cache_dir = Path(cache_dir).resolve() if cache_dir else None
+        self._force = force
+        self._metrics_path = metrics_path
+        self._textfile_path = textfile_path
+        # Records of the ffmpeg processes of the current job
+        self._processes = []
+        # The Plan the ffmpeg commands are recorded in instead of run, if any
+        self._plan = None
+
+    @cached_property
+    def _binaries(self) -> tuple[Path, Path]:
+        """tuple[Path, Path]: The ffmpeg and ffprobe executables, resolved on first use."""
+        return binaries.resolve(
+            self._index, self._ffmpeg_path_option, self._ffprobe_path_option
+        )
+
+    @property
+    def _ffmpeg_path(self) -> Path:
+        return self._binaries[0]
+
+    @property
+    def _ffprobe_path(self) -> Path:
+        return self._binaries[1]
+
+    @property
+    def _ffmpeg_run(self) -> list:
+        threads = self._thread_count("filter")
+        options = ["-filter_threads", str(threads)] if threads else []
+        options += ["-filter_complex_threads", str(threads)] if threads else []
+        return [self._ffmpeg_path] + self._ffmpeg_options + options
+
+    @property
+    def _ffprobe_run(self) -> list:
+        return [self._ffprobe_path] + self._ffprobe_options
+
+    @cached_property
+    def _ffmpeg_info(self) -> dict:
+        """dict: The version, encoders and filters of ffmpeg, queried once per binary."""
+        return binaries.ffmpeg_info(self._index, self._ffmpeg_path)
+
+    @cached_property
+    def _index(self) -> MetadataIndex:
+        """MetadataIndex: The persistent metadata index, opened on first use."""
+        return MetadataIndex(
+            self._cache_dir / "index.sqlite" if self._cache_dir else None
+        )
 
     def _prep_paths(
         self,
         input_path: str | Path | None = None,
         output_path: str | Path | None = None,
         suffix: str | None = None,
+        allow_streams: bool = False,
     ) -> Path:
         """
         Prepare input and output paths for the video-to-captions conversion.
 
         Args:
-            input_path (str | Path | None): Path to the input video file.
+            input_path (str | Path | None): Path to the input video file, or a ``file://`` URL.
             output_path (str | Path | None): Path to the output captions file.
-            suffix (str | None): Suffix to be appended to the input file name for the output file.
+            suffix (str | None): Suffix to be appended to the input file stem for the output file. If it has no file extension of its own, the input extension is kept.
+            allow_streams (bool): Whether the input may be "-" (stdin) or an ``http(s)://`` URL, and the output "-" (stdout). The outputs of such inputs default to the current folder.
 
         Returns:
-            Path: Tuple containing the resolved input and output paths.
+            Path: Tuple containing the resolved input and output paths, where
+            streams are kept as ffmpeg URLs (see `streams.parse_source`).
+
+        Raises:
+            ValueError: If the input is a stream and streams are not allowed.
         """
-        return (
-            Path(input_path).resolve(),
-            Path(output_path).resolve()
-            if output_path
-            else Path(input_path).parent / f"{Path(input_path).stem}{suffix}",
+        input_path = streams.parse_source(input_path)
+        if streams.is_stream(input_path) and not allow_streams:
+            raise ValueError(f"Needs a file, not a stream: {input_path}")
+        if allow_streams and output_path == streams.STDIO:
+            return input_path, streams.STDOUT
+        if output_path:
+            return input_path, Path(output_path).resolve()
+        suffix = suffix or ""
+        named = (
+            Path.cwd() / streams.source_name(input_path)
+            if streams.is_stream(input_path)
+            else input_path
         )
+        if not Path(suffix).suffix:
+            suffix += named.suffix
+        return input_path, named.parent / f"{named.stem}{suffix}"
+
+    def _cache_key(self, method: str, inputs: list, params: dict) -> str:
+        """
+        Computes the content address of an output of this instance.
+
+        Args:
+            method (str): The command that makes the output.
+            inputs (list): The input files.
+            params (dict): The encoding parameters of the command.
+
+        Returns:
+            str: The cache key, which also covers the package version and ffmpeg.
+        """
+        return cache.cache_key(
+            method,
+            inputs,
+            dict(params, version=__version__, ffmpeg=str(self._ffmpeg_path)),
+        )
+
+    def _up_to_date(self, cache_key: str, output_path: Path) -> bool:
+        """
+        Checks for an output already made with the same inputs and parameters.
+
+        An output made under another name is linked (or copied) into place.
+
+        Args:
+            cache_key (str): The cache key of the output.
+            output_path (Path): The output file.
+
+        Returns:
+            bool: True if output_path is up to date and nothing needs encoding.
+        """
+        # A plan lists every step, and its runner decides which are stale
+        if self._force or self._plan is not None:
+            return False
+        cached = self._index.get_output(cache_key)
+        if cached is None:
+            return False
+        if cached != output_path:
+            with cache.atomic_output(output_path) as partial:
+                try:
+                    os.link(cached, partial)
+                except OSError:
+                    shutil.copyfile(cached, partial)
+            self._index.put_output(cache_key, output_path)
+        logging.info(f"Up to date: {output_path}")
+        return True
+
+    def _put_output(self, cache_key: str | None, output_path: Path):
+        """Records a finished output in the index, unless it was only planned."""
+        if cache_key and self._plan is None:
+            self._index.put_output(cache_key, output_path)
+
+    @contextlib.contextmanager
+    def _atomic_output(self, output_path: Path):
+        """
+        Yields the path to write an output to, like `cache.atomic_output`.
+
+        A planned command writes its output directly, as make and ninja expect.
+
+        Args:
+            output_path (Path): The final output file.
+        """
+        if self._plan is not None:
+            yield output_path
+        else:
+            with cache.atomic_output(output_path) as partial:
+                yield partial
+
+    @contextlib.contextmanager
+    def _work_dir(self, output_path: Path):
+        """
+        Yields a folder next to an output for the files it is made from.
+
+        It is a temporary folder, or a lasting ``.[output_name].parts`` folder
+        when the commands are planned, since they run later.
+
+        Args:
+            output_path (Path): The final output file.
+        """
+        if self._plan is not None:
+            work_dir = output_path.with_name(f".{output_path.name}.parts")
+            work_dir.mkdir(exist_ok=True)
+            yield str(work_dir)
+        else:
+            with tempfile.TemporaryDirectory(dir=output_path.parent) as work_dir:
+                yield work_dir
+
+    def _thread_count(self, stage: str) -> int | None:
+        """
+        Returns the thread count of an ffmpeg stage.
+
+        Args:
+            stage (str): "decode", "filter" or "encode".
+
+        Returns:
+            int | None: The count for this host, or while planning only the
+            count given to the constructor, if any (None leaves it to ffmpeg on
+            the host that runs the plan).
+        """
+        if self._plan is not None:
+            return self._given_threads[stage]
+        return getattr(self, f"_{stage}_threads")
+
+    def _output_options(self) -> list:
+        """
+        Returns the ffmpeg options that go right before an output file.
+
+        Returns:
+            list: The encoder thread count, if any.
+        """
+        threads = self._thread_count("encode")
+        return ["-threads", str(threads)] if threads else []
+
+    def _input_options(self) -> list:
+        """
+        Returns the ffmpeg options that go right before a decoded input file.
+
+        Returns:
+            list: The decoder thread count, if any.
+        """
+        threads = self._thread_count("decode")
+        return ["-threads", str(threads)] if threads else []
+
+    def _audio_options(self, info: MediaInfo, audio: str = "aac") -> list:
+        """
+        Returns the ffmpeg audio encoding options for a blank video.
+
+        Args:
+            info (MediaInfo): The metadata of the source video.
+            audio (str, optional): The audio mode: "aac" re-encodes to AAC, "copy" copies the source audio when MP4 can hold it and falls back to AAC otherwise, "speech" encodes a small mono 16 kHz AAC track. Defaults to "aac".
+
+        Returns:
+            list: The ffmpeg audio codec options.
+        """
+        if audio == "copy":
+            if info.audio_codec in MP4_AUDIO_CODECS:
+                return ["-c:a", "copy"]
+            logging.info(
+                f"Cannot copy {info.audio_codec or 'unknown'} audio into MP4, encoding AAC"
+            )
+            audio = "aac"
+        if audio not in AUDIO_ENCODINGS:
+            raise ValueError(f"Unknown audio mode: {audio}")
+        return AUDIO_ENCODINGS[audio]
+
+    def _run(
+        self,
+        cmd: list,
+        label: str,
+        duration: float | None = None,
+        output_path: Path | None = None,
+        stream_copy: bool = False,
+        inputs: list[Path] | None = None,
+        outputs: list[Path] | None = None,
+    ) -> dict:
+        """
+        Runs one ffmpeg process of the current job with live progress, or adds it to the plan.
+
+        Args:
+            cmd (list): The ffmpeg command.
+            label (str): What is being encoded, for the progress line.
+            duration (float | None, optional): Media seconds the process writes, for the ETA. Defaults to None.
+            output_path (Path | None, optional): The output file, for its size. Defaults to None.
+            stream_copy (bool, optional): Whether the process only copies frames that were encoded before. Defaults to False.
+            inputs (list[Path] | None, optional): The files it reads, for plans, if not only its ``-i`` files. Defaults to None.
+            outputs (list[Path] | None, optional): The files it writes, for plans, if not its other file arguments. Defaults to None.
+
+        Returns:
+            dict: The process record of `runner.run_ffmpeg`, which is empty for a planned process.
+        """
+        if self._plan is not None:
+            self._plan.add(cmd, label, inputs, outputs)
+            return {"frames": 0, "media_seconds": duration or 0}
+        record = runner.run_ffmpeg(cmd, label, duration, output_path)
+        record["stream_copy"] = stream_copy
+        self._processes.append(record)
+        return record
+
+    def _finish_job(
+        self,
+        method: str,
+        input_path: Path,
+        output_path: Path | list[Path],
+        media_seconds: float,
+        start: float,
+        **fields,
+    ) -> dict | None:
+        """
+        Logs the job record of a finished output and writes it to the metrics files.
+
+        Args:
+            method (str): The command, e.g. "blank" or "mask".
+            input_path (Path): The input file.
+            output_path (Path | list[Path]): The output file, or the output files of one ffmpeg run.
+            media_seconds (float): The media duration of the output.
+            start (float): The `time.monotonic` time the job started.
+            **fields: More fields of the job record, e.g. dedup_ratio.
+
+        Returns:
+            dict: The job record, or None for a planned job.
+        """
+        if self._plan is not None:
+            return None
+        record = metrics.job_record(
+            method,
+            input_path,
+            output_path,
+            media_seconds,
+            time.monotonic() - start,
+            self._processes,
+        )
+        record.update(fields)
+        self._processes = []
+        logging.info(metrics.summary(record))
+        if self._metrics_path:
+            metrics.append_jsonl(self._metrics_path, record)
+        if self._textfile_path:
+            metrics.write_textfile(self._textfile_path, self._index.add_job(record))
+        return record
+
+    def _probe(self, input_path: str | Path, packets: bool = True) -> MediaInfo:
+        """
+        Gets the metadata of a media file from the index, or from a single ffprobe call.
+
+        A URL is probed from its header only, without reading it to the end
+        for the packets, so it has no frame count or keyframes. Stdin cannot
+        be probed without consuming it, so its metadata is unknown.
+
+        Args:
+            input_path (str | Path): The path to the media file, or a stream from `_prep_paths`.
+            packets (bool, optional): Whether the frame count and keyframes are needed, which lists the packets of the whole file. Defaults to True.
+
+        Returns:
+            MediaInfo: The media metadata.
+        """
+        if input_path == streams.STDIN:
+            return MediaInfo(duration=0)
+        if streams.is_stream(input_path):
+            return probe(self._ffprobe_run, input_path, packets=False)
+        return probe(self._ffprobe_run, input_path, self._index, packets)
+
+    def probe(self, input_path: str | Path) -> dict:
+        """
+        Prints the metadata of a media file: duration, exact fps, codecs, sample rate, dimensions and keyframes.
+
+        Args:
+            input_path (str | Path): The path to the media file, or an http(s) URL (without frames and keyframes).
+
+        Returns:
+            dict: The media metadata.
+        """
+        input_path, _ = self._prep_paths(input_path, allow_streams=True)
+        if input_path == streams.STDIN:
+            raise ValueError("Cannot probe stdin")
+        return self._probe(input_path).to_dict()
 
     def blank(
         self,
@@ -114,103 +688,1655 @@ class PrepAudioVideo:
         color: str = "000000",
         width: int = 2160,
         height: int = 720,
-    ) -> Path:
+        audio: str = "aac",
+        profile: str = "default",
+        fps: str | float | None = None,
+        output_path: str | Path | None = None,
+        variants: list[dict] | None = None,
+        report: bool = False,
+    ) -> Path | list[Path] | None:
         """
         Creates a blank video with the original audio from the given input video file.
 
         Args:
-            input_path (str | Path): The path to the input video file.
+            input_path (str | Path): The path to the input video file, an http(s) URL, or "-" to read a streamable container (e.g. MKV, NUT or fragmented MP4) from stdin.
             color (str, optional): The color of the blank video in hexadecimal format. Defaults to "000000".
             width (int, optional): The width of the blank video in pixels. Defaults to 2160.
             height (int, optional): The height of the blank video in pixels. Defaults to 720.
+            audio (str, optional): The audio mode: "aac", "copy" (stream copy when MP4 can hold the source audio) or "speech" (small mono AAC). Defaults to "aac".
+            profile (str, optional): The video encoding profile: "default", "static" (tuned for a frame that never changes) or "static-half" (the same at half resolution). Defaults to "default".
+            fps (str | float | None, optional): Frame rate of the blank video, e.g. 10 or "15". A low rate cuts the upload and render size; `mask --source_path` restores the original rate. Defaults to None (the source frame rate, or DEFAULT_FPS for stdin).
+            output_path (str | Path | None, optional): Path to save the blank video file, or "-" to write fragmented MP4 to stdout. Defaults to None.
+            variants (list[dict] | None, optional): Make several blank videos in one ffmpeg run that decodes and encodes the audio once for all of them. Each variant is a dict with any of color, width, height, fps and profile, overriding the options above, e.g. ``[{"width": 1080, "height": 1920}, {"color": "00FF00"}]``. Each is saved with the settings it overrides appended to the output name, e.g. ``talk-blank-1080x1920.mp4``. Defaults to None (one blank video).
+            report (bool, optional): Print the output size, bitrate and encode speed to stderr, to compare profiles. Defaults to False.
 
         Returns:
-            Path: The path to the generated blank video file.
+            Path: The path to the generated blank video file, the list of variant files with variants, or None if it was written to stdout.
         """
-        input_path, _ = self._prep_paths(input_path)
-        output_path = Path(input_path).parent / f"{Path(input_path).stem}-blank.mp4"
+        input_path, output_path = self._prep_paths(
+            input_path, output_path, "-blank.mp4", allow_streams=True
+        )
+        if variants is not None and output_path == streams.STDOUT:
+            raise ValueError("Variants cannot be written to stdout")
         logging.info(f"Creating blank video with original audio from: {input_path}")
 
-        # Extracting duration and FPS from the original video
-        duration = (
-            subprocess.check_output(
-                self._ffprobe_run
-                + [
-                    "-i",
-                    input_path,
-                    "-show_entries",
-                    "format=duration",
-                    "-of",
-                    "csv=p=0",
+        # Duration and exact FPS of the original video, unknown for stdin. The
+        # header has them, so the packets of the whole file are not listed
+        info = self._probe(input_path, packets=False)
+        if not fps and not info.frame_rate:
+            logging.info(f"Unknown input frame rate, using {DEFAULT_FPS} fps")
+        duration = info.duration
+        fps = fps or (info.fps if info.frame_rate else DEFAULT_FPS)
+
+        settings = dict(
+            color=color, width=width, height=height, fps=fps, profile=profile
+        )
+        if variants is None:
+            outputs = [(output_path, settings)]
+        else:
+            outputs = []
+            for variant in variants:
+                unknown = sorted(set(variant) - set(settings))
+                if unknown:
+                    raise ValueError(f"Unknown variant settings: {unknown}")
+                outputs.append(
+                    (variant_path(output_path, variant), dict(settings, **variant))
+                )
+            if len({path for path, _ in outputs}) < len(outputs):
+                raise ValueError("Two variants would write the same file")
+
+        # Streams cannot be fingerprinted and stdout cannot be linked to
+        streaming = streams.is_stream(input_path) or streams.is_stream(output_path)
+        plans, pending = [], []
+        for path, variant in outputs:
+            plan = self._blank_plan(variant, duration)
+            plan["output_path"] = path
+            plans.append(plan)
+            if not streaming:
+                plan["cache_key"] = self._cache_key(
+                    "blank",
+                    [input_path],
+                    dict(plan["params"], audio=audio),
+                )
+                if self._up_to_date(plan["cache_key"], path):
+                    continue
+            pending.append(plan)
+        if not pending:
+            return (
+                output_path if variants is None else [p["output_path"] for p in plans]
+            )
+
+        # ffmpeg command to generate the blank videos with the original audio,
+        # which is decoded and encoded once for all of them
+        start, self._processes = time.monotonic(), []
+        with contextlib.ExitStack() as stack:
+            partials = [
+                stack.enter_context(self._atomic_output(plan["output_path"]))
+                for plan in pending
+            ]
+            cmd = list(self._ffmpeg_run)
+            if streams.is_stream(input_path):
+                # A stream that breaks off cannot be read again, so a read or
+                # decode error must fail the run instead of ending the output
+                cmd += ["-xerror"]
+            for plan in pending:
+                cmd += ["-f", "lavfi", "-i", plan["source"]]
+            cmd += ["-i", input_path]
+            # The video of each blank input, then the audio of the original video
+            for number in range(len(pending)):
+                cmd += ["-map", f"{number}:v:0"]
+            cmd += ["-map", f"{len(pending)}:a:0"]
+            if len(pending) == 1:
+                cmd += pending[0]["video"]
+            else:
+                for number, plan in enumerate(pending):
+                    cmd += stream_options(plan["video"], f"v:{number}")
+            cmd += self._audio_options(info, audio)
+            if not duration:
+                # The color source has no end of its own, so the audio ends
+                # it. With a known duration, -shortest would cut the video
+                # frames the encoder still buffers when copied audio runs out
+                cmd += ["-shortest"]
+            cmd += self._output_options()
+            if len(pending) == 1:
+                cmd += streams.muxer_options(partials[0], "mp4") + [partials[0]]
+            else:
+                # The tee muxer sends the one encoded audio stream to every
+                # file, each with its own video stream
+                cmd += [
+                    "-flags:v",
+                    "+global_header",
+                    "-flags:a",
+                    "+global_header",
+                    "-f",
+                    "tee",
+                    streams.tee_target(
+                        [
+                            (f"v:{n},a", "mp4", partial)
+                            for n, partial in enumerate(partials)
+                        ]
+                    ),
                 ]
+            record = self._run(
+                cmd,
+                f"blank {streams.source_name(input_path)}"
+                + (f" ({len(pending)} variants)" if len(pending) > 1 else ""),
+                duration or None,
+                partials[0] if len(pending) == 1 else None,
+                outputs=partials,
             )
-            .strip()
-            .decode()
+            # ffmpeg ends without an error when a stream breaks off between
+            # packets, and the file it leaves is short or has no media at all
+            seconds = record["media_seconds"]
+            if (
+                self._plan is None
+                and duration
+                and streams.is_stream(input_path)
+                and output_path != streams.STDOUT
+            ):
+                # The color source runs to the probed duration on its own, so
+                # only the audio shows where the stream broke off
+                seconds = min(
+                    [seconds]
+                    + [
+                        probe(self._ffprobe_run, partial, packets=False).audio_duration
+                        or duration
+                        for partial in partials
+                    ]
+                )
+            if self._plan is None and (
+                not seconds or (duration and seconds < duration - 1)
+            ):
+                raise RuntimeError(
+                    f"Only {seconds:g} of {duration or '?'} "
+                    f"seconds could be read from {input_path}"
+                )
+        for plan in pending:
+            self._put_output(plan.get("cache_key"), plan["output_path"])
+        record = self._finish_job(
+            "blank",
+            input_path,
+            (
+                output_path
+                if variants is None
+                else [plan["output_path"] for plan in pending]
+            ),
+            duration or record["media_seconds"],
+            start,
         )
+        if report and record:
+            print(metrics.summary(record), file=sys.stderr)
+        if output_path == streams.STDOUT:
+            return None
+        if variants is None:
+            logging.info(f"Video saved: {output_path}")
+            return output_path
+        logging.info(f"{len(plans)} variants saved next to: {output_path}")
+        return [plan["output_path"] for plan in plans]
 
-        fps = (
-            subprocess.check_output(
-                self._ffprobe_run
-                + [
-                    "-i",
-                    input_path,
-                    "-show_entries",
-                    "stream=r_frame_rate",
-                    "-select_streams",
-                    "v",
-                    "-of",
-                    "csv=p=0",
+    def _blank_plan(self, settings: dict, duration: float) -> dict:
+        """
+        Works out the blank video input and encoding options of one blank video.
+
+        Args:
+            settings (dict): The color, width, height, fps and profile of the blank video.
+            duration (float): The duration of the original video, or 0 if it is unknown.
+
+        Returns:
+            dict: The lavfi "source", the "video" encoding options, and the
+            "params" that go into the cache key.
+
+        Raises:
+            ValueError: If the profile is unknown.
+        """
+        if settings["profile"] not in BLANK_PROFILES:
+            raise ValueError(f"Unknown profile: {settings['profile']}")
+        profile = BLANK_PROFILES[settings["profile"]]
+        color, width, height = settings["color"], settings["width"], settings["height"]
+        fps = str(settings["fps"])
+        video_options = list(profile["video"])
+        if profile.get("gop_seconds"):
+            video_options += ["-g", str(round(Fraction(fps) * profile["gop_seconds"]))]
+        if profile.get("scale"):
+            width = int(width * profile["scale"]) // 2 * 2
+            height = int(height * profile["scale"]) // 2 * 2
+        # Of unknown length, the color source runs until the audio ends
+        source = f"color=c={color}:s={width}x{height}:r={fps}"
+        if duration:
+            source += f":d={duration}"
+        return {
+            "source": source,
+            "video": video_options,
+            "params": dict(
+                color=color, width=width, height=height, video=video_options, fps=fps
+            ),
+        }
+
+    def _mask_encode_options(self, fps: str | None, codec: str = "prores") -> list:
+        """
+        Returns the ffmpeg options that encode keyed frames, without the output file.
+
+        Args:
+            fps (str | None): The output frame rate, or None to keep the timestamps of the input.
+            codec (str, optional): The name of the codec in MASK_CODECS. Defaults to "prores".
+
+        Returns:
+            list: The options for the codec with alpha and no audio.
+        """
+        settings = MASK_CODECS[codec]
+        return (
+            (["-r", fps] if fps else [])
+            + settings["video"]
+            + ["-pix_fmt", settings["pix_fmt"], "-an"]
+            + self._output_options()
+        )
+
+    def _key(
+        self,
+        input_path: Path | str,
+        info: MediaInfo,
+        output_path: Path | str,
+        color: str = "000000",
+        tolerance: float = 0.01,
+        fps: str | None = None,
+        engine: str = "colorkey",
+        engine_options: dict | None = None,
+        codec: str = "prores",
+        crop: list[int] | None = None,
+        first_frame: int = 0,
+        frames: int | None = None,
+        container: str | None = None,
+        dedup: bool = False,
+    ):
+        """
+        Keys the background out of a stretch of input frames into one file.
+
+        Args:
+            input_path (Path | str): The input video file, or a stream from `_prep_paths`.
+            info (MediaInfo): The metadata of the input video.
+            output_path (Path | str): The output video file, or `streams.STDOUT`.
+            color (str, optional): Color to be masked in hexadecimal format. Defaults to "000000".
+            tolerance (float, optional): Tolerance level for color matching. Defaults to 0.01.
+            fps (str | None, optional): The output frame rate. Defaults to None (the input frame rate).
+            engine (str, optional): The keying engine, "colorkey" or "numpy". Defaults to "colorkey".
+            engine_options (dict | None, optional): falloff, despill and premultiply for the numpy engine. Defaults to None.
+            codec (str, optional): The name of the codec in MASK_CODECS. Defaults to "prores".
+            crop (list[int] | None, optional): ``[x, y, width, height]`` to crop to before keying. Defaults to None.
+            first_frame (int, optional): Index of the first input frame to key. Defaults to 0.
+            frames (int | None, optional): Number of input frames to key. Defaults to None (all).
+            container (str | None, optional): The container in `streams.STREAM_CONTAINERS` for output to stdout. Defaults to None.
+            dedup (bool, optional): Key and encode only the frames that differ from the one before, with their timestamps (colorkey engine only). Defaults to False.
+        """
+        fps = fps or (info.fps if info.frame_rate else None)
+        seek = []
+        if first_frame and first_frame in dict(info.keyframes):
+            # Decoding can start right at a keyframe: fast seeking lands on the
+            # last keyframe before a timestamp half a frame in
+            seek = [
+                "-noaccurate_seek",
+                "-ss",
+                f"{float((first_frame + Fraction(1, 2)) / info.frame_rate):.6f}",
+            ]
+        elif first_frame:
+            # Seek half a frame early so timestamp rounding never drops the first frame
+            seek = [
+                "-ss",
+                f"{float((first_frame - Fraction(1, 2)) / info.frame_rate):.6f}",
+            ]
+        # Restart the timestamps at zero so the encoder neither drops nor repeats frames
+        trim = [f"trim=end_frame={frames}"] if frames is not None else []
+        if seek:
+            trim.append("setpts=PTS-STARTPTS")
+        width, height = info.width, info.height
+        if crop:
+            x, y, width, height = crop
+            trim.append(f"crop={width}:{height}:{x}:{y}")
+
+        # Key at the input rate, then hold frames up to the output rate
+        key_filter = colorkey_filter(color, tolerance)
+        retime_filters = []
+        if fps and Fraction(fps) != info.frame_rate:
+            logging.info(f"Retiming from {info.fps} to {fps} fps")
+            retime_filters.append(f"fps=fps={fps}:round=up")
+
+        if engine == "colorkey":
+            # Held frames are dropped before keying and held by their timestamps
+            if dedup:
+                trim.append(dedup_filter(frames or info.frames, info.frame_rate))
+            # ffmpeg command to key out the background into a codec with alpha
+            self._run(
+                self._ffmpeg_run
+                + seek
+                + self._input_options()
+                + ["-i", input_path, "-map", "0:v:0"]
+                + ["-vf", ",".join(trim + [key_filter] + retime_filters)]
+                + (
+                    self._mask_encode_options(None, codec) + ["-fps_mode", "vfr"]
+                    if dedup
+                    else self._mask_encode_options(fps, codec)
+                )
+                + streams.muxer_options(output_path, container)
+                + [output_path],
+                f"mask {streams.source_name(input_path)}"
+                + (f" [{first_frame}:{first_frame + frames}]" if frames else ""),
+                # A URL is probed without its packets and stdin not at all
+                (
+                    float((frames if frames else info.frames) / info.frame_rate)
+                    if frames or info.frames
+                    else info.duration or None
+                ),
+                output_path,
+            )
+        elif engine == "numpy":
+            from .keyer import run_numpy_keyer
+
+            size = f"{width}x{height}"
+            run_numpy_keyer(
+                self._ffmpeg_run
+                + seek
+                + self._input_options()
+                + ["-i", input_path, "-map", "0:v:0"]
+                + (["-vf", ",".join(trim)] if trim else [])
+                + ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"],
+                self._ffmpeg_run
+                + ["-f", "rawvideo", "-pix_fmt", "rgba", "-s", size]
+                + ["-r", info.fps, "-i", "pipe:0"]
+                + (["-vf", ",".join(retime_filters)] if retime_filters else [])
+                + self._mask_encode_options(fps, codec)
+                + streams.muxer_options(output_path, container)
+                + [output_path],
+                width,
+                height,
+                workers=self._threads,
+                color=color,
+                similarity=tolerance,
+                blend=tolerance,
+                **(engine_options or {}),
+            )
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
+    def _transparent(
+        self,
+        info: MediaInfo,
+        output_path: Path,
+        fps: str,
+        frames: int,
+        codec: str = "prores",
+        crop: list[int] | None = None,
+    ):
+        """
+        Encodes fully transparent frames without decoding or keying anything.
+
+        Args:
+            info (MediaInfo): The metadata of the video whose size to match.
+            output_path (Path): The output video file.
+            fps (str): The frame rate.
+            frames (int): The number of frames.
+            codec (str, optional): The name of the codec in MASK_CODECS. Defaults to "prores".
+            crop (list[int] | None, optional): ``[x, y, width, height]`` whose size to match instead. Defaults to None.
+        """
+        pix_fmt = MASK_CODECS[codec]["pix_fmt"]
+        width, height = crop[2:] if crop else (info.width, info.height)
+        self._run(
+            self._ffmpeg_run
+            + ["-f", "lavfi", "-i"]
+            + [f"color=c=black@0.0:s={width}x{height}:r={fps},format={pix_fmt}"]
+            + ["-frames:v", str(frames)]
+            + self._mask_encode_options(fps, codec)
+            + [output_path],
+            f"transparent {frames} frames",
+            float(frames / Fraction(fps)),
+            output_path,
+        )
+
+    def _key_filler(
+        self,
+        input_path: Path,
+        info: MediaInfo,
+        output_path: Path,
+        index: dict,
+        key_options: dict,
+    ):
+        """
+        Keys the active stretches of a video and fills the rest with transparent frames.
+
+        Args:
+            input_path (Path): The input video file.
+            info (MediaInfo): The metadata of the input video.
+            output_path (Path): The output video file.
+            index (dict): The caption activity index of the input.
+            key_options (dict): Options passed to `_key` for every active stretch.
+        """
+        active_segments = [
+            [s["first_frame"], s["end_frame"]] for s in index["segments"]
+        ]
+        with tempfile.TemporaryDirectory(dir=output_path.parent) as work_dir:
+            parts = []
+            for number, (start, end, active) in enumerate(
+                activity.timeline(active_segments, index["frames"])
+            ):
+                part_path = Path(work_dir) / f"part-{number:05d}{output_path.suffix}"
+                if active:
+                    self._key(
+                        input_path,
+                        info,
+                        part_path,
+                        first_frame=start,
+                        frames=end - start,
+                        **key_options,
+                    )
+                else:
+                    self._transparent(
+                        info,
+                        part_path,
+                        key_options["fps"],
+                        end - start,
+                        key_options["codec"],
+                        key_options.get("crop"),
+                    )
+                parts.append(part_path)
+            self._concat(parts, output_path)
+
+    def _key_segments(
+        self,
+        input_path: Path,
+        info: MediaInfo,
+        output_path: Path,
+        count: int,
+        key_options: dict,
+    ):
+        """
+        Keys a video in segments that run in parallel, then joins them.
+
+        The segments start at keyframes and are trimmed to their exact frame
+        counts, so the joined file has every input frame exactly once.
+
+        Args:
+            input_path (Path): The input video file.
+            info (MediaInfo): The metadata of the input video.
+            output_path (Path): The output video file.
+            count (int): The number of segments.
+            key_options (dict): Options passed to `_key` for every segment.
+
+        Raises:
+            RuntimeError: If the joined file does not have the input frame count.
+        """
+        parts = split_at_keyframes(info.keyframes, info.frames, count)
+        workers, worker = self._segment_worker(len(parts), len(parts))
+        with self._work_dir(output_path) as work_dir:
+            part_paths = [
+                Path(work_dir) / f"segment-{number:05d}{output_path.suffix}"
+                for number in range(len(parts))
+            ]
+            # A plan lists the segments in order
+            with ThreadPoolExecutor(
+                max_workers=1 if self._plan is not None else workers
+            ) as pool:
+                futures = [
+                    # Each segment runs in the process scope of this call
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        worker._key,
+                        input_path,
+                        info,
+                        part_path,
+                        first_frame=start,
+                        frames=end - start,
+                        **key_options,
+                    )
+                    for part_path, (start, end) in zip(part_paths, parts)
                 ]
+                for future in futures:
+                    future.result()
+            self._concat(part_paths, output_path)
+        if self._plan is not None:
+            return
+        frames = probe(self._ffprobe_run, output_path).frames
+        if frames != info.frames:
+            raise RuntimeError(
+                f"Joined segments have {frames} frames instead of {info.frames}: {output_path}"
             )
-            .strip()
-            .decode()
-            .split("/")
+
+    def _segment_worker(
+        self, segments: int, workers: int
+    ) -> tuple[int, "PrepAudioVideo"]:
+        """
+        Splits the CPUs between segments that are keyed at the same time.
+
+        Args:
+            segments (int): The number of segments to key.
+            workers (int): The number of segments to key at once.
+
+        Returns:
+            tuple[int, PrepAudioVideo]: The number of workers, and an instance
+            whose ffmpeg processes get one worker's share of the CPUs and are
+            recorded in this job.
+        """
+        workers, threads = plan_workers(segments, workers)
+        # Every segment runs its ffmpeg processes with its share of the CPUs
+        worker = PrepAudioVideo(
+            **{**self._init_kwargs, "threads": self._init_kwargs["threads"] or threads}
         )
-        fps = float(fps[0]) / float(fps[1])
+        worker._processes, worker._plan = self._processes, self._plan
+        worker._given_threads = self._given_threads
+        logging.info(
+            f"Keying {segments} segments with {workers} workers"
+            f" x {worker._threads} threads"
+        )
+        return workers, worker
+
+    def _key_resumable(
+        self,
+        input_path: Path,
+        info: MediaInfo,
+        output_path: Path,
+        cache_key: str,
+        seconds: float,
+        workers: int,
+        key_options: dict,
+        analysis: dict | None = None,
+    ):
+        """
+        Keys a video in segments recorded in a journal, so a rerun after a crash resumes where it stopped.
 
-        # ffmpeg command to generate blank video with the original audio
-        subprocess.run(
+        Every segment is written to a ``.[output_name].parts`` folder next to
+        the output, checked for its exact frame count, and only then recorded
+        in the journal with its size and modification time. A rerun with the
+        same inputs and options keys only the segments that are not recorded,
+        or whose files have changed since. The segments are joined without
+        re-encoding, and the folder and the journal are removed once the
+        output is complete. The journal also records the options that the
+        analysis of the input gave, so a rerun does not analyse it again.
+
+        Args:
+            input_path (Path): The input video file.
+            info (MediaInfo): The metadata of the input video.
+            output_path (Path): The output video file.
+            cache_key (str): The cache key of the output, which the journal must match.
+            seconds (float): The duration of a segment.
+            workers (int): The number of segments to key at once.
+            key_options (dict): Options passed to `_key` for every segment.
+            analysis (dict | None, optional): The options of key_options that the analysis gave, e.g. the crop, recorded for `read_analysis`. Defaults to None.
+
+        Raises:
+            RuntimeError: If a segment or the joined file does not have the expected frame count.
+        """
+        parts = split_by_duration(info.keyframes, info.frames, info.frame_rate, seconds)
+        work_dir = output_path.with_name(f".{output_path.name}.parts")
+        work_dir.mkdir(exist_ok=True)
+        journal = journal_path(output_path)
+        finished = read_journal(journal, cache_key)
+        write_journal(journal, cache_key, finished, analysis)
+        pending = [
+            (start, end) for start, end in parts if f"{start}:{end}" not in finished
+        ]
+        if len(pending) < len(parts):
+            logging.info(
+                f"Resuming with {len(parts) - len(pending)} of {len(parts)}"
+                f" segments finished: {journal}"
+            )
+        lock = threading.Lock()
+
+        def key_segment(start: int, end: int):
+            part_path = work_dir / f"segment-{start:08d}-{end:08d}{output_path.suffix}"
+            with cache.atomic_output(part_path) as partial:
+                worker._key(
+                    input_path,
+                    info,
+                    partial,
+                    first_frame=start,
+                    frames=end - start,
+                    **key_options,
+                )
+                frames = probe(self._ffprobe_run, partial).frames
+                if frames != end - start:
+                    raise RuntimeError(
+                        f"Segment has {frames} frames instead of {end - start}: {part_path}"
+                    )
+            stat = part_path.stat()
+            with lock:
+                finished[f"{start}:{end}"] = {
+                    "path": str(part_path),
+                    "frames": frames,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                }
+                write_journal(journal, cache_key, finished, analysis)
+
+        if pending:
+            workers, worker = self._segment_worker(len(pending), workers)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    # Each segment runs in the process scope of this call
+                    pool.submit(contextvars.copy_context().run, key_segment, start, end)
+                    for start, end in pending
+                ]
+                for future in futures:
+                    future.result()
+
+        with cache.atomic_output(output_path) as partial:
+            self._concat(
+                [Path(finished[f"{start}:{end}"]["path"]) for start, end in parts],
+                partial,
+            )
+            frames = probe(self._ffprobe_run, partial).frames
+            if frames != info.frames:
+                raise RuntimeError(
+                    f"Joined segments have {frames} frames instead of {info.frames}: {output_path}"
+                )
+        shutil.rmtree(work_dir, ignore_errors=True)
+        journal.unlink(missing_ok=True)
+
+    def _concat(self, parts: list[Path], output_path: Path):
+        """
+        Joins video files with identical encoding settings without re-encoding.
+
+        Args:
+            parts (list[Path]): The files to join, in order.
+            output_path (Path): The joined file.
+        """
+        list_path = output_path.with_name(f".{output_path.name}.concat.txt")
+        list_path.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in parts))
+        try:
+            self._run(
+                self._ffmpeg_run
+                + ["-f", "concat", "-safe", "0", "-i", list_path]
+                + ["-map", "0:v:0", "-c", "copy", output_path],
+                f"concat {len(parts)} parts",
+                output_path=output_path,
+                stream_copy=True,
+                inputs=[list_path] + list(parts),
+            )
+        finally:
+            # A planned concat reads the list when it runs
+            if self._plan is None:
+                list_path.unlink(missing_ok=True)
+
+    def activity(
+        self,
+        input_path: str | Path,
+        color: str = "000000",
+        tolerance: float = 0.01,
+        min_gap: float = 1.0,
+        padding: float = 0.0,
+    ) -> dict:
+        """
+        Finds the stretches of a captions.ai render that contain captions.
+
+        A low-resolution copy is keyed like `mask` does, and every frame with at
+        least one pixel that is not the key color counts as active. The union of
+        the bounding boxes of those pixels is recorded as well. The result is
+        saved next to the input as a caption activity index
+        (`[input_stem]-activity.json`) plus an EDL and an FCPXML cut list. An
+        index of the unchanged input with the same settings is reused.
+
+        Args:
+            input_path (str | Path): The path to the captions.ai render.
+            color (str, optional): The key color in hexadecimal format. Defaults to "000000".
+            tolerance (float, optional): Tolerance level for color matching. Defaults to 0.01.
+            min_gap (float, optional): Empty stretches shorter than this many seconds stay inside a segment. Defaults to 1.0.
+            padding (float, optional): Seconds added before and after each segment. Defaults to 0.0.
+
+        Returns:
+            dict: The caption activity index.
+        """
+        input_path, index_path = self._prep_paths(input_path, suffix="-activity.json")
+        settings = {
+            "fingerprint": cache.fingerprint(input_path),
+            "color": color,
+            "tolerance": tolerance,
+            "min_gap": min_gap,
+            "padding": padding,
+        }
+        index = None if self._force else activity.read_index(index_path, settings)
+        if index is not None:
+            logging.info(f"Using the caption activity index: {index_path}")
+            return index
+        logging.info(f"Analysing caption activity in: {input_path}")
+        info = self._probe(input_path)
+        analysed = activity.analysis_size(info.width, info.height)
+        result = runner.run(
             self._ffmpeg_run
-            + [
-                "-f",
-                "lavfi",
-                "-i",
-                f"color=c={color}:s={width}x{height}:r={fps}:d={duration}",
-                "-i",
-                input_path,
-                "-map",
-                "0:v:0",  # Use video from the first input (blank video)
-                "-map",
-                "1:a:0",  # Use audio from the second input (original video)
-                "-c:v",
-                "libx264",
-                "-c:a",
-                "aac",
-                "-shortest",
-                output_path,
-            ]
+            + self._input_options()
+            + ["-i", input_path, "-map", "0:v:0"]
+            + ["-vf", activity.analysis_filter(color, tolerance, *analysed)]
+            + ["-f", "null", "-"],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
         )
-        logging.info(f"Video saved: {output_path}")
-        return output_path
+        frames, active = info.frames, activity.parse_active_frames(result.stdout)
+        segments = activity.frame_segments(active, frames, info.fps, min_gap, padding)
+        box = activity.parse_bounding_box(result.stdout)
+        if box:
+            box = activity.crop_box(box, analysed, info.width, info.height, 0)
+        index = {
+            "input": str(input_path),
+            "fps": info.fps,
+            "frames": frames,
+            "width": info.width,
+            "height": info.height,
+            **settings,
+            "active_frames": len(active),
+            "bbox": dict(zip(["x", "y", "width", "height"], box)) if box else None,
+            "segments": [
+                {
+                    "first_frame": start,
+                    "end_frame": end,
+                    "start": round(float(start / info.frame_rate), 6),
+                    "end": round(float(end / info.frame_rate), 6),
+                }
+                for start, end in segments
+            ],
+        }
+        activity.write_index(index_path, index)
+        activity.write_edl(
+            index_path.with_suffix(".edl"),
+            segments,
+            info.fps,
+            input_path.stem,
+            input_path.name,
+        )
+        activity.write_fcpxml(
+            index_path.with_suffix(".fcpxml"),
+            segments,
+            frames,
+            info.fps,
+            input_path,
+            info.width,
+            info.height,
+        )
+        logging.info(
+            f"{len(active)} of {frames} frames active in {len(segments)} segments: {index_path}"
+        )
+        return index
 
     def mask(
         self,
         input_path: str | Path,
         color: str = "000000",
         tolerance: float = 0.01,
-        fps: int | None = None,
+        fps: str | float | None = None,
         output_path: str | Path | None = None,
-    ) -> Path:
+        source_path: str | Path | None = None,
+        engine: str = "colorkey",
+        falloff: str = "smooth",
+        despill: bool = False,
+        premultiply: bool = False,
+        sparse: str | None = None,
+        codec: str = "prores",
+        crop: bool = False,
+        crop_padding: int = 16,
+        segments: int = 1,
+        container: str | None = None,
+        variants: list[dict] | None = None,
+        dedup: bool = False,
+        resumable: bool = False,
+        segment_seconds: float = 300,
+    ) -> Path | list[Path] | None:
         """
         Applies a color key mask to a video file.
 
+        When the output frame rate differs from the input frame rate, each keyed
+        frame is held until the next one is due, so a captions.ai render of a
+        low-frame-rate blank lines up with the original timeline.
+
+        Streams are keyed in a single pass as they arrive, so they cannot be
+        combined with sparse, crop or segments, which read the input more than
+        once.
+
         Args:
-            input_path: Path to the input video file.
+            input_path: Path to the input video file, an http(s) URL, or "-" to read a streamable container (e.g. MKV, NUT or fragmented MOV) from stdin.
             color: Color to be masked in hexadecimal format. Defaults to "000000".
             tolerance: Tolerance level for color matching. Defaults to 0.01.
             fps: Frames per second of the output video. Defaults to None.
-            output_path: Path to save the output video file. Defaults to None.
+            output_path: Path to save the output video file, or "-" to write it to stdout in a streamable container. Defaults to None.
+            source_path: Path to the original video whose frame rate the output should match. Defaults to None.
+            engine: The keying engine: "colorkey" (the ffmpeg filter) or "numpy" (vectorized NumPy keyer on worker processes, needs the numpy extra). Defaults to "colorkey".
+            falloff: numpy engine only. Shape of the soft matte edge, "linear" (like colorkey) or "smooth". Defaults to "smooth".
+            despill: numpy engine only. Remove the key color mixed into semi-transparent edge pixels. Defaults to False.
+            premultiply: numpy engine only. Write color premultiplied by alpha. Defaults to False.
+            sparse: Only key the stretches that contain captions (see `activity`): "clips" writes each stretch to its own numbered file, "filler" writes one file with cheap transparent frames in between. Defaults to None (key every frame).
+            codec: The alpha-capable output codec: "prores" (ProRes 4444), "prores-xq" (ProRes 4444 XQ), "qtrle" (QuickTime Animation), "vp9" (VP9 in WebM), "ffv1" (FFV1 in Matroska) or "png" (PNG in MOV). Defaults to "prores".
+            crop: Crop to the union bounding box of the captions before keying (see `activity`), and write the crop offset next to the output as `[output_stem].crop.json`. Defaults to False.
+            crop_padding: Pixels of margin around the captions when cropping. Defaults to 16.
+            segments: Split the input at keyframes into this many segments, key and encode them in parallel, and join them without re-encoding. The CPUs are split between the segments. Defaults to 1.
+            container: The container of output to stdout: "mov" (fragmented), "mkv", "webm" or "nut". Defaults to None (the one of the codec's extension).
+            variants: Key several colors or tolerances from one decode of the input. Each variant is a dict with color and/or tolerance, overriding the options above, e.g. ``[{"tolerance": 0.02}, {"tolerance": 0.05}]``. Each is saved with the settings it overrides appended to the output name, e.g. ``talk-mask-t0.05.mov``. Only the colorkey engine makes variants, and not with sparse, crop, segments or stdout. Defaults to None (one mask video).
+            dedup: Key and encode each run of identical or near-identical frames (by ffmpeg's mpdecimate) only once, into variable-frame-rate output where each frame is held until the next one. The dedup ratio is logged and written to the job record. Only with the colorkey engine, for a file input, and not with sparse, segments, variants or retiming. Defaults to False.
+            resumable: Key in segments of segment_seconds, each recorded in a journal next to the output once its frame count is checked, so a rerun after a crash or kill keys only the missing segments. With segments, that many run at once. Not with sparse, dedup, variants, retiming or streams. Defaults to False.
+            segment_seconds: Duration of a resumable segment, which starts at a keyframe. Defaults to 300.
+
+        Returns:
+            Path to the output video file, the list of clip files with sparse="clips" or of variant files with variants, or None if it was written to stdout.
+        """
+        if codec not in MASK_CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        container = container or MASK_CODECS[codec]["ext"][1:]
+        if container not in streams.STREAM_CONTAINERS:
+            raise ValueError(f"Unknown container: {container}")
+        input_path, output_path = self._prep_paths(
+            input_path,
+            output_path,
+            "-mask" + MASK_CODECS[codec]["ext"],
+            allow_streams=True,
+        )
+        streaming = streams.is_stream(input_path) or streams.is_stream(output_path)
+        if streaming and (sparse or crop or segments > 1 or resumable):
+            raise ValueError(
+                "Streams cannot be combined with sparse, crop, segments or resumable"
+            )
+        if input_path == streams.STDIN and engine != "colorkey":
+            raise ValueError("Only the colorkey engine can read stdin")
+        # Sparse and crop shape their commands by an analysis of the frames
+        if self._plan is not None and (
+            sparse or crop or resumable or engine != "colorkey"
+        ):
+            raise ValueError(
+                "Only the colorkey engine without sparse, crop or resumable can be planned"
+            )
+        logging.info(f"Masking color {color} in: {input_path}")
+
+        # Nothing is known about stdin before it is decoded
+        info = self._probe(input_path)
+        if input_path != streams.STDIN and not info.video_codec:
+            raise ValueError(f"No video stream in: {input_path}")
+        if not fps and source_path:
+            fps = self._probe(self._prep_paths(source_path)[0]).fps
+        fps = str(fps or info.fps) if fps or info.frame_rate else None
+        key_options = dict(
+            color=color,
+            tolerance=tolerance,
+            fps=fps,
+            engine=engine,
+            codec=codec,
+            engine_options=(
+                dict(falloff=falloff, despill=despill, premultiply=premultiply)
+                if engine == "numpy"
+                else None
+            ),
+        )
+        if sparse and sparse not in ("clips", "filler"):
+            raise ValueError(f"Unknown sparse mode: {sparse}")
+        if sparse and Fraction(fps) != info.frame_rate:
+            raise ValueError("Sparse output cannot be combined with retiming")
+        if segments > 1 and (sparse or Fraction(fps) != info.frame_rate):
+            raise ValueError(
+                "Segmented output cannot be combined with sparse output or retiming"
+            )
+        if resumable and (
+            sparse or dedup or variants is not None or Fraction(fps) != info.frame_rate
+        ):
+            raise ValueError(
+                "Resumable output cannot be combined with sparse, dedup, variants or retiming"
+            )
+        if dedup:
+            if engine != "colorkey" or not info.frames:
+                raise ValueError("Dedup needs the colorkey engine and a file input")
+            if sparse or segments > 1 or variants is not None:
+                raise ValueError(
+                    "Dedup cannot be combined with sparse, segments or variants"
+                )
+            if Fraction(fps) != info.frame_rate:
+                raise ValueError("Dedup cannot be combined with retiming")
+            key_options["dedup"] = True
+        if variants is not None:
+            if engine != "colorkey":
+                raise ValueError("Only the colorkey engine can make variants")
+            if output_path == streams.STDOUT or sparse or crop or segments > 1:
+                raise ValueError(
+                    "Variants cannot be combined with stdout, sparse, crop or segments"
+                )
+            return self._mask_variants(
+                input_path,
+                info,
+                output_path,
+                variants,
+                key_options,
+                dict(sparse=sparse, crop=crop, crop_padding=crop_padding),
+            )
+
+        # Segmenting changes how, not what, is encoded
+        cache_key = None
+        if not streaming:
+            cache_key = self._cache_key(
+                "mask",
+                [input_path],
+                dict(key_options, sparse=sparse, crop=crop, crop_padding=crop_padding),
+            )
+            if sparse != "clips" and self._up_to_date(cache_key, output_path):
+                return output_path
+
+        job_start, self._processes = time.monotonic(), []
+        # A resumed job takes the crop from its journal instead of analysing again
+        analysis = (
+            read_analysis(journal_path(output_path), cache_key) if resumable else None
+        )
+        index = None
+        if analysis is None and (sparse or crop):
+            index = self.activity(input_path, color, tolerance)
+        if analysis is not None:
+            key_options.update(analysis)
+            logging.info(f"Reusing the analysis of: {journal_path(output_path)}")
+        elif crop and index["bbox"]:
+            box = index["bbox"]
+            key_options["crop"] = activity.crop_box(
+                [
+                    box["x"],
+                    box["y"],
+                    box["x"] + box["width"] - 1,
+                    box["y"] + box["height"] - 1,
+                ],
+                (info.width, info.height),
+                info.width,
+                info.height,
+                crop_padding,
+            )
+            crop_path = output_path.with_suffix(".crop.json")
+            activity.write_crop(crop_path, key_options["crop"], info.width, info.height)
+            logging.info(f"Cropping to {key_options['crop']}: {crop_path}")
+        elif crop:
+            logging.warning(f"No captions found, not cropping: {input_path}")
+
+        if sparse == "clips":
+            clips = []
+            for number, segment in enumerate(index["segments"], 1):
+                start, end = segment["first_frame"], segment["end_frame"]
+                clip_path = activity.clip_name(output_path, number)
+                with cache.atomic_output(clip_path) as partial:
+                    self._key(
+                        input_path,
+                        info,
+                        partial,
+                        first_frame=start,
+                        frames=end - start,
+                        **key_options,
+                    )
+                clips.append(clip_path)
+                self._finish_job(
+                    "mask",
+                    input_path,
+                    clip_path,
+                    float((end - start) / info.frame_rate),
+                    job_start,
+                )
+                job_start = time.monotonic()
+            logging.info(f"{len(clips)} clips saved next to: {output_path}")
+            return clips
+
+        if resumable:
+            self._key_resumable(
+                input_path,
+                info,
+                output_path,
+                cache_key,
+                segment_seconds,
+                segments,
+                key_options,
+                {name: key_options[name] for name in ["crop"] if name in key_options},
+            )
+        else:
+            with self._atomic_output(output_path) as partial:
+                if sparse == "filler":
+                    self._key_filler(input_path, info, partial, index, key_options)
+                elif segments > 1:
+                    self._key_segments(input_path, info, partial, segments, key_options)
+                else:
+                    self._key(
+                        input_path, info, partial, container=container, **key_options
+                    )
+        fields = {}
+        if dedup and self._plan is None:
+            unique = self._processes[-1]["frames"]
+            fields["dedup_ratio"] = round(info.frames / max(unique, 1), 3)
+            logging.info(
+                f"Deduplicated {info.frames} frames to {unique}"
+                f" ({fields['dedup_ratio']}x fewer frames keyed and encoded)"
+            )
+        self._put_output(cache_key, output_path)
+        self._finish_job(
+            "mask",
+            input_path,
+            output_path,
+            (
+                float(info.frames / info.frame_rate)
+                if info.frames
+                else sum(p["media_seconds"] for p in self._processes)
+            ),
+            job_start,
+            **fields,
+        )
+        if output_path == streams.STDOUT:
+            return None
+        logging.info(f"Video saved: {output_path}")
+        return output_path
+
+    def _mask_variants(
+        self,
+        input_path: Path | str,
+        info: MediaInfo,
+        output_path: Path,
+        variants: list[dict],
+        key_options: dict,
+        cache_params: dict,
+    ) -> list[Path]:
+        """
+        Keys several colors or tolerances from one decode of a video, into a file each.
+
+        The decoded frames are split into one colorkey branch per variant, and
+        each branch is encoded to its own output of the same ffmpeg process.
+
+        Args:
+            input_path (Path | str): The input video file, or a stream from `_prep_paths`.
+            info (MediaInfo): The metadata of the input video.
+            output_path (Path): The output file without variants.
+            variants (list[dict]): The color and/or tolerance of each variant.
+            key_options (dict): The color, tolerance, fps and codec the variants override.
+            cache_params (dict): The other mask options that go into the cache key.
+
+        Returns:
+            list[Path]: The variant files, in the order of the variants.
+
+        Raises:
+            ValueError: If a variant has unknown settings, or two variants would write the same file.
+        """
+        outputs = []
+        for variant in variants:
+            unknown = sorted(set(variant) - {"color", "tolerance"})
+            if unknown:
+                raise ValueError(f"Unknown variant settings: {unknown}")
+            outputs.append(
+                (variant_path(output_path, variant), dict(key_options, **variant))
+            )
+        if len({path for path, _ in outputs}) < len(outputs):
+            raise ValueError("Two variants would write the same file")
+
+        # A variant is keyed exactly like a single mask with its settings
+        pending = []
+        for path, options in outputs:
+            cache_key = None
+            if not streams.is_stream(input_path):
+                cache_key = self._cache_key(
+                    "mask", [input_path], dict(options, **cache_params)
+                )
+                if self._up_to_date(cache_key, path):
+                    continue
+            pending.append((path, options, cache_key))
+        if not pending:
+            return [path for path, _ in outputs]
+
+        fps, codec = key_options["fps"], key_options["codec"]
+        retime_filters = []
+        if fps and Fraction(fps) != info.frame_rate:
+            logging.info(f"Retiming from {info.fps} to {fps} fps")
+            retime_filters.append(f"fps=fps={fps}:round=up")
+        branches = "".join(f"[in{n}]" for n in range(len(pending)))
+        graph = [f"[0:v:0]split={len(pending)}{branches}"]
+        for number, (_, options, _) in enumerate(pending):
+            key_filter = colorkey_filter(options["color"], options["tolerance"])
+            graph.append(
+                f"[in{number}]{','.join([key_filter] + retime_filters)}[key{number}]"
+            )
+
+        start, self._processes = time.monotonic(), []
+        media_seconds = (
+            float(info.frames / info.frame_rate) if info.frames else info.duration
+        )
+        with contextlib.ExitStack() as stack:
+            cmd = (
+                self._ffmpeg_run
+                + self._input_options()
+                + ["-i", input_path, "-filter_complex", ";".join(graph)]
+            )
+            for number, (path, _, _) in enumerate(pending):
+                partial = stack.enter_context(self._atomic_output(path))
+                cmd += (
+                    ["-map", f"[key{number}]"]
+                    + self._mask_encode_options(fps, codec)
+                    + [partial]
+                )
+            self._run(
+                cmd,
+                f"mask {streams.source_name(input_path)} ({len(pending)} variants)",
+                media_seconds or None,
+            )
+        for path, _, cache_key in pending:
+            self._put_output(cache_key, path)
+        self._finish_job(
+            "mask",
+            input_path,
+            [path for path, _, _ in pending],
+            media_seconds or sum(p["media_seconds"] for p in self._processes),
+            start,
+        )
+        logging.info(f"{len(outputs)} variants saved next to: {output_path}")
+        return [path for path, _ in outputs]
+
+    def composite(
+        self,
+        input_path: str | Path,
+        captions_path: str | Path,
+        color: str = "000000",
+        tolerance: float = 0.01,
+        scale: float | None = None,
+        x: str = "(W-w)/2",
+        y: str = "H-h",
+        codec: str = "h264",
+        audio: str = "copy",
+        output_path: str | Path | None = None,
+    ) -> Path:
+        """
+        Overlays the keyed captions of a captions.ai render on the original video in one pass.
+
+        One ffmpeg filter graph keys, scales and positions the captions and
+        overlays them on the original video, which is encoded straight to a
+        delivery codec with its own audio. This skips the alpha intermediate
+        of `mask` and the second pass that would read it back. A render with
+        a lower frame rate than the original, see `blank --fps`, is held
+        frame by frame on the original timeline.
+
+        Args:
+            input_path (str | Path): The path to the original video file.
+            captions_path (str | Path): The path to the captions.ai render of its blank video.
+            color (str, optional): Background color of the render in hexadecimal format. Defaults to "000000".
+            tolerance (float, optional): Tolerance level for color matching. Defaults to 0.01.
+            scale (float | None, optional): Size of the captions relative to the render. Defaults to None (the width of the original video).
+            x (str, optional): Left edge of the captions, an ffmpeg overlay expression of the video size W, H and the captions size w, h. Defaults to "(W-w)/2" (centered).
+            y (str, optional): Top edge of the captions, an overlay expression like x. Defaults to "H-h" (at the bottom).
+            codec (str, optional): The delivery codec: "h264" (H.264) or "hevc" (H.265). Defaults to "h264".
+            audio (str, optional): The audio mode, as in `blank`: "copy", "aac" or "speech". Defaults to "copy".
+            output_path (str | Path | None, optional): Path to save the composited video file. Defaults to None ([input_stem]-composite.mp4).
+
+        Returns:
+            Path: The path to the composited video file.
+
+        Raises:
+            ValueError: If the codec is unknown or an input has no video stream.
+        """
+        if codec not in COMPOSITE_CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        settings = COMPOSITE_CODECS[codec]
+        input_path, output_path = self._prep_paths(
+            input_path, output_path, "-composite" + settings["ext"]
+        )
+        captions_path, _ = self._prep_paths(captions_path)
+        logging.info(f"Compositing captions of {captions_path} over: {input_path}")
+
+        info, captions = self._probe(input_path), self._probe(captions_path)
+        for path, media in [(input_path, info), (captions_path, captions)]:
+            if not media.video_codec:
+                raise ValueError(f"No video stream in: {path}")
+        scale_filter = f"scale=iw*{scale}:-1" if scale else f"scale={info.width}:-1"
+        # Key and scale the render, then overlay it on the original timeline,
+        # holding each captions frame until the next and none after the last
+        graph = (
+            f"[1:v:0]{colorkey_filter(color, tolerance)},{scale_filter}[captions];"
+            f"[0:v:0][captions]overlay=x={x}:y={y}:eof_action=pass:format=auto,"
+            "format=yuv420p[video]"
+        )
+
+        cache_key = self._cache_key(
+            "composite",
+            [input_path, captions_path],
+            dict(graph=graph, video=settings["video"], audio=audio),
+        )
+        if self._up_to_date(cache_key, output_path):
+            return output_path
+
+        start, self._processes = time.monotonic(), []
+        duration = (
+            float(info.frames / info.frame_rate) if info.frames else info.duration
+        )
+        with self._atomic_output(output_path) as partial:
+            self._run(
+                self._ffmpeg_run
+                + self._input_options()
+                + ["-i", input_path]
+                + self._input_options()
+                + ["-i", captions_path]
+                + ["-filter_complex", graph, "-map", "[video]"]
+                + (
+                    ["-map", "0:a:0"] + self._audio_options(info, audio)
+                    if info.audio_codec
+                    else []
+                )
+                + settings["video"]
+                + ["-movflags", "+faststart"]
+                + self._output_options()
+                + [partial],
+                f"composite {input_path.name}",
+                duration,
+                partial,
+            )
+        self._put_output(cache_key, output_path)
+        self._finish_job("composite", input_path, output_path, duration, start)
+        logging.info(f"Video saved: {output_path}")
+        return output_path
+
+    def preview(
+        self,
+        input_path: str | Path,
+        color: str = "000000",
+        tolerance: float = 0.01,
+        start: float = 0,
+        duration: float | None = 10,
+        step: int = 1,
+        width: int = 640,
+        background: str | Path | None = None,
+        output_path: str | Path | None = None,
+    ) -> Path:
+        """
+        Keys a short low-resolution stretch of a video over a checkerboard, to tune the tolerance within seconds.
+
+        The frames are keyed at full resolution with the same colorkey filter
+        as `mask`, so the preview shows what `mask` will key, and only then
+        scaled down, laid over the background and encoded with the fastest
+        x264 settings.
+
+        Args:
+            input_path (str | Path): The path to the captions.ai render.
+            color (str, optional): Color to be masked in hexadecimal format. Defaults to "000000".
+            tolerance (float, optional): Tolerance level for color matching. Defaults to 0.01.
+            start (float, optional): Seconds into the video where the preview starts. Defaults to 0.
+            duration (float | None, optional): Seconds of video to preview. Defaults to 10 (None for all of it).
+            step (int, optional): Key only every step-th frame. Defaults to 1.
+            width (int, optional): Width of the preview in pixels. Defaults to 640.
+            background (str | Path | None, optional): An image or video (e.g. the original footage) to show behind the captions, scaled to the width and with the captions at the bottom, as `composite` places them. Defaults to None (a checkerboard).
+            output_path (str | Path | None, optional): Path to save the preview. Defaults to None ([input_stem]-preview.mp4).
+
+        Returns:
+            Path: The path to the preview video file.
+
+        Raises:
+            ValueError: If the input has no video stream or step is below 1.
+        """
+        input_path, output_path = self._prep_paths(
+            input_path, output_path, "-preview.mp4"
+        )
+        logging.info(f"Previewing color {color} at tolerance {tolerance}: {input_path}")
+        info = self._probe(input_path)
+        if not info.video_codec:
+            raise ValueError(f"No video stream in: {input_path}")
+        if step < 1:
+            raise ValueError(f"step must be at least 1: {step}")
+        width = width // 2 * 2
+        height = max(2, round(info.height * width / info.width / 2) * 2)
+        rate = info.frame_rate / step
+        window = ["-ss", str(start)] + (["-t", str(duration)] if duration else [])
+        thin = [f"framestep={step}"] if step > 1 else []
+
+        inputs = window + self._input_options() + ["-i", input_path]
+        if background:
+            background, _ = self._prep_paths(background)
+            if self._probe(background).frames > 1:
+                # Footage runs along on the same stretch of the timeline
+                inputs += window + self._input_options() + ["-i", background]
+            else:
+                inputs += ["-loop", "1", "-framerate", str(rate), "-i", background]
+            backdrop = f"[1:v:0]{''.join(f + ',' for f in thin)}scale={width}:-2"
+        else:
+            columns, rows = -(-width // CHECKER_SIZE), -(-height // CHECKER_SIZE)
+            backdrop = (
+                f"color=c=black:s={columns}x{rows}:r={rate},format=yuv444p,"
+                "geq=lum='if(mod(X+Y,2),191,127)':cb=128:cr=128,"
+                f"scale={columns * CHECKER_SIZE}:{rows * CHECKER_SIZE}:flags=neighbor,"
+                f"crop={width}:{height}:0:0"
+            )
+        graph = (
+            f"[0:v:0]{','.join(thin + [colorkey_filter(color, tolerance)])},"
+            f"scale={width}:{height}[captions];{backdrop}[backdrop];"
+            # Placed like composite places them on footage of another shape
+            "[backdrop][captions]overlay=x=(W-w)/2:y=H-h:shortest=1:format=auto,"
+            "format=yuv420p[video]"
+        )
+
+        cache_key = self._cache_key(
+            "preview",
+            [input_path] + ([background] if background else []),
+            dict(graph=graph, window=window, video=PREVIEW_X264),
+        )
+        if self._up_to_date(cache_key, output_path):
+            return output_path
+
+        start_time, self._processes = time.monotonic(), []
+        seconds = min(duration or info.duration, max(0.0, info.duration - start))
+        with self._atomic_output(output_path) as partial:
+            self._run(
+                self._ffmpeg_run
+                + inputs
+                + ["-filter_complex", graph, "-map", "[video]", "-an"]
+                + PREVIEW_X264
+                + self._output_options()
+                + [partial],
+                f"preview {input_path.name}",
+                seconds,
+                partial,
+            )
+        self._put_output(cache_key, output_path)
+        self._finish_job("preview", input_path, output_path, seconds, start_time)
+        logging.info(f"Preview saved: {output_path}")
+        return output_path
+
+    def blank_batch(
+        self, *inputs: str | Path, workers: int | None = None, **kwargs
+    ) -> list[dict]:
+        """
+        Creates blank videos for many input files in parallel.
+
+        Args:
+            *inputs (str | Path): Input video files, directories or glob patterns.
+            workers (int | None, optional): Number of concurrent ffmpeg jobs. Defaults to None (one per 4 CPUs).
+            **kwargs: Options passed to `blank` for every file, e.g. color, width, height.
+
+        Returns:
+            list[dict]: One result per file, with the input, output, ok, error and seconds keys.
+        """
+        return run_batch(self._init_kwargs, "blank", inputs, kwargs, workers)
+
+    def mask_batch(
+        self, *inputs: str | Path, workers: int | None = None, **kwargs
+    ) -> list[dict]:
+        """
+        Applies a color key mask to many video files in parallel.
+
+        Args:
+            *inputs (str | Path): Input video files, directories or glob patterns.
+            workers (int | None, optional): Number of concurrent ffmpeg jobs. Defaults to None (one per 4 CPUs).
+            **kwargs: Options passed to `mask` for every file, e.g. color, tolerance, fps.
+
+        Returns:
+            list[dict]: One result per file, with the input, output, ok, error and seconds keys.
+        """
+        return run_batch(self._init_kwargs, "mask", inputs, kwargs, workers)
+
+    def plan(
+        self,
+        method: str,
+        *inputs: str | Path,
+        format: str = "json",
+        plan_path: str | Path | None = None,
+        **kwargs,
+    ) -> str | Path:
+        """
+        Writes the ffmpeg commands of a job or a batch as a dependency graph, without running them.
+
+        Every input is probed and every option resolved as for a real run, and
+        each ffmpeg process that would run becomes a step with the files it
+        reads and writes. The steps write their outputs directly, and the
+        runner of the plan (make, ninja, or a scheduler that reads the JSON)
+        decides which are stale. A segmented mask plans each segment and the
+        concat that joins them as separate steps, in a ``.[output_name].parts``
+        folder next to the output.
+
+        Args:
+            method (str): "blank", "mask", "composite" or "preview".
+            *inputs (str | Path): Input video files, directories or glob patterns.
+            format (str, optional): "json", "make" (a GNU Makefile) or "ninja". Defaults to "json".
+            plan_path (str | Path | None, optional): File to write the plan to. Defaults to None (return it).
+            **kwargs: Options passed to the method for every file, e.g. codec or segments.
+
+        Returns:
+            str | Path: The plan, or plan_path if it was written there.
+
+        Raises:
+            ValueError: If the method or format is unknown, or a mask option needs an analysis of the frames first (sparse, crop or the numpy engine).
+        """
+        if method not in PLAN_METHODS:
+            raise ValueError(f"Cannot plan: {method}")
+        if format not in FORMATS:
+            raise ValueError(f"Unknown plan format: {format}")
+        paths = expand_inputs(inputs)
+        if len(paths) > 1 and kwargs.get("output_path"):
+            raise ValueError(
+                "A plan of several inputs derives one output per input; output_path is not supported"
+            )
+        self._plan = Plan()
+        try:
+            for input_path in paths:
+                getattr(self, method)(input_path, **kwargs)
+            steps, text = len(self._plan.steps), self._plan.render(format)
+        finally:
+            self._plan = None
+        if not plan_path:
+            return text
+        plan_path = Path(plan_path).resolve()
+        plan_path.write_text(text)
+        logging.info(f"Plan of {steps} steps saved: {plan_path}")
+        return plan_path
+
+    def _server_address(self, address: str | Path | None) -> str:
+        """
+        Returns the job server address: the given one, ``$VID2CAPTIONSAI_SERVER``,
+        or ``server.sock`` in the cache directory.
+        """
+        return str(
+            address
+            or os.environ.get("VID2CAPTIONSAI_SERVER")
+            or (self._cache_dir or default_cache_dir()) / "server.sock"
+        )
+
+    def serve(self, address: str | Path | None = None, workers: int | None = None):
+        """
+        Runs a job server that queues blank and mask jobs and runs them on a fixed worker budget.
+
+        Jobs run with the settings of this instance (ffmpeg, cache, metrics,
+        force). The server stops on Ctrl-C or SIGTERM and cancels its jobs.
+
+        Args:
+            address (str | Path | None, optional): A Unix socket path, or "host:port" or "port" for HTTP on localhost. Defaults to None (``server.sock`` in the cache directory).
+            workers (int | None, optional): Number of concurrent jobs. Defaults to None (one per 4 CPUs).
+        """
+        from .server import serve
+
+        serve(self._server_address(address), self._init_kwargs, workers)
+
+    def submit(
+        self,
+        method: str,
+        input_path: str | Path,
+        address: str | Path | None = None,
+        priority: int = 0,
+        wait: bool = True,
+        **kwargs,
+    ) -> dict:
+        """
+        Sends a blank or mask job to the job server and waits for it.
+
+        Args:
+            method (str): "blank" or "mask".
+            input_path (str | Path): The path to the input video file, or an http(s) URL.
+            address (str | Path | None, optional): The server address. Defaults to None (see `serve`).
+            priority (int, optional): Jobs with a higher priority run first. Defaults to 0.
+            wait (bool, optional): Wait until the job is finished; Ctrl-C cancels it. Defaults to True.
+            **kwargs: Options of the method, e.g. color, tolerance, codec.
 
         Returns:
-            Path to the output video file.
+            dict: The job, with its id, status, output and error.
+
+        Raises:
+            ValueError: If the input or output is "-", which the server cannot reach.
+            RuntimeError: If the server rejects the job, or it fails while waiting.
         """
+        from . import server
+
+        address = self._server_address(address)
+        # The server may run in another directory, and cannot reach our stdio
+        input_path = streams.parse_source(input_path)
+        if input_path == streams.STDIN or kwargs.get("output_path") == streams.STDIO:
+            raise ValueError("A job server cannot read stdin or write stdout")
+        if kwargs.get("output_path"):
+            kwargs["output_path"] = str(Path(kwargs["output_path"]).resolve())
+        job = server.request(
+            address,
+            "POST",
+            "/jobs",
+            {
+                "method": method,
+                "input": str(input_path),
+                "kwargs": kwargs,
+                "priority": priority,
+            },
+        )
+        logging.info(f"Submitted {method} job {job['id']}")
+        if not wait:
+            return job
+        job = server.wait(address, job["id"])
+        if job["status"] == "failed":
+            raise RuntimeError(f"Job {job['id']} failed: {job['error']}")
+        return job
+
+    def jobs(
+        self, job_id: str | None = None, address: str | Path | None = None
+    ) -> list[dict] | dict:
+        """
+        Shows the jobs of the job server, or one job.
+
+        Args:
+            job_id (str | None, optional): The job id. Defaults to None (all jobs).
+            address (str | Path | None, optional): The server address. Defaults to None (see `serve`).
+
+        Returns:
+            list[dict] | dict: The jobs, or the job.
+        """
+        from . import server
+
+        path = f"/jobs/{job_id}" if job_id else "/jobs"
+        return server.request(self._server_address(address), "GET", path)
+
+    def cancel(self, job_id: str, address: str | Path | None = None) -> dict:
+        """
+        Cancels a queued or running job of the job server.
+
+        Args:
+            job_id (str): The job id.
+            address (str | Path | None, optional): The server address. Defaults to None (see `serve`).
+
+        Returns:
+            dict: The job.
+        """
+        from . import server
+
+        return server.request(
+            self._server_address(address), "DELETE", f"/jobs/{job_id}"
+        )
+
+    def bench_startup(self, repeat: int = 10) -> list[dict]:
+        """
+        Measures the fixed startup cost per call: import, help, ffmpeg resolution and a cached probe.
+
+        Args:
+            repeat (int, optional): Runs per step, of which the median counts. Defaults to 10.
+
+        Returns:
+            list[dict]: One record per step with the median and minimum milliseconds.
+        """
+        from .bench import bench_startup
+
+        return bench_startup(self, repeat)
+
+    def bench_suite(
+        self,
+        output_path: str | Path | None = None,
+        baseline: str | Path | None = None,
+        threshold: float = 0.1,
+        quick: bool = False,
+        repeat: int = 3,
+    ) -> dict:
+        """
+        Runs the benchmark suite on generated fixtures and checks it for regressions.
+
+        Args:
+            output_path (str | Path | None, optional): JSON file to save the results to. Defaults to None.
+            baseline (str | Path | None, optional): Results of an earlier run to compare against. Defaults to None.
+            threshold (float, optional): Relative slowdown that counts as a regression. Defaults to 0.1.
+            quick (bool, optional): Run a single small fixture once, as a smoke test. Defaults to False.
+            repeat (int, optional): Runs per command, of which the median counts. Defaults to 3.
+
+        Returns:
+            dict: The results, with a "comparison" against the baseline if there is one.
+
+        Raises:
+            RuntimeError: If a command is slower than in the baseline by more than the threshold.
+        """
+        from . import bench
+
+        results = bench.run_suite(
+            self,
+            bench.QUICK_CASES if quick else None,
+            repeat=1 if quick else repeat,
+        )
+        if output_path:
+            Path(output_path).write_text(json.dumps(results, indent=2) + "\n")
+            logging.info(f"Benchmark results saved: {output_path}")
+        if baseline:
+            comparison = bench.compare_results(
+                json.loads(Path(baseline).read_text()), results, threshold
+            )
+            results["comparison"] = comparison
+            regressions = [c for c in comparison if c["regression"]]
+            for c in comparison:
+                logging.info(
+                    f"{c['case']} {c['command']}: {c['baseline']} s -> {c['current']} s"
+                    f" ({c['change']:+.1%})"
+                )
+            if regressions:
+                raise RuntimeError(
+                    f"{len(regressions)} benchmark regressions above {threshold:.0%}: "
+                    + ", ".join(
+                        f"{c['case']} {c['command']} {c['change']:+.1%}"
+                        for c in regressions
+                    )
+                )
+        return results
+
+    def bench_keyers(
+        self,
+        width: int = 1280,
+        height: int = 720,
+        fps: str | float = 30,
+        duration: float = 10,
+    ) -> list[dict]:
+        """
+        Compares the speed of the mask keying engines on a generated fixture.
+
+        Args:
+            width (int, optional): Fixture width in pixels. Defaults to 1280.
+            height (int, optional): Fixture height in pixels. Defaults to 720.
+            fps (str | float, optional): Fixture frame rate. Defaults to 30.
+            duration (float, optional): Fixture duration in seconds. Defaults to 10.
+
+        Returns:
+            list[dict]: One record per engine with the seconds and frames per second.
+        """
+        from .bench import bench_keyers
+
+        return bench_keyers(self, width, height, fps, duration)
+
+    def bench_codecs(
+        self,
+        *codecs: str,
+        width: int = 1280,
+        height: int = 720,
+        fps: str | float = 30,
+        duration: float = 10,
+    ) -> list[dict]:
+        """
+        Compares the speed and size of the mask output codecs on a generated fixture.
+
+        Args:
+            *codecs (str): Codec names to compare. Defaults to all of them.
+            width (int, optional): Fixture width in pixels. Defaults to 1280.
+            height (int, optional): Fixture height in pixels. Defaults to 720.
+            fps (str | float, optional): Fixture frame rate. Defaults to 30.
+            duration (float, optional): Fixture duration in seconds. Defaults to 10.
+
+        Returns:
+            list[dict]: One record per codec with the encode fps, bytes per second of video and peak RSS.
+        """
+        from .bench import bench_codecs
+
+        unknown = [codec for codec in codecs if codec not in MASK_CODECS]
+        if unknown:
+            raise ValueError(f"Unknown codec: {', '.join(unknown)}")
+        return bench_codecs(self, width, height, fps, duration, list(codecs) or None)
@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from vid2captionsai import activity
+
+# Only frames with captions get bbox metadata, and only those are printed
+METADATA = "".join(
+    f"frame:{n}    pts:{n * 512}    pts_time:{n / 30}\n"
+    f"lavfi.bbox.x1={10 + n}\nlavfi.bbox.x2=90\n"
+    f"lavfi.bbox.y1=20\nlavfi.bbox.y2={30 + n}\n"
+    f"lavfi.bbox.w=81\nlavfi.bbox.h=11\n"
+    for n in (3, 4, 5, 40, 41)
+)
+
+
+class TestActivity(unittest.TestCase):
+    def test_parse_active_frames(self):
+        """Test that frames with a non-zero alpha maximum are active"""
+        self.assertEqual(activity.parse_active_frames(METADATA), [3, 4, 5, 40, 41])
+
+    def test_parse_bounding_box(self):
+        """Test the union of the per-frame bounding boxes"""
+        self.assertEqual(activity.parse_bounding_box(METADATA), [13, 20, 90, 71])
+        self.assertIsNone(activity.parse_bounding_box("frame:0 pts:0 pts_time:0\n"))
+
+    def test_crop_box(self):
+        """Test scaling, padding, clamping and even alignment of the crop"""
+        # A 320x108 analysis of a 2160x720 frame
+        self.assertEqual(
+            activity.crop_box([13, 20, 90, 71], (320, 108), 2160, 720, 16),
+            [70, 116, 562, 380],
+        )
+        self.assertEqual(
+            activity.crop_box([0, 0, 319, 107], (320, 108), 2160, 720, 16),
+            [0, 0, 2160, 720],
+        )
+
+    def test_frame_segments(self):
+        """Test grouping, gap merging and padding of active frames"""
+        active = [3, 4, 5, 40, 41]
+        self.assertEqual(
+            activity.frame_segments(active, 90, "30/1", min_gap=0.5),
+            [[3, 6], [40, 42]],
+        )
+        self.assertEqual(
+            activity.frame_segments(active, 90, "30/1", min_gap=2.0), [[3, 42]]
+        )
+        self.assertEqual(
+            activity.frame_segments(active, 43, "30/1", min_gap=0.5, padding=0.1),
+            [[0, 9], [37, 43]],
+        )
+
+    def test_timeline(self):
+        """Test that the timeline covers every frame"""
+        self.assertEqual(
+            activity.timeline([[3, 6], [40, 42]], 90),
+            [
+                (0, 3, False),
+                (3, 6, True),
+                (6, 40, False),
+                (40, 42, True),
+                (42, 90, False),
+            ],
+        )
+        self.assertEqual(activity.timeline([], 10), [(0, 10, False)])
+
+    def test_timecode(self):
+        self.assertEqual(activity.timecode(0, "30/1"), "00:00:00:00")
+        self.assertEqual(activity.timecode(30 * 3661 + 7, "30/1"), "01:01:01:07")
+        self.assertEqual(activity.timecode(31, "30000/1001"), "00:00:01:01")
+
+    def test_cut_lists(self):
+        """Test that the EDL and FCPXML list every segment"""
+        with tempfile.TemporaryDirectory() as test_dir:
+            edl = Path(test_dir) / "cuts.edl"
+            fcpxml = Path(test_dir) / "cuts.fcpxml"
+            segments = [[3, 6], [40, 42]]
+            activity.write_edl(edl, segments, "30/1", "render", "render.mp4")
+            activity.write_fcpxml(
+                fcpxml, segments, 90, "30/1", Path(test_dir) / "render.mp4", 640, 360
+            )
+            self.assertEqual(edl.read_text().count("FROM CLIP NAME"), 2)
+            self.assertIn("00:00:00:03 00:00:00:06", edl.read_text())
+            xml = fcpxml.read_text()
+            self.assertEqual(xml.count("<asset-clip"), 2)
+            self.assertEqual(xml.count("<gap"), 3)
+            self.assertIn('duration="3s"', xml)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import asyncio
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from vid2captionsai import runner
+from vid2captionsai.aio import AsyncPrepAudioVideo
+from vid2captionsai.index import MetadataIndex
+from vid2captionsai.vid2captionsai import PrepAudioVideo
+
+
+def sleeping_blank(self, input_path, **kwargs):
+    """Stands in for blank with a child process that runs until it is killed"""
+    runner.run(["sleep", "30"], check=True)
+    return Path(input_path)
+
+
+class TestProcessScope(unittest.TestCase):
+    def test_cancel_kills_processes(self):
+        """Test that cancelling a scope kills its running and later processes"""
+        scope = runner.ProcessScope()
+        errors = []
+
+        def work():
+            runner.process_scope.set(scope)
+            for _ in range(2):
+                try:
+                    runner.run(["sleep", "30"], check=True)
+                except subprocess.CalledProcessError as e:
+                    errors.append(e.returncode)
+
+        thread = threading.Thread(target=work)
+        start = time.monotonic()
+        thread.start()
+        time.sleep(0.2)
+        scope.cancel()
+        thread.join(10)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(errors, [-9, -9])
+        self.assertEqual(scope.processes, set())
+
+    def test_run_without_scope(self):
+        """Test that without a scope runner.run is subprocess.run"""
+        with patch("subprocess.run") as mock_run:
+            runner.run(["ffprobe", "x"], capture_output=True)
+        mock_run.assert_called_once_with(["ffprobe", "x"], capture_output=True)
+
+
+class TestAsyncPrepAudioVideo(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.input_path = Path(self.test_dir) / "input.mp4"
+        self.input_path.write_bytes(b"video")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_timeout_kills_ffmpeg(self):
+        """Test that a timeout cancels the call and kills its child process"""
+
+        async def main():
+            prep = AsyncPrepAudioVideo(cache_dir=self.test_dir)
+            with self.assertRaises(asyncio.TimeoutError):
+                await prep.blank(self.input_path, timeout=0.3)
+
+        start = time.monotonic()
+        with patch.object(PrepAudioVideo, "blank", sleeping_blank):
+            asyncio.run(main())
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_semaphore_limits_calls(self):
+        """Test that calls beyond the limit wait for a slot"""
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def counting_mask(self, input_path, **kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.1)
+            with lock:
+                running[0] -= 1
+            return Path(input_path)
+
+        async def main():
+            prep = AsyncPrepAudioVideo(limit=2, cache_dir=self.test_dir)
+            return await asyncio.gather(
+                *(prep.mask(self.input_path, codec="vp9") for _ in range(6))
+            )
+
+        with patch.object(PrepAudioVideo, "mask", counting_mask):
+            outputs = asyncio.run(main())
+        self.assertEqual(outputs, [self.input_path] * 6)
+        self.assertEqual(peak[0], 2)
+
+    def test_probe_uses_index(self):
+        """Test that indexed metadata is returned without running ffprobe"""
+        MetadataIndex(Path(self.test_dir) / "index.sqlite").put_probe(
+            self.input_path.resolve(),
+            {"duration": 2.0, "fps": "25/1", "frames": 50},
+        )
+
+        async def main():
+            return await AsyncPrepAudioVideo(cache_dir=self.test_dir).probe(
+                self.input_path
+            )
+
+        with patch("asyncio.create_subprocess_exec") as create:
+            info = asyncio.run(main())
+        create.assert_not_called()
+        self.assertEqual((info.frames, info.fps), (50, "25/1"))
+
+    def test_probe_url(self):
+        """Test that a URL is probed from its header as given and not indexed"""
+        url = "https://example.com/talk.mp4"
+        header = b'{"format": {"duration": "2.0"}, "streams": []}'
+
+        class Process:
+            returncode = 0
+
+            async def communicate(self):
+                return header, b""
+
+        async def create(*cmd, **kwargs):
+            commands.append(cmd)
+            return Process()
+
+        async def main():
+            prep = AsyncPrepAudioVideo(cache_dir=self.test_dir)
+            with self.assertRaises(ValueError):
+                await prep.probe("-")
+            return await prep.probe(url)
+
+        commands = []
+        with patch("asyncio.create_subprocess_exec", create), patch.object(
+            MetadataIndex, "put_probe"
+        ) as put_probe:
+            info = asyncio.run(main())
+        put_probe.assert_not_called()
+        self.assertEqual(info.duration, 2.0)
+        self.assertEqual(commands[0][-1], url)
+        self.assertNotIn("-show_entries", commands[0])
+
+    def test_probe_timeout_covers_wait(self):
+        """Test that the probe timeout includes the wait for a semaphore slot"""
+
+        async def main():
+            semaphore = asyncio.Semaphore(1)
+            prep = AsyncPrepAudioVideo(semaphore=semaphore, cache_dir=self.test_dir)
+            async with semaphore:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await prep.probe(self.input_path, timeout=0.2)
+
+        with patch("asyncio.create_subprocess_exec") as create:
+            asyncio.run(main())
+        create.assert_not_called()
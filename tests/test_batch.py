@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from vid2captionsai import batch
+from vid2captionsai.vid2captionsai import PrepAudioVideo
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        for name in ["a.mp4", "b.mov", "notes.txt"]:
+            (Path(self.test_dir) / name).write_text("dummy")
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_expand_directory(self):
+        """Test that directories contribute their video files"""
+        paths = batch.expand_inputs([self.test_dir])
+        self.assertEqual([p.name for p in paths], ["a.mp4", "b.mov"])
+
+    def test_expand_glob_and_duplicates(self):
+        """Test that globs expand and duplicates are dropped"""
+        a = str(Path(self.test_dir) / "a.mp4")
+        paths = batch.expand_inputs([a, str(Path(self.test_dir) / "*.mp4")])
+        self.assertEqual(paths, [Path(a).resolve()])
+
+    def test_plan_workers(self):
+        """Test that workers and threads share the CPUs"""
+        with patch.object(batch, "available_cpus", return_value=32):
+            self.assertEqual(batch.plan_workers(100), (8, 4))
+            self.assertEqual(batch.plan_workers(2), (2, 16))
+            self.assertEqual(batch.plan_workers(100, workers=3), (3, 10))
+            self.assertEqual(batch.plan_workers(0), (1, 32))
+
+    def test_run_job_reports_failure(self):
+        """Test that a failing job is reported instead of raised"""
+        result = batch.run_job(
+            {"cache_dir": self.test_dir},
+            "blank",
+            Path(self.test_dir) / "missing.mp4",
+            {},
+        )
+        self.assertFalse(result["ok"])
+        self.assertIsNone(result["output"])
+        self.assertIn("Error", result["error"])
+
+    def test_run_batch_rejects_output_path(self):
+        """Test that no batched method lets every job write one output"""
+        for method in ["blank", "mask"]:
+            with self.assertRaises(ValueError):
+                batch.run_batch(
+                    {"cache_dir": self.test_dir},
+                    method,
+                    [self.test_dir],
+                    {"output_path": "same.mp4"},
+                )
+
+    def test_run_batch_survives_dead_worker(self):
+        """Test that a dead worker fails only its own job and the rest rerun"""
+
+        def blank(self, input_path, **kwargs):
+            if input_path.name == "crash.mp4":
+                os._exit(1)
+            return input_path
+
+        (Path(self.test_dir) / "crash.mp4").write_text("dummy")
+        with patch.object(PrepAudioVideo, "blank", blank):
+            results = batch.run_batch(
+                {"cache_dir": self.test_dir}, "blank", [self.test_dir], {}
+            )
+        self.assertEqual(
+            [(Path(r["input"]).name, r["ok"]) for r in results],
+            [("a.mp4", True), ("b.mov", True), ("crash.mp4", False)],
+        )
+        self.assertIn("BrokenProcessPool", results[2]["error"])
+
+
+class TestCpuBudget(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.proc = self.root / "proc-cgroup"
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, path, text):
+        path = self.root / "fs" / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+    def limit(self):
+        return batch.cgroup_cpu_limit(self.root / "fs", self.proc)
+
+    def test_cgroup_v2(self):
+        """Test that the strictest cpu.max of the cgroup and its parents counts"""
+        self.proc.write_text("0::/kubepods/pod1/c1\n")
+        self.write("cgroup.controllers", "cpu io memory")
+        self.write("cpu.max", "max 100000")
+        self.write("kubepods/cpu.max", "800000 100000")
+        self.write("kubepods/pod1/cpu.max", "250000 100000")
+        self.write("kubepods/pod1/c1/cpu.max", "max 100000")
+        self.assertEqual(self.limit(), 2.5)
+
+    def test_cgroup_v2_namespace(self):
+        """Test that a cgroup namespace, where the own cgroup is the root, is read"""
+        self.proc.write_text("0::/\n")
+        self.write("cgroup.controllers", "cpu")
+        self.write("cpu.max", "150000 100000")
+        self.assertEqual(self.limit(), 1.5)
+
+    def test_cgroup_v1_hybrid(self):
+        """Test cfs quotas of cgroup v1 next to a controller-less unified hierarchy"""
+        self.proc.write_text("4:memory:/job\n2:cpu,cpuacct:/job\n0::/job\n")
+        self.write("unified/cgroup.controllers", "")
+        self.write("cpu,cpuacct/job/cpu.cfs_quota_us", "300000")
+        self.write("cpu,cpuacct/job/cpu.cfs_period_us", "100000")
+        self.write("cpu,cpuacct/cpu.cfs_quota_us", "-1")
+        self.write("cpu,cpuacct/cpu.cfs_period_us", "100000")
+        self.assertEqual(self.limit(), 3.0)
+
+    def test_no_quota(self):
+        """Test that unlimited or missing cgroups give no limit"""
+        self.assertIsNone(self.limit())
+        self.proc.write_text("0::/\n")
+        self.write("cgroup.controllers", "cpu")
+        self.write("cpu.max", "max 100000")
+        self.assertIsNone(self.limit())
+
+    def test_budget(self):
+        """Test that a quota lowers the affinity and the environment overrides both"""
+        with patch.object(batch, "cgroup_cpu_limit", return_value=2.5), patch(
+            "os.sched_getaffinity", return_value=set(range(16))
+        ), patch.dict("os.environ", {batch.CPUS_ENV: ""}):
+            self.assertEqual(batch.cpu_budget(), (2, "cgroup quota 2.5"))
+            with patch.dict("os.environ", {batch.CPUS_ENV: "6"}):
+                self.assertEqual(batch.cpu_budget(), (6, batch.CPUS_ENV))
+        with patch.object(batch, "cgroup_cpu_limit", return_value=0.5), patch(
+            "os.sched_getaffinity", return_value={0, 1}
+        ), patch.dict("os.environ", {batch.CPUS_ENV: ""}):
+            self.assertEqual(batch.cpu_budget()[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
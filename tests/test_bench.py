@@ -0,0 +1,87 @@
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from vid2captionsai.bench import bench_keyers, case_name, compare_results
+from vid2captionsai.metrics import job_record
+
+
+def results(*entries):
+    return {
+        "results": [
+            {"case": case, "command": command, "seconds": seconds}
+            for case, command, seconds in entries
+        ]
+    }
+
+
+class TestCompareResults(unittest.TestCase):
+    def test_regression(self):
+        """Test that slowdowns above the threshold are flagged"""
+        baseline = results(("a", "blank", 2.0), ("a", "mask", 4.0))
+        current = results(("a", "blank", 2.1), ("a", "mask", 5.0))
+        comparison = compare_results(baseline, current, 0.1)
+        self.assertEqual([c["change"] for c in comparison], [0.05, 0.25])
+        self.assertEqual([c["regression"] for c in comparison], [False, True])
+
+    def test_new_entries(self):
+        """Test that results missing from the baseline are not compared"""
+        comparison = compare_results(
+            results(("a", "blank", 1.0)),
+            results(("a", "blank", 0.5), ("b", "blank", 9.0)),
+        )
+        self.assertEqual(len(comparison), 1)
+        self.assertEqual(comparison[0]["change"], -0.5)
+        self.assertFalse(comparison[0]["regression"])
+
+    def test_case_name(self):
+        """Test the fixture name"""
+        self.assertEqual(
+            case_name(
+                {"width": 2160, "height": 720, "fps": "30000/1001", "duration": 10}
+            ),
+            "2160x720@30000/1001 10s",
+        )
+
+
+class TestBenchKeyers(unittest.TestCase):
+    def test_engines(self):
+        """Test that mask is timed once per engine on the fixture"""
+        prep = mock.Mock()
+        prep._probe.return_value.frames = 30
+        with mock.patch(
+            "vid2captionsai.bench.make_fixture", return_value=Path("fixture.mp4")
+        ):
+            records = bench_keyers(prep, 640, 360, 30, 1)
+        self.assertEqual([r["engine"] for r in records], ["colorkey", "numpy"])
+        self.assertEqual([r["size"] for r in records], ["640x360"] * 2)
+        self.assertEqual(
+            [call.kwargs["engine"] for call in prep.mask.call_args_list],
+            ["colorkey", "numpy"],
+        )
+
+
+class TestJobRecordStages(unittest.TestCase):
+    def test_stages(self):
+        """Test that process records are summed per stage"""
+        process = {"frames": 10, "cpu_seconds": 1.0, "peak_rss_bytes": 1}
+        record = job_record(
+            "mask",
+            "in.mp4",
+            Path("/nonexistent/out.mov"),
+            1.0,
+            2.0,
+            [
+                dict(process, label="mask 0-10", wall_seconds=0.5),
+                dict(process, label="mask 10-20", wall_seconds=0.25),
+                dict(process, label="concat", wall_seconds=0.1, stream_copy=True),
+            ],
+        )
+        self.assertEqual(record["frames"], 20)
+        self.assertEqual(
+            record["stages"],
+            {
+                "mask": {"processes": 2, "wall_seconds": 0.75, "cpu_seconds": 2.0},
+                "concat": {"processes": 1, "wall_seconds": 0.1, "cpu_seconds": 1.0},
+            },
+        )
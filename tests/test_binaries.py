@@ -0,0 +1,86 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from vid2captionsai import binaries
+from vid2captionsai.__main__ import commands_help
+from vid2captionsai.index import MetadataIndex
+
+ENCODERS = """Encoders:
+ V..... = Video
+ A..... = Audio
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC (codec h264)
+ V..... qtrle                QuickTime Animation (RLE) video
+ A....D aac                  AAC (Advanced Audio Coding)
+"""
+
+FILTERS = """Filters:
+  T.. = Timeline support
+  ------
+ TSC colorkey          V->V       Turns a certain color into transparency.
+ ... split             V->N       Pass on the input to N video outputs.
+ ... amix              N->A       Audio mixing.
+"""
+
+
+class TestBinaries(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.index = MetadataIndex(Path(self.test_dir) / "index.sqlite")
+        self.ffmpeg = Path(self.test_dir) / "ffmpeg"
+        self.ffprobe = Path(self.test_dir) / "ffprobe"
+        for path in [self.ffmpeg, self.ffprobe]:
+            path.write_text("#!/bin/sh\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_parse_capabilities(self):
+        """Test that encoder and filter listings are parsed into names"""
+        self.assertEqual(
+            binaries.parse_capabilities(ENCODERS), ["libx264", "qtrle", "aac"]
+        )
+        self.assertEqual(
+            binaries.parse_capabilities(FILTERS), ["colorkey", "split", "amix"]
+        )
+
+    def test_explicit_paths(self):
+        """Test that explicit paths never ask static_ffmpeg"""
+        with patch("vid2captionsai.binaries.fetch_static") as fetch:
+            paths = binaries.resolve(self.index, self.ffmpeg, self.ffprobe)
+        fetch.assert_not_called()
+        self.assertEqual(paths, (self.ffmpeg.resolve(), self.ffprobe.resolve()))
+
+    def test_static_is_indexed(self):
+        """Test that static_ffmpeg is asked again only after its binary changes"""
+        static = (str(self.ffmpeg), str(self.ffprobe))
+        with patch(
+            "vid2captionsai.binaries.fetch_static", return_value=static
+        ) as fetch:
+            binaries.resolve(self.index)
+            paths = binaries.resolve(self.index)
+            self.assertEqual(fetch.call_count, 1)
+            self.assertEqual(paths, (self.ffmpeg.resolve(), self.ffprobe.resolve()))
+            self.ffmpeg.write_text("#!/bin/sh\n# upgraded\n")
+            binaries.resolve(self.index)
+            self.assertEqual(fetch.call_count, 2)
+
+    def test_info_is_indexed(self):
+        """Test that the capabilities of a binary are queried once"""
+        info = {"version": "ffmpeg version 7.0", "encoders": ["qtrle"], "filters": []}
+        with patch("vid2captionsai.binaries.query_info", return_value=info) as query:
+            self.assertEqual(binaries.ffmpeg_info(self.index, self.ffmpeg), info)
+            self.assertEqual(binaries.ffmpeg_info(self.index, self.ffmpeg), info)
+        query.assert_called_once()
+
+
+class TestCommandsHelp(unittest.TestCase):
+    def test_lists_commands(self):
+        """Test that the help lists the public commands only"""
+        text = commands_help()
+        self.assertIn("    blank\n", text)
+        self.assertIn("    mask\n        Applies a color key mask", text)
+        self.assertNotIn("_run", text)
@@ -0,0 +1,56 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from vid2captionsai import cache
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "input.mp4"
+        self.path.write_bytes(bytes(range(256)) * 64)
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_fingerprint(self):
+        """Test that the fingerprint changes with the sampled content"""
+        first = cache.fingerprint(self.path, sample_size=1024)
+        self.assertEqual(first, cache.fingerprint(self.path, sample_size=1024))
+        data = bytearray(self.path.read_bytes())
+        data[-1] ^= 0xFF
+        self.path.write_bytes(bytes(data))
+        self.assertNotEqual(first, cache.fingerprint(self.path, sample_size=1024))
+
+    def test_cache_key(self):
+        """Test that every parameter is part of the cache key"""
+        key = cache.cache_key("mask", [self.path], {"color": "000000"})
+        self.assertEqual(key, cache.cache_key("mask", [self.path], {"color": "000000"}))
+        self.assertNotEqual(
+            key, cache.cache_key("mask", [self.path], {"color": "FFFFFF"})
+        )
+        self.assertNotEqual(
+            key, cache.cache_key("blank", [self.path], {"color": "000000"})
+        )
+
+    def test_atomic_output(self):
+        """Test that only a completed output appears under its name"""
+        output_path = self.test_dir / "output.mov"
+        with self.assertRaises(RuntimeError):
+            with cache.atomic_output(output_path) as partial:
+                partial.write_text("half")
+                raise RuntimeError("interrupted")
+        self.assertEqual(list(self.test_dir.iterdir()), [self.path])
+
+        with cache.atomic_output(output_path) as partial:
+            self.assertEqual(partial.parent, output_path.parent)
+            partial.write_text("done")
+        self.assertEqual(output_path.read_text(), "done")
+        self.assertFalse(cache.partial_path(output_path).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
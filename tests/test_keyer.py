@@ -0,0 +1,64 @@
+import unittest
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from vid2captionsai.keyer import key_frames
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestKeyFrames(unittest.TestCase):
+    def frames(self, *pixels):
+        return np.array(pixels, dtype=np.uint8).reshape(1, 1, len(pixels), 3)
+
+    def test_key_and_foreground(self):
+        """Test that the key color is transparent and distant colors opaque"""
+        rgba = key_frames(self.frames((0, 0, 0), (255, 255, 255)), "000000", 0.1, 0.1)
+        self.assertEqual(rgba.shape, (1, 1, 2, 4))
+        self.assertEqual(rgba[0, 0, 0, 3], 0)
+        self.assertEqual(rgba[0, 0, 1, 3], 255)
+        self.assertEqual(tuple(rgba[0, 0, 1, :3]), (255, 255, 255))
+
+    def test_falloff(self):
+        """Test the linear and smooth soft edges"""
+        # Distance 0.15 sits halfway through the 0.1 + 0.1 soft edge
+        level = round(0.15 * 255)
+        edge = self.frames((level, level, level))
+        linear = key_frames(edge, "000000", 0.1, 0.1, falloff="linear")
+        smooth = key_frames(edge, "000000", 0.1, 0.1, falloff="smooth")
+        self.assertAlmostEqual(int(linear[0, 0, 0, 3]), 128, delta=5)
+        self.assertAlmostEqual(int(smooth[0, 0, 0, 3]), 128, delta=5)
+
+        quarter = round(0.125 * 255)
+        edge = self.frames((quarter, quarter, quarter))
+        linear = key_frames(edge, "000000", 0.1, 0.1, falloff="linear")
+        smooth = key_frames(edge, "000000", 0.1, 0.1, falloff="smooth")
+        self.assertLess(smooth[0, 0, 0, 3], linear[0, 0, 0, 3])
+
+    def test_despill_and_premultiply(self):
+        """Test that despill removes the key color share from edge pixels"""
+        # Semi-transparent white over a green key: despill recovers a white
+        # foreground, premultiply darkens the green that leaked in
+        mixed = self.frames((128, 255, 128))
+        plain = key_frames(mixed, "00FF00", 0.0, 1.0, falloff="linear")
+        despilled = key_frames(
+            mixed, "00FF00", 0.0, 1.0, falloff="linear", despill=True
+        )
+        premultiplied = key_frames(
+            mixed, "00FF00", 0.0, 1.0, falloff="linear", premultiply=True
+        )
+        self.assertEqual(tuple(plain[0, 0, 0, :3]), (128, 255, 128))
+        self.assertEqual(tuple(despilled[0, 0, 0, :3]), (255, 255, 255))
+        self.assertLess(premultiplied[0, 0, 0, 1], 255)
+        self.assertEqual(premultiplied[0, 0, 0, 3], despilled[0, 0, 0, 3])
+
+    def test_hard_key(self):
+        """Test that a zero blend gives a binary matte"""
+        rgba = key_frames(self.frames((2, 2, 2), (40, 40, 40)), "000000", 0.05, 0.0)
+        self.assertEqual(list(rgba[0, 0, :, 3]), [0, 255])
+
+
+if __name__ == "__main__":
+    unittest.main()
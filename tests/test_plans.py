@@ -0,0 +1,117 @@
+import json
+import unittest
+from pathlib import Path
+
+from vid2captionsai.plans import Plan, command_files, make_path, ninja_path
+
+FFMPEG = Path("/usr/bin/ffmpeg")
+
+
+def segmented_plan():
+    """Two segments of a video and the concat that joins them."""
+    plan = Plan()
+    parts = [Path(f"/work/.out.mov.parts/segment-{n}.mov") for n in range(2)]
+    for part in parts:
+        plan.add(
+            [
+                FFMPEG,
+                "-y",
+                "-i",
+                Path("/work/in.mp4"),
+                "-vf",
+                "colorkey=color=0x000000",
+                part,
+            ],
+            "mask in.mp4",
+        )
+    plan.add(
+        [
+            FFMPEG,
+            "-f",
+            "concat",
+            "-i",
+            Path("/work/list.txt"),
+            "-c",
+            "copy",
+            Path("/work/out.mov"),
+        ],
+        "concat 2 parts",
+        inputs=[Path("/work/list.txt")] + parts,
+    )
+    return plan
+
+
+class TestPlans(unittest.TestCase):
+    def test_command_files(self):
+        """Test that -i files are inputs and other files outputs, but not lavfi"""
+        cmd = [
+            FFMPEG,
+            "-f",
+            "lavfi",
+            "-i",
+            "color=c=black",
+            "-i",
+            Path("/a.mp4"),
+            "-map",
+            "1:a:0",
+            Path("/b.mp4"),
+        ]
+        self.assertEqual(command_files(cmd), ([Path("/a.mp4")], [Path("/b.mp4")]))
+
+    def test_dependencies(self):
+        """Test that the concat depends on the segments and is the only target"""
+        plan = segmented_plan()
+        self.assertEqual(plan.dependencies(), [[], [], [0, 1]])
+        self.assertEqual(plan.targets(), ["/work/out.mov"])
+        document = json.loads(plan.render("json"))
+        self.assertEqual(document["steps"][2]["after"], [0, 1])
+        self.assertEqual(document["steps"][0]["command"][0], "ffmpeg")
+
+    def test_make(self):
+        """Test that the Makefile has a rule per step with escaped paths and recipes"""
+        plan = Plan()
+        plan.add(
+            [
+                FFMPEG,
+                "-i",
+                Path("/in put.mp4"),
+                "-vf",
+                "select=$x",
+                Path("/a.mp4"),
+                Path("/b.mp4"),
+            ],
+            "blank",
+        )
+        makefile = plan.render("make")
+        self.assertIn("all: /a.mp4 /b.mp4\n", makefile)
+        self.assertIn("/a.mp4 /b.mp4 &: /in\\ put.mp4\n", makefile)
+        self.assertIn(
+            "\t$(FFMPEG) -i '/in put.mp4' -vf 'select=$$x' /a.mp4 /b.mp4\n",
+            makefile,
+        )
+        self.assertIn("FFMPEG ?= ffmpeg\n", makefile)
+        self.assertNotIn("/usr/bin/ffmpeg", makefile)
+        self.assertEqual(make_path(Path("/a#1.mp4")), "/a\\#1.mp4")
+
+    def test_ninja(self):
+        """Test that the Ninja file builds each step and defaults to the targets"""
+        ninja = segmented_plan().render("ninja")
+        self.assertIn(
+            "build /work/out.mov: ffmpeg /work/list.txt"
+            " /work/.out.mov.parts/segment-0.mov",
+            ninja,
+        )
+        self.assertIn("  label = concat 2 parts\n", ninja)
+        self.assertIn("ffmpeg = ffmpeg\n", ninja)
+        self.assertIn("  command = $ffmpeg $args\n", ninja)
+        self.assertIn(
+            "  args = -f concat -i /work/list.txt -c copy /work/out.mov\n", ninja
+        )
+        self.assertTrue(ninja.endswith("default /work/out.mov\n"))
+        self.assertEqual(ninja_path(Path("/c:/a b.mp4")), "/c$:/a$ b.mp4")
+        with self.assertRaises(ValueError):
+            segmented_plan().render("cmake")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from vid2captionsai.runner import Progress, format_eta, run_ffmpeg
+
+# Stands in for ffmpeg: writes a progress report to stdout
+FAKE_FFMPEG = f"""#!{sys.executable}
+import sys
+assert sys.argv[1:3] == ["-progress", "pipe:1"]
+data = bytearray(8 << 20)
+print("frame=30\\nout_time_us=1000000\\ntotal_size=4096\\nprogress=continue", flush=True)
+print("frame=60\\nout_time_us=2000000\\ntotal_size=8192\\nprogress=end", flush=True)
+sys.exit(int(sys.argv[-1]))
+"""
+
+# Stands in for ffmpeg writing its output to stdout: progress goes to another pipe
+FAKE_STREAMING_FFMPEG = f"""#!{sys.executable}
+import os, sys
+assert sys.argv[1] == "-progress" and sys.argv[2] != "pipe:1"
+with os.fdopen(int(sys.argv[2].partition(":")[2]), "w") as progress:
+    progress.write("frame=30\\nout_time_us=1000000\\ntotal_size=6\\nprogress=end\\n")
+sys.stdout.write("frames")
+"""
+
+
+class TestRunner(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.ffmpeg = self.test_dir / "ffmpeg"
+        self.ffmpeg.write_text(FAKE_FFMPEG)
+        self.ffmpeg.chmod(0o755)
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_progress(self):
+        """Test parsing of the progress stream"""
+        progress = Progress("test", duration=10)
+        for line in ["frame=50", "out_time_us=2000000", "progress=continue"]:
+            progress.feed(line + "\n")
+        self.assertEqual(progress.frames, 50)
+        self.assertEqual(progress.out_time, 2.0)
+        self.assertIn("frame=50", progress.line())
+        self.assertIsNotNone(progress.eta)
+        self.assertEqual(format_eta(3725), "1:02:05")
+        self.assertEqual(format_eta(None), "?")
+
+    def test_run_ffmpeg(self):
+        """Test that a run reports its progress and resource usage"""
+        record = run_ffmpeg([str(self.ffmpeg), "0"], "test", duration=2)
+        self.assertEqual(record["frames"], 60)
+        self.assertEqual(record["media_seconds"], 2.0)
+        self.assertEqual(record["output_bytes"], 8192)
+        self.assertGreater(record["peak_rss_bytes"], 8 << 20)
+        self.assertGreaterEqual(record["cpu_seconds"], 0)
+
+    def test_run_ffmpeg_to_stdout(self):
+        """Test that output to stdout passes through while progress is still read"""
+        self.ffmpeg.write_text(FAKE_STREAMING_FFMPEG)
+        stdout_path = self.test_dir / "stdout"
+        saved = os.dup(1)
+        try:
+            with open(stdout_path, "w") as f:
+                os.dup2(f.fileno(), 1)
+            record = run_ffmpeg([str(self.ffmpeg), "pipe:1"], "test")
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+        self.assertEqual(stdout_path.read_text(), "frames")
+        self.assertEqual(record["frames"], 30)
+        self.assertEqual(record["output_bytes"], 6)
+
+    def test_run_ffmpeg_failure(self):
+        """Test that a failing process raises"""
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_ffmpeg([str(self.ffmpeg), "3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
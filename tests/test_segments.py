@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from fractions import Fraction
+from pathlib import Path
+
+from vid2captionsai.segments import (
+    journal_path,
+    read_analysis,
+    read_journal,
+    split_at_keyframes,
+    split_by_duration,
+    write_journal,
+)
+
+
+class TestSplitAtKeyframes(unittest.TestCase):
+    def test_even_gops(self):
+        """Test that segments start at the keyframes closest to even splits"""
+        keyframes = [[n, n / 30] for n in range(0, 300, 60)]
+        self.assertEqual(split_at_keyframes(keyframes, 300, 2), [[0, 120], [120, 300]])
+        self.assertEqual(
+            split_at_keyframes(keyframes, 300, 5),
+            [[0, 60], [60, 120], [120, 180], [180, 240], [240, 300]],
+        )
+
+    def test_few_keyframes(self):
+        """Test that missing keyframes give fewer segments that cover every frame"""
+        self.assertEqual(split_at_keyframes([[0, 0.0]], 100, 4), [[0, 100]])
+        self.assertEqual(
+            split_at_keyframes([[0, 0.0], [90, 3.0]], 100, 4), [[0, 90], [90, 100]]
+        )
+
+    def test_intra_only(self):
+        """Test that every frame being a keyframe gives exact splits"""
+        keyframes = [[n, n / 25] for n in range(100)]
+        self.assertEqual(
+            split_at_keyframes(keyframes, 100, 4),
+            [[0, 25], [25, 50], [50, 75], [75, 100]],
+        )
+
+    def test_split_by_duration(self):
+        """Test that segments of a duration start at the nearest keyframes"""
+        keyframes = [[n, n / 30] for n in range(0, 900, 60)]
+        self.assertEqual(
+            split_by_duration(keyframes, 900, Fraction(30), 10),
+            [[0, 300], [300, 600], [600, 900]],
+        )
+        self.assertEqual(
+            split_by_duration(keyframes, 900, Fraction(30), 60), [[0, 900]]
+        )
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.journal = journal_path(self.test_dir / "talk-mask.mov")
+        self.segment = self.test_dir / "segment-0.mov"
+        self.segment.write_text("keyed frames")
+        stat = self.segment.stat()
+        self.entry = {
+            "path": str(self.segment),
+            "frames": 30,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def test_round_trip(self):
+        """Test that finished segments are read back for the same cache key only"""
+        self.assertEqual(self.journal.name, ".talk-mask.mov.journal.json")
+        self.assertEqual(read_journal(self.journal, "key"), {})
+        write_journal(self.journal, "key", {"0:30": self.entry})
+        self.assertEqual(read_journal(self.journal, "key"), {"0:30": self.entry})
+        self.assertEqual(read_journal(self.journal, "other key"), {})
+
+    def test_changed_segment(self):
+        """Test that a segment changed or removed since it was recorded is redone"""
+        write_journal(self.journal, "key", {"0:30": self.entry})
+        os.utime(self.segment, ns=(0, 0))
+        self.assertEqual(read_journal(self.journal, "key"), {})
+        self.segment.unlink()
+        self.assertEqual(read_journal(self.journal, "key"), {})
+
+    def test_torn_journal(self):
+        """Test that an unreadable journal counts as empty"""
+        self.journal.write_text('{"key": "key", "segm')
+        self.assertEqual(read_journal(self.journal, "key"), {})
+        self.assertIsNone(read_analysis(self.journal, "key"))
+
+    def test_analysis(self):
+        """Test that the analysis is read back for the same cache key only"""
+        write_journal(self.journal, "key", {}, {"crop": [640, 160, 0, 480]})
+        self.assertEqual(
+            read_analysis(self.journal, "key"), {"crop": [640, 160, 0, 480]}
+        )
+        self.assertIsNone(read_analysis(self.journal, "other key"))
+        write_journal(self.journal, "key", {"0:30": self.entry})
+        self.assertIsNone(read_analysis(self.journal, "key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from vid2captionsai import server
+from vid2captionsai.vid2captionsai import PrepAudioVideo
+
+
+class TestParseAddress(unittest.TestCase):
+    def test_addresses(self):
+        """Test that ports mean HTTP on localhost and anything else a Unix socket"""
+        self.assertEqual(server.parse_address("8765"), ("127.0.0.1", 8765))
+        self.assertEqual(server.parse_address(":8765"), ("127.0.0.1", 8765))
+        self.assertEqual(server.parse_address("0.0.0.0:80"), ("0.0.0.0", 80))
+        self.assertEqual(server.parse_address("/run/v2c.sock"), "/run/v2c.sock")
+        self.assertEqual(server.parse_address("/tmp/a:1/v2c.sock"), "/tmp/a:1/v2c.sock")
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.queue = server.JobQueue({"cache_dir": self.test_dir}, workers=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_priority_order(self):
+        """Test that higher priorities run first and equal ones in order"""
+        low = self.queue.submit("blank", "a.mp4", {})
+        high = self.queue.submit("mask", "b.mp4", {"crop": True}, priority=5)
+        later = self.queue.submit("blank", "c.mp4", {})
+        order = [self.queue._next().id for _ in range(3)]
+        self.assertEqual(order, [high.id, low.id, later.id])
+        self.assertEqual(high.status, "running")
+
+    def test_cancel_queued(self):
+        """Test that a cancelled queued job never runs"""
+        first = self.queue.submit("blank", "a.mp4", {})
+        second = self.queue.submit("blank", "b.mp4", {})
+        self.queue.cancel(first.id)
+        self.assertEqual(first.status, "cancelled")
+        self.assertEqual(self.queue._next().id, second.id)
+
+    def test_invalid_jobs(self):
+        """Test that unknown methods and arguments are rejected"""
+        with self.assertRaises(ValueError):
+            self.queue.submit("probe", "a.mp4", {})
+        with self.assertRaises(ValueError):
+            self.queue.submit("mask", "a.mp4", {"colour": "000000"})
+        self.assertEqual(self.queue.list(), [])
+
+    def test_failing_job_process(self):
+        """Test that a job runs in its own process and reports its failure"""
+        self.queue.start()
+        try:
+            job = self.queue.submit(
+                "blank", str(Path(self.test_dir) / "missing.mp4"), {}
+            )
+            deadline = time.monotonic() + 60
+            while job.status not in server.FINISHED and time.monotonic() < deadline:
+                time.sleep(0.1)
+        finally:
+            self.queue.stop()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("missing.mp4", job.error)
+
+
+class TestServerAPI(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.address = str(Path(self.test_dir) / "server.sock")
+        self.queue = server.JobQueue({"cache_dir": self.test_dir}, workers=1)
+        self.server = server.make_server(self.address, self.queue)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_submit_status_cancel(self):
+        """Test the job lifecycle over the Unix socket"""
+        job = server.request(
+            self.address,
+            "POST",
+            "/jobs",
+            {"method": "mask", "input": "/in.mp4", "kwargs": {"codec": "vp9"}},
+        )
+        self.assertEqual(job["status"], "queued")
+        self.assertEqual(job["kwargs"], {"codec": "vp9"})
+        self.assertEqual(
+            server.request(self.address, "GET", f"/jobs/{job['id']}")["id"], job["id"]
+        )
+        self.assertEqual(len(server.request(self.address, "GET", "/jobs")), 1)
+        cancelled = server.request(self.address, "DELETE", f"/jobs/{job['id']}")
+        self.assertEqual(cancelled["status"], "cancelled")
+
+    def test_submit_sources(self):
+        """Test that submit resolves file paths and passes URLs unchanged"""
+        prep = PrepAudioVideo(cache_dir=self.test_dir)
+        url = "https://example.com/talk.mp4"
+        job = prep.submit("blank", url, address=self.address, wait=False)
+        self.assertEqual(job["input"], url)
+        job = prep.submit("blank", "talk.mp4", address=self.address, wait=False)
+        self.assertEqual(job["input"], str(Path("talk.mp4").resolve()))
+        with self.assertRaises(ValueError):
+            prep.submit("blank", "-", address=self.address, wait=False)
+        with self.assertRaises(ValueError):
+            prep.submit("blank", url, self.address, wait=False, output_path="-")
+        self.assertEqual(len(server.request(self.address, "GET", "/jobs")), 2)
+
+    def test_errors(self):
+        """Test that invalid jobs and unknown ids are rejected"""
+        with self.assertRaisesRegex(RuntimeError, "Unknown method"):
+            server.request(
+                self.address, "POST", "/jobs", {"method": "rm", "input": "/in.mp4"}
+            )
+        with self.assertRaisesRegex(RuntimeError, "No such job"):
+            server.request(self.address, "GET", "/jobs/nope")
+
+    def test_second_server(self):
+        """Test that a second server on the same socket is refused"""
+        with self.assertRaises(RuntimeError):
+            server.make_server(self.address, self.queue)
@@ -0,0 +1,116 @@
+import functools
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from vid2captionsai import PrepAudioVideo
+from vid2captionsai.streams import (
+    STDIN,
+    STDOUT,
+    is_stream,
+    muxer_options,
+    parse_source,
+    source_name,
+    tee_target,
+)
+
+
+class TestStreams(unittest.TestCase):
+    def test_parse_source(self):
+        """Test that stdin and URLs stay streams and file URLs become paths"""
+        self.assertEqual(parse_source("-"), STDIN)
+        url = "http://127.0.0.1:8000/talk%20one.mp4?token=1"
+        self.assertEqual(parse_source(url), url)
+        self.assertEqual(parse_source("file:///tmp/a%20b.mp4"), Path("/tmp/a b.mp4"))
+        self.assertEqual(parse_source("video.mp4"), Path("video.mp4").resolve())
+        self.assertTrue(is_stream(parse_source(url)))
+        self.assertFalse(is_stream(parse_source("video.mp4")))
+
+    def test_source_name(self):
+        """Test the names of streams in progress lines and outputs"""
+        self.assertEqual(source_name(STDIN), "stdin")
+        self.assertEqual(
+            source_name("https://host/a/talk%20one.mp4?x=1"), "talk one.mp4"
+        )
+        self.assertEqual(source_name("https://host/"), "host")
+        self.assertEqual(source_name(Path("/tmp/in.mov")), "in.mov")
+
+    def test_muxer_options(self):
+        """Test that only stdout gets a streamable muxer"""
+        self.assertEqual(muxer_options(STDOUT, "nut"), ["-f", "nut"])
+        self.assertIn(
+            "+frag_keyframe+empty_moov+default_base_moof", muxer_options(STDOUT, "mov")
+        )
+        self.assertEqual(muxer_options(Path("out.mov"), "mov"), [])
+
+    def test_tee_target(self):
+        """Test that tee outputs select their streams and escape file names"""
+        target = tee_target(
+            [
+                ("v:0,a", "mp4", Path("/tmp/a.mp4")),
+                ("v:1,a", "mp4", Path("/tmp/b|[1].mp4")),
+            ]
+        )
+        self.assertEqual(
+            target,
+            "[select=\\'v:0,a\\':f=mp4]/tmp/a.mp4"
+            "|[select=\\'v:1,a\\':f=mp4]/tmp/b\\|\\[1\\].mp4",
+        )
+
+
+class TestRemoteInput(unittest.TestCase):
+    """Reads a faststart MP4 over HTTP with the real ffmpeg"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.test_dir, ignore_errors=True)
+        self.prep = PrepAudioVideo(cache_dir=self.test_dir / "cache")
+        # http.server cannot answer range requests, so the MP4 index must come
+        # first for ffmpeg to read the file in one pass
+        subprocess.run(
+            self.prep._ffmpeg_run
+            + ["-f", "lavfi", "-i", "testsrc2=s=320x180:r=30:d=2"]
+            + ["-f", "lavfi", "-i", "sine=d=2"]
+            + ["-c:v", "libx264", "-c:a", "aac", "-movflags", "+faststart"]
+            + [self.test_dir / "talk.mp4"],
+            check=True,
+        )
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            functools.partial(SimpleHTTPRequestHandler, directory=self.test_dir),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_port}/talk.mp4"
+
+    def test_probe_and_blank(self):
+        """Test that a URL is probed and blanked like a file"""
+        info = self.prep.probe(self.url)
+        self.assertAlmostEqual(info["duration"], 2.0, delta=0.1)
+        self.assertEqual((info["width"], info["height"]), (320, 180))
+
+        output_path = self.prep.blank(
+            self.url, width=320, height=180, output_path=self.test_dir / "blank.mp4"
+        )
+        self.assertAlmostEqual(self.prep._probe(output_path).duration, 2.0, delta=0.1)
+
+    def test_truncated(self):
+        """Test that a URL that breaks off fails without leaving an output"""
+        data = (self.test_dir / "talk.mp4").read_bytes()
+        (self.test_dir / "cut.mp4").write_bytes(data[: len(data) // 4])
+        # ffmpeg fails on a cut packet, and the job on a short output
+        with self.assertRaises((subprocess.CalledProcessError, RuntimeError)):
+            self.prep.blank(
+                self.url.replace("talk", "cut"),
+                output_path=self.test_dir / "cut-blank.mp4",
+            )
+        self.assertEqual(list(self.test_dir.glob("*cut-blank*")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,97 @@
+import io
+import json
+import subprocess
+import sys
 import unittest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 import tempfile
 import os
+import shutil
 
 from vid2captionsai import PrepAudioVideo, __version__
+from vid2captionsai.index import MetadataIndex
+from vid2captionsai.probe import MediaInfo, probe
+
+FFPROBE_JSON = json.dumps(
+    {
+        "packets": [
+            {"stream_index": 0, "pts_time": "0.000000", "flags": "K__"},
+            {"stream_index": 1, "pts_time": "0.000000", "flags": "K__"},
+            {"stream_index": 0, "pts_time": "0.066667", "flags": "___"},
+            {"stream_index": 0, "pts_time": "0.033333", "flags": "___"},
+            {"stream_index": 0, "pts_time": "0.100000", "flags": "K__"},
+        ],
+        "streams": [
+            {
+                "index": 0,
+                "codec_name": "h264",
+                "codec_type": "video",
+                "width": 1920,
+                "height": 1080,
+                "pix_fmt": "yuv420p",
+                "r_frame_rate": "30/1",
+            },
+            {
+                "index": 1,
+                "codec_name": "aac",
+                "codec_type": "audio",
+                "sample_rate": "48000",
+                "channels": 2,
+            },
+        ],
+        "format": {"duration": "30.000000"},
+    }
+)
+
+
+# Caption activity analysis output: frames 1 and 2 of 4 contain captions
+ACTIVITY_METADATA = "".join(
+    f"frame:{n} pts:{n} pts_time:{n / 30}\n"
+    f"lavfi.bbox.x1={100 + n}\nlavfi.bbox.y1=40\nlavfi.bbox.x2=200\nlavfi.bbox.y2=60\n"
+    for n in (1, 2)
+)
+
+
+def fake_run(cmd, *args, **kwargs):
+    """Answers ffprobe calls with FFPROBE_JSON and ffmpeg calls with success."""
+    if "-print_format" in cmd:
+        return MagicMock(returncode=0, stdout=FFPROBE_JSON)
+    if any("bbox" in str(arg) for arg in cmd):
+        return MagicMock(returncode=0, stdout=ACTIVITY_METADATA)
+    # Like ffmpeg, leave the output files behind
+    if isinstance(cmd[-1], Path):
+        partials = [arg for arg in cmd if isinstance(arg, Path) and ".partial" in arg.name]
+        for output in partials or [cmd[-1]]:
+            output.write_text(" ".join(str(arg) for arg in cmd))
+    elif "tee" in cmd:
+        for output in cmd[-1].split("|"):
+            Path(output.partition("]")[2]).write_text(" ".join(str(arg) for arg in cmd))
+    return MagicMock(returncode=0)
+
+
+def run_ffmpeg_via_run(cmd, label="ffmpeg", duration=None, output_path=None):
+    """Stands in for runner.run_ffmpeg through subprocess.run, which the tests mock."""
+    subprocess.run(cmd, check=True)
+    return {
+        "label": label,
+        "wall_seconds": 0.5,
+        "cpu_seconds": 1.0,
+        "peak_rss_bytes": 64 << 20,
+        "frames": 4,
+        # The 4 frames at 30 fps when the duration is unknown
+        "media_seconds": duration or 4 / 30,
+        "output_bytes": 0,
+    }
 
 
 class TestPrepAudioVideo(unittest.TestCase):
     def setUp(self):
-        self.prep = PrepAudioVideo()
+        patcher = patch("vid2captionsai.runner.run_ffmpeg", side_effect=run_ffmpeg_via_run)
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.test_dir = tempfile.mkdtemp()
+        self.prep = PrepAudioVideo(cache_dir=self.test_dir)
         self.input_path = Path(self.test_dir) / "input_video.mp4"
         # Create a dummy video file for testing
         self.input_path.write_text("dummy video content")
@@ -26,17 +107,24 @@ class TestPrepAudioVideo(unittest.TestCase):
         self.assertNotEqual(__version__, "unknown")
         self.assertIsInstance(__version__, str)
 
+    def test_version_fallback(self):
+        """Test that the version comes from the package metadata without _version.py"""
+        code = (
+            "import sys; sys.modules['vid2captionsai._version'] = None; "
+            "import vid2captionsai; print(vid2captionsai.__version__)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), __version__)
+
     @patch('subprocess.run')
     def test_blank_with_mock(self, mock_run):
         """Test blank method with mocked subprocess calls"""
         mock_run.return_value = MagicMock(returncode=0)
         
-        # Mock ffprobe calls
-        mock_run.side_effect = [
-            MagicMock(returncode=0, stdout="30.0"),  # duration
-            MagicMock(returncode=0, stdout="30/1"),  # fps
-            MagicMock(returncode=0)  # ffmpeg
-        ]
+        # Mock the single ffprobe call and the ffmpeg call
+        mock_run.side_effect = fake_run
         
         output_path = self.prep.blank(str(self.input_path))
         self.assertTrue(isinstance(output_path, Path))
@@ -46,7 +134,7 @@ class TestPrepAudioVideo(unittest.TestCase):
     @patch('subprocess.run')
     def test_mask_with_mock(self, mock_run):
         """Test mask method with mocked subprocess calls"""
-        mock_run.return_value = MagicMock(returncode=0)
+        mock_run.side_effect = fake_run
         
         output_path = self.prep.mask(str(self.input_path))
         self.assertTrue(isinstance(output_path, Path))
@@ -56,11 +144,7 @@ class TestPrepAudioVideo(unittest.TestCase):
     def test_blank_default_params(self):
         """Test blank method with default parameters"""
         with patch('subprocess.run') as mock_run:
-            mock_run.side_effect = [
-                MagicMock(returncode=0, stdout="30.0"),
-                MagicMock(returncode=0, stdout="30/1"),
-                MagicMock(returncode=0)
-            ]
+            mock_run.side_effect = fake_run
             
             output_path = self.prep.blank(str(self.input_path))
             self.assertTrue(isinstance(output_path, Path))
@@ -69,11 +153,7 @@ class TestPrepAudioVideo(unittest.TestCase):
     def test_blank_custom_params(self):
         """Test blank method with custom parameters"""
         with patch('subprocess.run') as mock_run:
-            mock_run.side_effect = [
-                MagicMock(returncode=0, stdout="30.0"),
-                MagicMock(returncode=0, stdout="30/1"),
-                MagicMock(returncode=0)
-            ]
+            mock_run.side_effect = fake_run
             
             output_path = self.prep.blank(
                 str(self.input_path), color="FFFFFF", width=1080, height=720
@@ -84,7 +164,7 @@ class TestPrepAudioVideo(unittest.TestCase):
     def test_mask_default_params(self):
         """Test mask method with default parameters"""
         with patch('subprocess.run') as mock_run:
-            mock_run.return_value = MagicMock(returncode=0)
+            mock_run.side_effect = fake_run
             
             output_path = self.prep.mask(str(self.input_path))
             self.assertTrue(isinstance(output_path, Path))
@@ -93,7 +173,7 @@ class TestPrepAudioVideo(unittest.TestCase):
     def test_mask_custom_params(self):
         """Test mask method with custom parameters"""
         with patch('subprocess.run') as mock_run:
-            mock_run.return_value = MagicMock(returncode=0)
+            mock_run.side_effect = fake_run
             
             output_path = self.prep.mask(
                 str(self.input_path), color="FFFFFF", tolerance=0.05, fps=30
@@ -138,13 +218,9 @@ class TestPrepAudioVideo(unittest.TestCase):
         """Test verbose mode functionality"""
         mock_run.return_value = MagicMock(returncode=0)
         
-        prep_verbose = PrepAudioVideo(verbose=True)
+        prep_verbose = PrepAudioVideo(verbose=True, cache_dir=self.test_dir)
         
-        mock_run.side_effect = [
-            MagicMock(returncode=0, stdout="30.0"),
-            MagicMock(returncode=0, stdout="30/1"),
-            MagicMock(returncode=0)
-        ]
+        mock_run.side_effect = fake_run
         
         output_path = prep_verbose.blank(str(self.input_path))
         self.assertTrue(isinstance(output_path, Path))
@@ -152,11 +228,7 @@ class TestPrepAudioVideo(unittest.TestCase):
     def test_color_validation(self):
         """Test color parameter validation"""
         with patch('subprocess.run') as mock_run:
-            mock_run.side_effect = [
-                MagicMock(returncode=0, stdout="30.0"),
-                MagicMock(returncode=0, stdout="30/1"),
-                MagicMock(returncode=0)
-            ]
+            mock_run.side_effect = fake_run
             
             # Test valid hex colors
             valid_colors = ["000000", "FFFFFF", "FF0000", "00FF00", "0000FF"]
@@ -164,6 +236,654 @@ class TestPrepAudioVideo(unittest.TestCase):
                 output_path = self.prep.blank(str(self.input_path), color=color)
                 self.assertTrue(isinstance(output_path, Path))
 
+    def test_blank_uses_exact_fps_and_duration(self):
+        """Test that blank builds the color source from one ffprobe call"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.blank(str(self.input_path))
+            self.assertEqual(mock_run.call_count, 2)
+            ffmpeg_cmd = mock_run.call_args_list[1][0][0]
+            self.assertIn("color=c=000000:s=2160x720:r=30/1:d=30.0", ffmpeg_cmd)
+
+    def test_blank_audio_copy(self):
+        """Test that blank copies audio that MP4 can hold"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.blank(str(self.input_path), audio="copy")
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-c:a") + 1], "copy")
+
+    def test_blank_static_profile(self):
+        """Test that the static profile uses a long GOP and can downscale"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            # The size and speed report is printed on request
+            with patch("sys.stderr", new_callable=io.StringIO) as stderr:
+                self.prep.blank(str(self.input_path), profile="static-half", report=True)
+            self.assertIn("kbit/s", stderr.getvalue())
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-g") + 1], "9000")
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-tune") + 1], "stillimage")
+            self.assertIn("color=c=000000:s=1080x360:r=30/1:d=30.0", ffmpeg_cmd)
+            with self.assertRaises(ValueError):
+                self.prep.blank(str(self.input_path), profile="fancy")
+
+    def test_blank_reduced_fps(self):
+        """Test that blank can generate a lower frame rate than the source"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.blank(str(self.input_path), fps=10, profile="static")
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertIn("color=c=000000:s=2160x720:r=10:d=30.0", ffmpeg_cmd)
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-g") + 1], "3000")
+
+    def test_mask_retime(self):
+        """Test that mask holds frames up to a different output frame rate"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.mask(str(self.input_path), fps="60000/1001")
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            vf = ffmpeg_cmd[ffmpeg_cmd.index("-vf") + 1]
+            self.assertTrue(vf.endswith(",fps=fps=60000/1001:round=up"))
+
+            # Matching the source frame rate needs no retime
+            self.prep.mask(str(self.input_path), source_path=str(self.input_path))
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertNotIn("fps=", ffmpeg_cmd[ffmpeg_cmd.index("-vf") + 1])
+
+    def test_mask_thread_settings(self):
+        """Test that decode, filter and encode threads are always explicit"""
+        prep = PrepAudioVideo(cache_dir=self.test_dir, threads=6, encode_threads=2)
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            prep.mask(str(self.input_path))
+            ffmpeg_cmd = [str(arg) for arg in mock_run.call_args_list[-1][0][0]]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-i") - 2 :][:2], ["-threads", "6"])
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-filter_threads") + 1], "6")
+            self.assertEqual(ffmpeg_cmd[-3:-1], ["-threads", "2"])
+
+        # Without a setting, the CPU budget of the process counts
+        with patch("vid2captionsai.vid2captionsai.cpu_budget", return_value=(3, "cgroup quota 3")):
+            prep = PrepAudioVideo(cache_dir=self.test_dir)
+        self.assertEqual((prep._decode_threads, prep._encode_threads), (3, 3))
+
+    def test_mask_unknown_engine(self):
+        """Test that mask rejects unknown keying engines"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), engine="magic")
+
+    def test_activity(self):
+        """Test that activity writes the index and the cut lists"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            index = self.prep.activity(str(self.input_path))
+            self.assertEqual(index["frames"], 4)
+            self.assertEqual(index["active_frames"], 2)
+            self.assertEqual(index["segments"][0]["first_frame"], 1)
+            self.assertEqual(index["segments"][0]["end_frame"], 3)
+            for suffix in (".json", ".edl", ".fcpxml"):
+                self.assertTrue(
+                    (Path(self.test_dir) / f"input_video-activity{suffix}").exists()
+                )
+
+            # The index is reused for the unchanged input and the same settings
+            calls = mock_run.call_count
+            self.assertEqual(self.prep.activity(str(self.input_path)), index)
+            self.assertEqual(mock_run.call_count, calls)
+            self.prep.activity(str(self.input_path), tolerance=0.1)
+            self.assertEqual(mock_run.call_count, calls + 1)
+
+    def test_mask_sparse(self):
+        """Test the sparse mask modes"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            clips = self.prep.mask(str(self.input_path), sparse="clips")
+            self.assertEqual([c.name for c in clips], ["input_video-mask-001.mov"])
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-ss") + 1], "0.016667")
+            self.assertTrue(ffmpeg_cmd[ffmpeg_cmd.index("-vf") + 1].startswith("trim=end_frame=2,"))
+
+            mock_run.reset_mock()
+            output_path = self.prep.mask(str(self.input_path), sparse="filler")
+            self.assertEqual(output_path.name, "input_video-mask.mov")
+            commands = [c[0][0] for c in mock_run.call_args_list]
+            # The index of the clips run is reused: filler, keyed clip, filler, concat
+            self.assertEqual(len(commands), 4)
+            self.assertIn("concat", commands[-1])
+            self.assertTrue(any("color=c=black@0.0" in str(a) for a in commands[0]))
+
+    def test_audio_options(self):
+        """Test the audio modes of blank"""
+        pcm = MediaInfo(duration=1.0, audio_codec="pcm_s16le")
+        self.assertEqual(self.prep._audio_options(pcm, "copy"), ["-c:a", "aac"])
+        self.assertIn("16000", self.prep._audio_options(pcm, "speech"))
+        with self.assertRaises(ValueError):
+            self.prep._audio_options(pcm, "lossless")
+
+    def test_probe_is_indexed(self):
+        """Test that repeat probes of an unchanged file skip ffprobe"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            first = self.prep.probe(str(self.input_path))
+            second = self.prep.probe(str(self.input_path))
+            self.assertEqual(first, second)
+            self.assertEqual(mock_run.call_count, 1)
+
+            # A modified file is probed again
+            self.input_path.write_text("changed dummy video content")
+            self.prep.probe(str(self.input_path))
+            self.assertEqual(mock_run.call_count, 2)
+
+    def test_blank_probes_header(self):
+        """Test that blank probes the header only and mask lists the packets later"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.blank(str(self.input_path))
+            probe_cmd = mock_run.call_args_list[0][0][0]
+            self.assertNotIn("packet=stream_index,pts_time,flags", probe_cmd)
+
+            # Header metadata answers blank, but not the frame count of mask
+            self.input_path.write_text("changed dummy video content")
+            header = MediaInfo.from_ffprobe(
+                {k: v for k, v in json.loads(FFPROBE_JSON).items() if k != "packets"}
+            )
+            self.prep._index.put_probe(self.input_path, header.to_dict())
+            mock_run.reset_mock()
+            self.assertEqual(self.prep._probe(self.input_path, packets=False), header)
+            self.assertEqual(mock_run.call_count, 0)
+            self.assertEqual(self.prep._probe(self.input_path).frames, 4)
+            self.assertEqual(mock_run.call_count, 1)
+
+    def test_mask_command(self):
+        """Test that mask keys the color into ProRes 4444"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.mask(str(self.input_path), color="00FF00", tolerance=0.1)
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertIn("colorkey=color=0x00FF00:similarity=0.1:blend=0.1", ffmpeg_cmd)
+            self.assertIn("prores_ks", ffmpeg_cmd)
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-r") + 1], "30/1")
+
+    def test_mask_codecs(self):
+        """Test that the output codec picks the encoder, pixel format and extension"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            output_path = self.prep.mask(str(self.input_path), codec="vp9")
+            self.assertEqual(output_path.name, "input_video-mask.webm")
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            self.assertIn("libvpx-vp9", ffmpeg_cmd)
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-pix_fmt") + 1], "yuva420p")
+
+            self.prep.mask(str(self.input_path), sparse="filler", codec="qtrle")
+            filler_cmd = mock_run.call_args_list[-4][0][0]
+            self.assertTrue(any(str(a).endswith(",format=argb") for a in filler_cmd))
+
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), codec="gif")
+
+    def test_mask_crop(self):
+        """Test that mask crops to the caption bounding box and writes the offset"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            output_path = self.prep.mask(str(self.input_path), crop=True)
+            ffmpeg_cmd = mock_run.call_args_list[-1][0][0]
+            # The 101..200 x 40..60 box of the 320x180 analysis, scaled by 6 and padded
+            self.assertTrue(
+                ffmpeg_cmd[ffmpeg_cmd.index("-vf") + 1].startswith("crop=632:158:590:224,")
+            )
+            sidecar = json.loads(output_path.with_suffix(".crop.json").read_text())
+            self.assertEqual([sidecar["x"], sidecar["y"]], [590, 224])
+            self.assertEqual(sidecar["center_offset_x"], 590 + 316 - 960)
+
+    def test_mask_segments(self):
+        """Test that mask keys keyframe-aligned segments and joins them"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.mask(str(self.input_path), segments=2)
+            commands = [c[0][0] for c in mock_run.call_args_list]
+            # Segments run in parallel, so order them by their seek
+            keyed = sorted((c for c in commands if "-vf" in c), key=lambda c: "-ss" in c)
+            self.assertEqual(len(keyed), 2)
+            vf = [c[c.index("-vf") + 1] for c in keyed]
+            self.assertTrue(vf[0].startswith("trim=end_frame=3,colorkey="))
+            self.assertTrue(vf[1].startswith("trim=end_frame=1,setpts=PTS-STARTPTS,"))
+            # The second segment starts at the keyframe of frame 3
+            second = keyed[1]
+            self.assertIn("-noaccurate_seek", second)
+            self.assertEqual(second[second.index("-ss") + 1], "0.116667")
+            self.assertIn("concat", commands[-2])
+
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), segments=2, sparse="filler")
+
+    def test_mask_resumable(self):
+        """Test that a resumable mask journals finished segments and resumes after a crash"""
+
+        def crash_at_second_segment(cmd, *args, **kwargs):
+            if "-ss" in cmd:
+                raise subprocess.CalledProcessError(137, cmd)
+            return fake_run(cmd, *args, **kwargs)
+
+        def probe_written(ffprobe_run, path, *args, **kwargs):
+            if path == self.input_path:
+                return MediaInfo.from_ffprobe(json.loads(FFPROBE_JSON))
+            # The fake outputs hold their commands: segments are trimmed, the join is not
+            command = Path(path).read_text()
+            frames = 3 if "end_frame=3" in command else 1 if "end_frame=1" in command else 4
+            return MediaInfo(duration=0, frames=frames)
+
+        output_path = Path(self.test_dir) / "input_video-mask.mov"
+        journal = Path(self.test_dir) / ".input_video-mask.mov.journal.json"
+        parts = Path(self.test_dir) / ".input_video-mask.mov.parts"
+        with patch('subprocess.run') as mock_run, patch(
+            "vid2captionsai.vid2captionsai.probe", side_effect=probe_written
+        ):
+            mock_run.side_effect = crash_at_second_segment
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.prep.mask(
+                    str(self.input_path), resumable=True, segment_seconds=0.05, crop=True
+                )
+            self.assertFalse(output_path.exists())
+            recorded = json.loads(journal.read_text())
+            self.assertEqual(list(recorded["segments"]), ["0:3"])
+            self.assertIn("crop", recorded["analysis"])
+            self.assertTrue((parts / "segment-00000000-00000003.mov").exists())
+
+            mock_run.reset_mock()
+            mock_run.side_effect = fake_run
+            self.assertEqual(
+                self.prep.mask(
+                    str(self.input_path), resumable=True, segment_seconds=0.05, crop=True
+                ),
+                output_path,
+            )
+            commands = [c[0][0] for c in mock_run.call_args_list]
+            # The crop comes from the journal, so only the missing segment is
+            # keyed, without analysing the input again, then everything is joined
+            keyed = [c for c in commands if "-vf" in c]
+            self.assertEqual(len(keyed), 1)
+            self.assertIn("crop=632:158:590:224", keyed[0][keyed[0].index("-vf") + 1])
+            self.assertIn("-ss", commands[0])
+            self.assertIn("concat", commands[-1])
+            self.assertTrue(output_path.exists())
+            self.assertFalse(journal.exists())
+            self.assertFalse(parts.exists())
+
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), resumable=True, fps=10)
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), resumable=True, dedup=True)
+
+    def test_up_to_date_outputs(self):
+        """Test that unchanged inputs and parameters skip the encode"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            output_path = self.prep.mask(str(self.input_path))
+            calls = mock_run.call_count
+            self.assertEqual(self.prep.mask(str(self.input_path)), output_path)
+            self.assertEqual(mock_run.call_count, calls)
+
+            # Another name for the same output is linked into place
+            other = self.prep.mask(str(self.input_path), output_path=Path(self.test_dir) / "copy.mov")
+            self.assertEqual(other.read_text(), output_path.read_text())
+            self.assertEqual(mock_run.call_count, calls)
+
+            # Other parameters, a changed input or force encode again
+            self.prep.mask(str(self.input_path), tolerance=0.2)
+            self.assertEqual(mock_run.call_count, calls + 1)
+            forced = PrepAudioVideo(cache_dir=self.test_dir, force=True)
+            forced.mask(str(self.input_path), tolerance=0.2)
+            self.assertEqual(mock_run.call_count, calls + 2)
+            self.input_path.write_text("changed dummy video content")
+            self.prep.blank(str(self.input_path))
+            calls = mock_run.call_count
+            self.prep.blank(str(self.input_path))
+            self.assertEqual(mock_run.call_count, calls)
+            self.assertEqual(
+                sorted(p.name for p in Path(self.test_dir).glob(".*partial*")), []
+            )
+
+    def test_job_metrics(self):
+        """Test that finished jobs are written as JSON lines and a Prometheus textfile"""
+        metrics_path = Path(self.test_dir) / "jobs.jsonl"
+        textfile_path = Path(self.test_dir) / "vid2captionsai.prom"
+        prep = PrepAudioVideo(
+            cache_dir=self.test_dir, metrics_path=metrics_path, textfile_path=textfile_path
+        )
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            prep.blank(str(self.input_path))
+            prep.mask(str(self.input_path), segments=2)
+        records = [json.loads(line) for line in metrics_path.read_text().splitlines()]
+        self.assertEqual([r["method"] for r in records], ["blank", "mask"])
+        self.assertEqual(records[0]["cpu_seconds"], 1.0)
+        self.assertEqual(records[0]["peak_rss_bytes"], 64 << 20)
+        # Two segments and a concat that copies their frames
+        self.assertEqual(records[1]["processes"], 3)
+        self.assertEqual(records[1]["frames"], 8)
+        self.assertGreater(records[1]["output_bytes"], 0)
+        textfile = textfile_path.read_text()
+        self.assertIn('vid2captionsai_jobs_total{method="mask"} 1', textfile)
+        self.assertIn("# TYPE vid2captionsai_cpu_seconds_total counter", textfile)
+
+    def test_blank_variants(self):
+        """Test that blank variants share one ffmpeg run and one audio encode"""
+        variants = [{"width": 1080, "height": 1920}, {"color": "00FF00", "fps": 10, "profile": "static"}]
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            paths = self.prep.blank(str(self.input_path), variants=variants)
+            self.assertEqual(
+                [p.name for p in paths],
+                ["input_video-blank-1080x1920.mp4", "input_video-blank-00FF00-10fps-static.mp4"],
+            )
+            # One ffprobe and one ffmpeg call
+            self.assertEqual(mock_run.call_count, 2)
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertIn("color=c=000000:s=1080x1920:r=30/1:d=30.0", ffmpeg_cmd)
+            self.assertIn("color=c=00FF00:s=2160x720:r=10:d=30.0", ffmpeg_cmd)
+            self.assertEqual(ffmpeg_cmd.count("-c:a"), 1)
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-map", ffmpeg_cmd.index("1:v:0")) + 1], "2:a:0")
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-g:v:1") + 1], "3000")
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-tune:v:1") + 1], "stillimage")
+            self.assertEqual(ffmpeg_cmd[-3:-1], ["-f", "tee"])
+            self.assertTrue(ffmpeg_cmd[-1].startswith("[select=\\'v:0,a\\':f=mp4]"))
+
+            # The same variants are up to date, and one also made as a single blank
+            calls = mock_run.call_count
+            self.assertEqual(self.prep.blank(str(self.input_path), variants=variants), paths)
+            self.prep.blank(str(self.input_path), width=1080, height=1920, output_path=paths[0])
+            self.assertEqual(mock_run.call_count, calls)
+
+            with self.assertRaises(ValueError):
+                self.prep.blank(str(self.input_path), variants=[{"colour": "FFFFFF"}])
+            with self.assertRaises(ValueError):
+                self.prep.blank(str(self.input_path), variants=[{}, {}])
+
+    def test_mask_variants(self):
+        """Test that mask variants key one decode in a colorkey branch each"""
+        variants = [{"tolerance": 0.05}, {"color": "FFFFFF", "tolerance": 0.1}]
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            paths = self.prep.mask(str(self.input_path), fps=10, variants=variants)
+            self.assertEqual(
+                [p.name for p in paths],
+                ["input_video-mask-t0.05.mov", "input_video-mask-FFFFFF-t0.1.mov"],
+            )
+            # One ffprobe and one ffmpeg call
+            self.assertEqual(mock_run.call_count, 2)
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(ffmpeg_cmd.count("-i"), 1)
+            self.assertEqual(
+                ffmpeg_cmd[ffmpeg_cmd.index("-filter_complex") + 1],
+                "[0:v:0]split=2[in0][in1];"
+                "[in0]colorkey=color=0x000000:similarity=0.05:blend=0.05,fps=fps=10:round=up[key0];"
+                "[in1]colorkey=color=0xFFFFFF:similarity=0.1:blend=0.1,fps=fps=10:round=up[key1]",
+            )
+            self.assertEqual(ffmpeg_cmd.count("prores_ks"), 2)
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-map") + 1], "[key0]")
+
+            # The same variants are up to date, and one also made as a single mask
+            calls = mock_run.call_count
+            self.assertEqual(self.prep.mask(str(self.input_path), fps=10, variants=variants), paths)
+            self.prep.mask(str(self.input_path), tolerance=0.05, fps=10, output_path=paths[0])
+            self.assertEqual(mock_run.call_count, calls)
+
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), variants=[{"fps": 10}])
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), variants=[{}, {}])
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), segments=2, variants=variants)
+
+    def test_mask_dedup(self):
+        """Test that dedup drops held frames before keying and writes variable-frame-rate output"""
+        metrics_path = Path(self.test_dir) / "jobs.jsonl"
+        prep = PrepAudioVideo(cache_dir=self.test_dir, metrics_path=metrics_path)
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            prep.mask(str(self.input_path), dedup=True)
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(
+                ffmpeg_cmd[ffmpeg_cmd.index("-vf") + 1],
+                "settb=1/30,split[all][last];[all]mpdecimate=max=0[unique];"
+                "[last]trim=start_frame=3,tpad=stop=1:stop_mode=clone[end];"
+                "[unique][end]interleave,settb=1/30,colorkey=color=0x000000:similarity=0.01:blend=0.01",
+            )
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-fps_mode") + 1], "vfr")
+            self.assertNotIn("-r", ffmpeg_cmd)
+
+            # Deduplicated output is cached apart from the full mask
+            calls = mock_run.call_count
+            prep.mask(str(self.input_path))
+            self.assertEqual(mock_run.call_count, calls + 1)
+
+            with self.assertRaises(ValueError):
+                prep.mask(str(self.input_path), dedup=True, fps=10)
+            with self.assertRaises(ValueError):
+                prep.mask(str(self.input_path), dedup=True, engine="numpy")
+            with self.assertRaises(ValueError):
+                prep.mask(str(self.input_path), dedup=True, segments=2)
+        records = [json.loads(line) for line in metrics_path.read_text().splitlines()]
+        # Four input frames, four encoded
+        self.assertEqual(records[0]["dedup_ratio"], 1.0)
+        self.assertNotIn("dedup_ratio", records[1])
+
+    def test_plan(self):
+        """Test that plan probes the inputs and records the ffmpeg commands without running them"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            document = json.loads(self.prep.plan("mask", str(self.input_path), segments=2))
+            # Only the probe ran
+            self.assertEqual(mock_run.call_count, 1)
+            steps = document["steps"]
+            self.assertEqual([s["label"] for s in steps], ["mask input_video.mp4 [0:3]", "mask input_video.mp4 [3:4]", "concat 2 parts"])
+            self.assertEqual(steps[2]["after"], [0, 1])
+            output_path = Path(self.test_dir) / "input_video-mask.mov"
+            self.assertEqual(document["targets"], [str(output_path)])
+            # Steps write their outputs directly, and nothing is written yet
+            self.assertEqual(steps[2]["command"][-1], str(output_path))
+            self.assertFalse(output_path.exists())
+            # Steps run the ffmpeg of the runner with its own thread counts
+            self.assertEqual(steps[0]["command"][0], "ffmpeg")
+            self.assertNotIn("-threads", steps[0]["command"])
+            self.assertNotIn("-filter_threads", steps[0]["command"])
+            given = PrepAudioVideo(cache_dir=self.test_dir, encode_threads=2)
+            command = json.loads(given.plan("mask", str(self.input_path)))["steps"][0]["command"]
+            self.assertEqual(command[command.index("-threads") + 1], "2")
+            self.assertEqual(command.count("-threads"), 1)
+            self.assertTrue((Path(self.test_dir) / ".input_video-mask.mov.concat.txt").exists())
+
+            plan_path = Path(self.test_dir) / "build.ninja"
+            self.assertEqual(self.prep.plan("blank", str(self.input_path), format="ninja", plan_path=plan_path), plan_path)
+            self.assertIn("build " + str(Path(self.test_dir) / "input_video-blank.mp4"), plan_path.read_text())
+
+            # Planning records nothing in the index
+            self.prep.mask(str(self.input_path))
+            self.assertEqual(mock_run.call_count, 2)
+            self.assertTrue(output_path.exists())
+
+            with self.assertRaises(ValueError):
+                self.prep.plan("mask", str(self.input_path), sparse="clips")
+            with self.assertRaises(ValueError):
+                self.prep.plan("activity", str(self.input_path))
+            with self.assertRaises(ValueError):
+                self.prep.plan("blank", str(self.input_path), format="cmake")
+
+    def test_composite(self):
+        """Test that composite keys, scales and overlays the render in one encode"""
+        captions_path = Path(self.test_dir) / "input_video-blank-subs.mp4"
+        captions_path.write_text("dummy render content")
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            output_path = self.prep.composite(str(self.input_path), str(captions_path), color="00FF00", y="H-h-40")
+            self.assertEqual(output_path.name, "input_video-composite.mp4")
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(
+                ffmpeg_cmd[ffmpeg_cmd.index("-filter_complex") + 1],
+                "[1:v:0]colorkey=color=0x00FF00:similarity=0.01:blend=0.01,scale=1920:-1[captions];"
+                "[0:v:0][captions]overlay=x=(W-w)/2:y=H-h-40:eof_action=pass:format=auto,format=yuv420p[video]",
+            )
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-map", ffmpeg_cmd.index("[video]")) + 1], "0:a:0")
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-c:a") + 1], "copy")
+            self.assertIn("libx264", ffmpeg_cmd)
+            # No alpha intermediate: one ffmpeg call after the two probes
+            self.assertEqual(mock_run.call_count, 3)
+
+            calls = mock_run.call_count
+            self.prep.composite(str(self.input_path), str(captions_path), color="00FF00", y="H-h-40")
+            self.assertEqual(mock_run.call_count, calls)
+            self.prep.composite(str(self.input_path), str(captions_path), scale=0.5, codec="hevc")
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertIn("scale=iw*0.5:-1", ffmpeg_cmd[ffmpeg_cmd.index("-filter_complex") + 1])
+            self.assertIn("libx265", ffmpeg_cmd)
+
+            with self.assertRaises(ValueError):
+                self.prep.composite(str(self.input_path), str(captions_path), codec="prores")
+
+    def test_preview(self):
+        """Test that preview keys a short window at full size, then scales it over a checkerboard"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            output_path = self.prep.preview(str(self.input_path), tolerance=0.05, start=5, duration=4)
+            self.assertEqual(output_path.name, "input_video-preview.mp4")
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-ss") + 1], "5")
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-t") + 1], "4")
+            self.assertLess(ffmpeg_cmd.index("-t"), ffmpeg_cmd.index("-i"))
+            graph = ffmpeg_cmd[ffmpeg_cmd.index("-filter_complex") + 1]
+            self.assertTrue(graph.startswith(
+                "[0:v:0]colorkey=color=0x000000:similarity=0.05:blend=0.05,scale=640:360[captions];"
+                "color=c=black:s=40x23:r=30,"
+            ))
+            self.assertIn("crop=640:360:0:0[backdrop]", graph)
+            self.assertIn("-an", ffmpeg_cmd)
+            self.assertIn("ultrafast", ffmpeg_cmd)
+
+            self.prep.preview(str(self.input_path), step=5, background=str(self.input_path))
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            graph = ffmpeg_cmd[ffmpeg_cmd.index("-filter_complex") + 1]
+            self.assertIn("[0:v:0]framestep=5,colorkey=", graph)
+            self.assertIn("[1:v:0]framestep=5,scale=640:-2[backdrop]", graph)
+            # The footage is cut to the same window
+            self.assertEqual(ffmpeg_cmd.count("-ss"), 2)
+
+        image_path = Path(self.test_dir) / "frame.png"
+        image_path.write_text("dummy image content")
+        video = self.prep._probe(self.input_path)
+        with patch('subprocess.run') as mock_run, patch.object(
+            self.prep, "_probe", side_effect=[video, MediaInfo(duration=0, width=1920, height=1080, frames=1)]
+        ):
+            mock_run.side_effect = fake_run
+            self.prep.preview(str(self.input_path), background=str(image_path))
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-loop") + 1], "1")
+            self.assertEqual(ffmpeg_cmd.count("-ss"), 1)
+
+        with self.assertRaises(ValueError):
+            self.prep.preview(str(self.input_path), step=0)
+
+    def test_prep_paths_streams(self):
+        """Test that stdin, stdout and URLs are kept as ffmpeg URLs where allowed"""
+        url = "http://127.0.0.1:8000/media/talk.mp4"
+        self.assertEqual(
+            self.prep._prep_paths(url, suffix="-blank.mp4", allow_streams=True),
+            (url, Path.cwd() / "talk-blank.mp4"),
+        )
+        self.assertEqual(
+            self.prep._prep_paths("-", "-", allow_streams=True), ("pipe:0", "pipe:1")
+        )
+        self.assertEqual(
+            self.prep._prep_paths(self.input_path.as_uri())[0], self.input_path
+        )
+        with self.assertRaises(ValueError):
+            self.prep._prep_paths(url)
+
+    def test_mask_stream(self):
+        """Test that mask keys stdin to stdout in one pass with a streamable muxer"""
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.assertIsNone(self.prep.mask("-", output_path="-"))
+            # Stdin is not probed, so the input timestamps are kept
+            self.assertEqual(mock_run.call_count, 1)
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-i") + 1], "pipe:0")
+            self.assertNotIn("-r", ffmpeg_cmd)
+            self.assertEqual(ffmpeg_cmd[-5:-1], ["-f", "mov", "-movflags", "+frag_keyframe+empty_moov+default_base_moof"])
+            self.assertEqual(ffmpeg_cmd[-1], "pipe:1")
+
+            self.prep.mask(str(self.input_path), output_path="-", codec="ffv1", fps=10)
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(ffmpeg_cmd[-3:], ["-f", "matroska", "pipe:1"])
+            self.assertIn("fps=fps=10:round=up", ffmpeg_cmd[ffmpeg_cmd.index("-vf") + 1])
+
+            for options in [dict(sparse="filler"), dict(crop=True), dict(segments=2), dict(engine="numpy")]:
+                with self.assertRaises(ValueError):
+                    self.prep.mask("-", **options)
+            with self.assertRaises(ValueError):
+                self.prep.mask(str(self.input_path), output_path="-", container="avi")
+
+    def test_blank_stream(self):
+        """Test that blank reads a URL probed from its header and stdin of unknown length"""
+        url = "http://127.0.0.1:8000/talk.mp4"
+        with patch('subprocess.run') as mock_run:
+            mock_run.side_effect = fake_run
+            self.prep.blank(url, output_path=Path(self.test_dir) / "talk-blank.mp4")
+            probe_cmd, ffmpeg_cmd, check_cmd = [c[0][0] for c in mock_run.call_args_list]
+            self.assertEqual(probe_cmd[-1], url)
+            self.assertNotIn("-show_entries", probe_cmd)
+            # The audio of the output shows whether the stream broke off
+            self.assertEqual(check_cmd[-1], ffmpeg_cmd[-1])
+            self.assertIn("color=c=000000:s=2160x720:r=30/1:d=30.0", ffmpeg_cmd)
+            self.assertIn("-xerror", ffmpeg_cmd)
+
+            # A stream that ends before any media leaves no output behind
+            output_path = Path(self.test_dir) / "empty-blank.mp4"
+            with patch(
+                "vid2captionsai.runner.run_ffmpeg",
+                side_effect=lambda *args: dict(run_ffmpeg_via_run(*args), media_seconds=0),
+            ):
+                with self.assertRaises(RuntimeError):
+                    self.prep.blank(url, output_path=output_path)
+            self.assertEqual(list(Path(self.test_dir).glob("empty-blank*")), [])
+
+            mock_run.reset_mock()
+            self.assertIsNone(self.prep.blank("-", output_path="-", audio="copy"))
+            ffmpeg_cmd = mock_run.call_args[0][0]
+            self.assertEqual(mock_run.call_count, 1)
+            self.assertIn("color=c=000000:s=2160x720:r=30", ffmpeg_cmd)
+            self.assertEqual(ffmpeg_cmd[ffmpeg_cmd.index("-c:a") + 1], "aac")
+            self.assertEqual(ffmpeg_cmd[-5:-3], ["-f", "mp4"])
+
+
+class TestMediaInfo(unittest.TestCase):
+    """Test ffprobe output parsing"""
+
+    def test_from_ffprobe(self):
+        info = MediaInfo.from_ffprobe(json.loads(FFPROBE_JSON))
+        self.assertEqual(info.duration, 30.0)
+        self.assertEqual(info.fps, "30/1")
+        self.assertEqual(info.frame_rate, 30)
+        self.assertEqual((info.width, info.height), (1920, 1080))
+        self.assertEqual(info.audio_codec, "aac")
+        self.assertEqual(info.sample_rate, 48000)
+        self.assertEqual(info.frames, 4)
+        self.assertEqual(info.keyframes, [[0, 0.0], [3, 0.1]])
+
+    def test_round_trip(self):
+        info = MediaInfo.from_ffprobe(json.loads(FFPROBE_JSON))
+        self.assertEqual(MediaInfo.from_dict(info.to_dict()), info)
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as test_dir:
+            index = MetadataIndex(Path(test_dir) / "index.sqlite")
+            media = Path(test_dir) / "media.mp4"
+            media.write_text("dummy")
+            self.assertIsNone(index.get_probe(media))
+            index.put_probe(media, {"duration": 1.0})
+            self.assertEqual(index.get_probe(media), {"duration": 1.0})
+
 
 class TestCLI(unittest.TestCase):
     """Test CLI functionality"""
@@ -183,5 +903,59 @@ class TestCLI(unittest.TestCase):
         self.assertIn('vid2captionsai', entry_points['console_scripts'])
 
 
+class TestRealFFmpeg(unittest.TestCase):
+    """Checks the timeline of real outputs on a 4 s, 120-frame source"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.test_dir, ignore_errors=True)
+        self.prep = PrepAudioVideo(cache_dir=self.test_dir / "cache")
+        self.input_path = self.test_dir / "talk.mp4"
+        subprocess.run(
+            self.prep._ffmpeg_run
+            + ["-f", "lavfi", "-i", "testsrc2=s=320x180:r=30:d=4"]
+            + ["-f", "lavfi", "-i", "sine=d=4"]
+            + ["-c:v", "libx264", "-c:a", "aac", self.input_path],
+            check=True,
+        )
+
+    def test_blank_audio_copy(self):
+        """Test that a blank with copied audio keeps every frame of the source"""
+        for profile in ["default", "static"]:
+            output_path = self.prep.blank(
+                self.input_path,
+                audio="copy",
+                profile=profile,
+                width=320,
+                height=180,
+                output_path=self.test_dir / f"{profile}.mp4",
+            )
+            info = probe(self.prep._ffprobe_run, output_path)
+            self.assertEqual(info.frames, 120, profile)
+            self.assertAlmostEqual(info.duration, 4.0, delta=0.05)
+
+    def test_mask_dedup(self):
+        """Test that a deduplicated mask keeps the source length and a sane timescale"""
+        held_path = self.test_dir / "held.mp4"
+        subprocess.run(
+            self.prep._ffmpeg_run
+            + ["-f", "lavfi", "-i", "testsrc2=s=320x180:r=2:d=4,fps=30"]
+            + ["-c:v", "libx264", held_path],
+            check=True,
+        )
+        output_path = self.prep.mask(held_path, dedup=True)
+        info = probe(self.prep._ffprobe_run, output_path)
+        self.assertLess(info.frames, 20)
+        self.assertAlmostEqual(info.duration, 4.0, delta=0.001)
+        time_base = subprocess.run(
+            self.prep._ffprobe_run
+            + ["-show_entries", "stream=time_base", "-of", "csv=p=0", output_path],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        self.assertNotEqual(time_base, "1/1000000")
+
+
 if __name__ == "__main__":
     unittest.main()